@@ -35,6 +35,7 @@ app.add_middleware(
 GAZE_CAPTURE_URL = os.getenv("GAZE_CAPTURE_URL", "http://127.0.0.1:8001/capture-eye-tracking")
 GAZE_REPORT_URL = os.getenv("GAZE_REPORT_URL", "http://127.0.0.1:8001/generate-eye-tracking-report")
 EMOTION_API_URL = os.getenv("EMOTION_API_URL", "http://127.0.0.1:8000/analyze-live-emotion")
+EMOTION_REPORT_URL = os.getenv("EMOTION_REPORT_URL", "http://127.0.0.1:8000/generate-emotion-report")
 CHAT_API_URL = os.getenv("CHAT_API_URL", "http://127.0.0.1:8002/chat")
 TRANSCRIPT_GET_URL = os.getenv("TRANSCRIPT_GET_URL", "http://127.0.0.1:8002/transcript")
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")
@@ -47,6 +48,7 @@ class SessionRequest(BaseModel):
     is_post_session: bool = Field(False, description="If true, use provided gaze and emotion data")
     gaze_data: Optional[List[Dict[str, Any]]] = Field(None, description="Collected gaze tracking data")
     emotion_data: Optional[List[Dict[str, Any]]] = Field(None, description="Collected emotion recognition data")
+    emotion_session_id: Optional[str] = Field(None, description="Emotion capture session to report on")
 
 class GazeData(BaseModel):
     report: Optional[str] = None
@@ -132,7 +134,7 @@ Please provide a structured report with Summary, Interpretation, and Recommended
                 logger.error(f"[{session_id}] Failed to generate report: {e}")
                 return FinalReport(report=f"Error: {e}", timestamp=datetime.utcnow().isoformat())
 
-async def run_session(messages: List[Dict[str, str]], is_post: bool, gaze_data_input: Optional[List[Dict[str, Any]]], emotion_data_input: Optional[List[Dict[str, Any]]]) -> SessionResult:
+async def run_session(messages: List[Dict[str, str]], is_post: bool, gaze_data_input: Optional[List[Dict[str, Any]]], emotion_data_input: Optional[List[Dict[str, Any]]], emotion_session_id: Optional[str] = None) -> SessionResult:
     session_id = datetime.utcnow().strftime("%Y%m%d%H%M%S")
     logger.info(f"[{session_id}] Starting session (post={is_post})")
     logger.debug(f"[{session_id}] Gaze data: {gaze_data_input}")
@@ -172,6 +174,23 @@ async def run_session(messages: List[Dict[str, str]], is_post: bool, gaze_data_i
             except Exception as e:
                 logger.error(f"[{session_id}] Emotion error: {e}")
                 emotion_data.error = str(e)
+        elif emotion_session_id:
+            try:
+                r = await client.post(EMOTION_REPORT_URL, json={"session_id": emotion_session_id})
+                if r.status_code == 200:
+                    report = r.json()
+                    emotion_data = EmotionData(
+                        summary=report.get("summary"),
+                        stats=report.get("stats"),
+                        interpretation=report.get("interpretation"),
+                        error=report.get("error")
+                    )
+                else:
+                    emotion_data.error = f"Report generation failed: {r.text}"
+                    logger.error(f"[{session_id}] Emotion report error: {r.text}")
+            except Exception as e:
+                logger.error(f"[{session_id}] Emotion report error: {e}")
+                emotion_data.error = str(e)
         elif emotion_data_input:
             try:
                 latest_emotion = emotion_data_input[-1] if emotion_data_input else {}
@@ -221,7 +240,7 @@ async def run_session(messages: List[Dict[str, str]], is_post: bool, gaze_data_i
 async def start_session(req: SessionRequest):
     try:
         logger.info("Received /start-session request with payload: %s", req.dict())
-        result = await run_session(req.messages, req.is_post_session, req.gaze_data, req.emotion_data)
+        result = await run_session(req.messages, req.is_post_session, req.gaze_data, req.emotion_data, req.emotion_session_id)
         return result
     except HTTPException:
         raise
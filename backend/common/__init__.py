@@ -0,0 +1 @@
+"""Modules shared by the gaze tracking and emotion recognition services."""
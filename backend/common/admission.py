@@ -0,0 +1,119 @@
+import asyncio
+from collections import OrderedDict
+from typing import Any, Dict
+
+class AdmissionRejected(Exception):
+    """Raised when the admission queue is full and a frame cannot even wait."""
+
+class FrameAdmission:
+    """
+    Bounded admission stage in front of frame inference.
+
+    At most `max_in_flight` frames are processed at once. Further frames wait in
+    a queue of at most `max_queued` entries, holding one frame per session: a
+    newer frame from the same session replaces the waiting one, which is dropped.
+    A frame that cannot start within `deadline` seconds is dropped as stale, and
+    a frame arriving while the queue is full is rejected outright.
+    """
+
+    def __init__(self, max_in_flight: int, max_queued: int, deadline: float):
+        self.max_in_flight = max_in_flight
+        self.max_queued = max_queued
+        self.deadline = deadline
+        self._active = 0
+        self._waiting: "OrderedDict[str, asyncio.Future]" = OrderedDict()
+        self.admitted = 0
+        self.dropped_superseded = 0
+        self.dropped_stale = 0
+        self.rejected = 0
+
+    async def admit(self, session_id: str) -> bool:
+        """
+        Wait for a processing slot.
+
+        Returns True once the caller holds a slot (it must call `release`), or
+        False if the frame was dropped in favour of a newer one or went stale.
+        Raises AdmissionRejected if the queue is full.
+        """
+        if self._active < self.max_in_flight and not self._waiting:
+            self._active += 1
+            self.admitted += 1
+            return True
+
+        superseded = self._waiting.pop(session_id, None)
+        if superseded is not None:
+            superseded.set_result(False)
+            self.dropped_superseded += 1
+        elif len(self._waiting) >= self.max_queued:
+            self.rejected += 1
+            raise AdmissionRejected(f"Admission queue full ({self.max_queued} frames waiting)")
+
+        slot = asyncio.get_running_loop().create_future()
+        self._waiting[session_id] = slot
+        try:
+            await asyncio.wait({slot}, timeout=self.deadline)
+        except asyncio.CancelledError:
+            self._abandon(session_id, slot)
+            raise
+
+        if slot.done():
+            if slot.result():
+                self.admitted += 1
+            return slot.result()
+        # Still waiting after the deadline: the frame is stale
+        del self._waiting[session_id]
+        slot.cancel()
+        self.dropped_stale += 1
+        return False
+
+    def try_admit(self, slots: int) -> None:
+        """
+        Take `slots` processing slots at once for a multi-frame request, without queueing.
+
+        The caller must `release(slots)`. Raises AdmissionRejected unless that
+        many slots are free and no single frame is waiting for one.
+        """
+        if self._waiting or self._active + slots > self.max_in_flight:
+            self.rejected += slots
+            raise AdmissionRejected(
+                f"{slots} processing slots needed, {self.max_in_flight - self._active} free "
+                f"({len(self._waiting)} frames waiting)"
+            )
+        self._active += slots
+        self.admitted += slots
+
+    def release(self, slots: int = 1):
+        """Give up processing slots, handing each to the oldest waiting frame if any."""
+        for _ in range(slots):
+            self._release_one()
+
+    def _release_one(self):
+        while self._waiting:
+            _, slot = self._waiting.popitem(last=False)
+            if not slot.done():
+                slot.set_result(True)
+                return
+        self._active -= 1
+
+    def _abandon(self, session_id: str, slot: asyncio.Future):
+        """Clean up after a waiting request is cancelled (e.g. client disconnect)."""
+        if slot.done():
+            if slot.result():
+                self.release()
+        else:
+            if self._waiting.get(session_id) is slot:
+                del self._waiting[session_id]
+            slot.cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "in_flight": self._active,
+            "queue_depth": len(self._waiting),
+            "max_in_flight": self.max_in_flight,
+            "max_queued": self.max_queued,
+            "deadline_seconds": self.deadline,
+            "admitted": self.admitted,
+            "dropped_superseded": self.dropped_superseded,
+            "dropped_stale": self.dropped_stale,
+            "rejected": self.rejected,
+        }
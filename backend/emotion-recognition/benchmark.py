@@ -0,0 +1,112 @@
+"""
+Compare emotion model backends on a frame set: latency, batched throughput and
+agreement with the first (reference) model.
+
+    python benchmark.py frames/ \
+        --model pytorch=ultralytics:models/best_v2.pt \
+        --model onnx=onnx:models/best_v2.onnx \
+        --model int8=onnx:models/best_v2.int8.onnx
+
+Frames are a directory of images or a video file. Each model runs every frame
+one at a time (per-request latency) and in micro-batches of the service's batch
+size (throughput). Accuracy is reported against the reference model's
+detections, since the frame set has no labels of its own.
+"""
+import argparse
+import glob
+import os
+import time
+from typing import Any, Dict, List, Tuple
+
+import cv2
+import numpy as np
+import pandas as pd
+
+from emotion_model import MAX_BATCH_SIZE, Detection, EmotionModel, create_model
+
+IMAGE_PATTERNS = ("*.jpg", "*.jpeg", "*.png")
+
+def load_frames(source: str, max_frames: int) -> List[np.ndarray]:
+    """Read up to `max_frames` BGR frames from an image directory or a video file."""
+    if os.path.isdir(source):
+        paths = sorted(path for pattern in IMAGE_PATTERNS for path in glob.glob(os.path.join(source, pattern)))
+        frames = [cv2.imread(path) for path in paths[:max_frames]]
+        return [frame for frame in frames if frame is not None]
+    cap = cv2.VideoCapture(source)
+    frames = []
+    while len(frames) < max_frames:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frames.append(frame)
+    cap.release()
+    return frames
+
+def run_model(model: EmotionModel, frames: List[np.ndarray], batch_size: int) -> Tuple[List[List[Detection]], Dict[str, Any]]:
+    """Detections for every frame (one at a time) plus latency and throughput figures."""
+    model.load()
+    model.warm_up()
+
+    detections, latencies = [], []
+    for frame in frames:
+        start = time.perf_counter()
+        detections.extend(model.predict_batch([frame]))
+        latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    for i in range(0, len(frames), batch_size):
+        model.predict_batch(frames[i:i + batch_size])
+    batched_seconds = time.perf_counter() - start
+
+    latencies_ms = np.array(latencies) * 1000
+    return detections, {
+        "p50_ms": round(float(np.percentile(latencies_ms, 50)), 1),
+        "p95_ms": round(float(np.percentile(latencies_ms, 95)), 1),
+        "single_fps": round(len(frames) / (latencies_ms.sum() / 1000), 1),
+        f"batch{batch_size}_fps": round(len(frames) / batched_seconds, 1),
+    }
+
+def agreement(reference: List[List[Detection]], detections: List[List[Detection]]) -> Dict[str, Any]:
+    """How closely a model's top detection per frame matches the reference model's."""
+    face_match = [bool(a) == bool(b) for a, b in zip(reference, detections)]
+    both = [(a[0], b[0]) for a, b in zip(reference, detections) if a and b]
+    return {
+        "face_agreement_pct": round(100 * float(np.mean(face_match)), 1),
+        "emotion_agreement_pct": round(100 * float(np.mean([a["emotion"] == b["emotion"] for a, b in both])), 1) if both else None,
+        "confidence_mae": round(float(np.mean([abs(a["confidence"] - b["confidence"]) for a, b in both])), 4) if both else None,
+    }
+
+def parse_model_spec(spec: str) -> Tuple[str, str, str]:
+    """Split "label=backend:path" (label defaults to the backend)."""
+    label, _, rest = spec.rpartition("=")
+    backend, _, path = rest.partition(":")
+    return label or backend, backend, path
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark emotion model backends on a frame set.")
+    parser.add_argument("frames", help="Directory of images or a video file")
+    parser.add_argument("--model", action="append", required=True, help="label=backend:path, e.g. onnx=onnx:models/best_v2.onnx; the first is the reference")
+    parser.add_argument("--max-frames", type=int, default=300, help="Frames used at most")
+    parser.add_argument("--batch-size", type=int, default=MAX_BATCH_SIZE, help="Micro-batch size for the throughput run")
+    parser.add_argument("--output", help="Also write the results table to this CSV file")
+    args = parser.parse_args()
+
+    frames = load_frames(args.frames, args.max_frames)
+    if not frames:
+        raise SystemExit(f"No frames found in {args.frames}")
+    print(f"Benchmarking on {len(frames)} frames")
+
+    rows = []
+    reference = None
+    for spec in args.model:
+        label, backend, path = parse_model_spec(spec)
+        detections, timings = run_model(create_model(backend, path or None), frames, args.batch_size)
+        reference = reference if reference is not None else detections
+        rows.append({"model": label, "backend": backend, **timings, **agreement(reference, detections)})
+        print(f"{label}: {timings}")
+
+    table = pd.DataFrame(rows).set_index("model")
+    print(table.to_string())
+    if args.output:
+        table.to_csv(args.output)
+        print(f"Results written to {args.output}")
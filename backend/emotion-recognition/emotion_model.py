@@ -0,0 +1,265 @@
+import ast
+import asyncio
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Tuple
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Inference backend: "ultralytics" (PyTorch) or "onnx" (ONNX Runtime, see export_onnx.py)
+BACKEND = os.getenv("EMOTION_BACKEND", "ultralytics")
+DEFAULT_MODEL_PATHS = {"ultralytics": "models/best_v2.pt", "onnx": "models/best_v2.onnx"}
+# Same model and confidence threshold as the webcam script (emotion_recognition.py)
+MODEL_PATH = os.getenv("EMOTION_MODEL_PATH", DEFAULT_MODEL_PATHS.get(BACKEND, ""))
+CONFIDENCE_THRESHOLD = float(os.getenv("EMOTION_CONFIDENCE", "0.5"))
+IOU_THRESHOLD = 0.7  # ultralytics' default NMS overlap
+IMAGE_SIZE = int(os.getenv("EMOTION_IMAGE_SIZE", "640"))
+# ONNX Runtime intra-op threads per inference; 0 lets it use every core
+ONNX_THREADS = int(os.getenv("EMOTION_ONNX_THREADS", "0"))
+LETTERBOX_COLOR = (114, 114, 114)
+
+# Frames from concurrent requests are collected for up to this long, or until the batch is full
+BATCH_WINDOW_SECONDS = float(os.getenv("EMOTION_BATCH_WINDOW_MS", "10")) / 1000
+MAX_BATCH_SIZE = int(os.getenv("EMOTION_MAX_BATCH_SIZE", "8"))
+
+Detection = Dict[str, Any]  # {"emotion": class name, "confidence": score}
+
+class EmotionModel:
+    """The YOLO emotion detector, loaded once and run on batches of BGR frames."""
+
+    backend = "ultralytics"
+
+    def __init__(self, path: str = MODEL_PATH):
+        self.path = path
+        self.names: Dict[int, str] = {}
+        self._model = None
+
+    @property
+    def loaded(self) -> bool:
+        return self._model is not None
+
+    def load(self):
+        from ultralytics import YOLO
+
+        self._model = YOLO(self.path)
+        self.names = self._model.names
+        logger.info(f"Loaded emotion model {self.path} with classes {list(self.names.values())}")
+
+    def warm_up(self):
+        """Run one full-size batch so the first real frames do not pay for lazy initialization."""
+        blank = np.zeros((IMAGE_SIZE, IMAGE_SIZE, 3), dtype=np.uint8)
+        start = time.perf_counter()
+        self.predict_batch([blank] * MAX_BATCH_SIZE)
+        logger.info(f"Emotion model warmed up in {time.perf_counter() - start:.2f}s")
+
+    def predict_batch(self, images: List[np.ndarray]) -> List[List[Detection]]:
+        """Detect faces and their emotions on every image with a single predict call, most confident first."""
+        results = self._model.predict(source=images, conf=CONFIDENCE_THRESHOLD, imgsz=IMAGE_SIZE, verbose=False)
+        detections = []
+        for result in results:
+            boxes = result.boxes
+            if boxes is None or not len(boxes):
+                detections.append([])
+                continue
+            classes = boxes.cls.int().tolist()
+            scores = boxes.conf.tolist()
+            detections.append(sorted(
+                ({"emotion": self.names[c], "confidence": s} for c, s in zip(classes, scores)),
+                key=lambda d: d["confidence"],
+                reverse=True,
+            ))
+        return detections
+
+class OnnxEmotionModel(EmotionModel):
+    """
+    The emotion detector exported to ONNX (export_onnx.py), run with ONNX Runtime on the CPU.
+
+    Avoids importing PyTorch at all. Frames are letterboxed to the model's full
+    square input size and the raw (batch, 4 + classes, anchors) output is filtered
+    by confidence and per-class NMS. Ultralytics' predict pads non-square frames
+    only to a stride multiple instead, so confidences can differ slightly from the
+    PyTorch backend (see benchmark.py for the agreement on real frames).
+    """
+
+    backend = "onnx"
+
+    def load(self):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.intra_op_num_threads = ONNX_THREADS
+        self._model = ort.InferenceSession(self.path, options, providers=["CPUExecutionProvider"])
+        model_input = self._model.get_inputs()[0]
+        self._input_name = model_input.name
+        # Exports without dynamic axes take one image at a time and a fixed size
+        batch, _, height, width = model_input.shape
+        self._fixed_batch = batch if isinstance(batch, int) else None
+        self._input_size = (
+            height if isinstance(height, int) else IMAGE_SIZE,
+            width if isinstance(width, int) else IMAGE_SIZE,
+        )
+        metadata = self._model.get_modelmeta().custom_metadata_map
+        self.names = ast.literal_eval(metadata["names"]) if "names" in metadata else {}
+        logger.info(
+            f"Loaded ONNX emotion model {self.path} ({ONNX_THREADS or 'all'} threads, "
+            f"input {self._input_size}) with classes {list(self.names.values())}"
+        )
+
+    def predict_batch(self, images: List[np.ndarray]) -> List[List[Detection]]:
+        blobs = np.stack([letterbox(image, self._input_size) for image in images])
+        if self._fixed_batch:
+            outputs = np.concatenate([
+                self._model.run(None, {self._input_name: blobs[i:i + self._fixed_batch]})[0]
+                for i in range(0, len(blobs), self._fixed_batch)
+            ])
+        else:
+            outputs = self._model.run(None, {self._input_name: blobs})[0]
+        return [self._detections(output) for output in outputs]
+
+    def _detections(self, output: np.ndarray) -> List[Detection]:
+        """Decode one image's (4 + classes, anchors) output: confidence filter, then per-class NMS."""
+        predictions = output.T
+        scores = predictions[:, 4:]
+        classes = scores.argmax(axis=1)
+        confidences = scores[np.arange(len(scores)), classes]
+        keep = confidences >= CONFIDENCE_THRESHOLD
+        if not keep.any():
+            return []
+        boxes = predictions[keep, :4].copy()
+        boxes[:, :2] -= boxes[:, 2:] / 2  # Center x, y -> top-left corner
+        classes, confidences = classes[keep], confidences[keep]
+        kept = cv2.dnn.NMSBoxesBatched(
+            boxes.tolist(), confidences.tolist(), classes.tolist(), CONFIDENCE_THRESHOLD, IOU_THRESHOLD
+        )
+        kept = sorted(np.asarray(kept).ravel().tolist(), key=lambda i: confidences[i], reverse=True)
+        return [
+            {"emotion": self.names.get(int(classes[i]), str(classes[i])), "confidence": float(confidences[i])}
+            for i in kept
+        ]
+
+def letterbox(image: np.ndarray, size: Tuple[int, int]) -> np.ndarray:
+    """Resize a BGR frame into `size` (height, width) keeping its aspect ratio, as a normalized RGB CHW array."""
+    height, width = image.shape[:2]
+    scale = min(size[0] / height, size[1] / width)
+    resized_w, resized_h = round(width * scale), round(height * scale)
+    if (resized_w, resized_h) != (width, height):
+        image = cv2.resize(image, (resized_w, resized_h), interpolation=cv2.INTER_LINEAR)
+    top, left = (size[0] - resized_h) // 2, (size[1] - resized_w) // 2
+    padded = cv2.copyMakeBorder(
+        image, top, size[0] - resized_h - top, left, size[1] - resized_w - left,
+        cv2.BORDER_CONSTANT, value=LETTERBOX_COLOR,
+    )
+    return np.ascontiguousarray(padded[:, :, ::-1].transpose(2, 0, 1), dtype=np.float32) / 255.0
+
+def create_model(backend: str = BACKEND, path: str | None = None) -> EmotionModel:
+    """The emotion model for a backend name ("ultralytics" or "onnx")."""
+    if backend == "onnx":
+        return OnnxEmotionModel(path or DEFAULT_MODEL_PATHS["onnx"])
+    if backend == "ultralytics":
+        return EmotionModel(path or DEFAULT_MODEL_PATHS["ultralytics"])
+    raise ValueError(f"Unsupported emotion backend {backend}; use one of {list(DEFAULT_MODEL_PATHS)}")
+
+class MicroBatcher:
+    """
+    Dynamic micro-batching in front of the emotion model.
+
+    Requests enqueue a decoded frame and await a future. A single worker task
+    takes the first waiting frame, collects more for up to BATCH_WINDOW_SECONDS
+    (fewer if MAX_BATCH_SIZE is reached), and runs them through one batched
+    predict on a dedicated inference thread. Frames arriving meanwhile queue up
+    for the next batch, so the window only adds latency when traffic is light.
+    """
+
+    def __init__(self, model: EmotionModel, window: float = BATCH_WINDOW_SECONDS, max_batch: int = MAX_BATCH_SIZE):
+        self.model = model
+        self.window = window
+        self.max_batch = max_batch
+        self._queue: asyncio.Queue[Tuple[np.ndarray, asyncio.Future]] = asyncio.Queue()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="emotion-model")
+        self._worker: asyncio.Task | None = None
+        self.batches = 0
+        self.frames = 0
+        self.inference_seconds = 0.0
+
+    async def start(self):
+        """Load and warm up the model off the event loop, then start batching."""
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self._executor, self.model.load)
+        await loop.run_in_executor(self._executor, self.model.warm_up)
+        self._worker = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+        self._executor.shutdown(wait=True)
+
+    async def predict(self, image: np.ndarray) -> List[Detection]:
+        """Detections for one frame, computed as part of the next batch."""
+        if self._worker is None:
+            raise RuntimeError("Emotion model is not loaded")
+        result = asyncio.get_running_loop().create_future()
+        await self._queue.put((image, result))
+        return await result
+
+    async def _collect(self) -> List[Tuple[np.ndarray, asyncio.Future]]:
+        loop = asyncio.get_running_loop()
+        batch = [await self._queue.get()]
+        deadline = loop.time() + self.window
+        while len(batch) < self.max_batch:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        # Requests abandoned while waiting (client gone) are not worth inferring
+        return [(image, result) for image, result in batch if not result.done()]
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect()
+            if not batch:
+                continue
+            start = time.perf_counter()
+            try:
+                detections = await loop.run_in_executor(
+                    self._executor, self.model.predict_batch, [image for image, _ in batch]
+                )
+            except Exception as e:
+                logger.error(f"Emotion inference failed for a batch of {len(batch)} frames: {str(e)}")
+                for _, result in batch:
+                    if not result.done():
+                        result.set_exception(e)
+                continue
+            self.inference_seconds += time.perf_counter() - start
+            self.batches += 1
+            self.frames += len(batch)
+            for (_, result), frame_detections in zip(batch, detections):
+                if not result.done():
+                    result.set_result(frame_detections)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": self.model.backend,
+            "model": self.model.path,
+            "loaded": self.model.loaded,
+            "queue_depth": self._queue.qsize(),
+            "window_ms": self.window * 1000,
+            "max_batch_size": self.max_batch,
+            "batches": self.batches,
+            "frames": self.frames,
+            "mean_batch_size": self.frames / self.batches if self.batches else 0,
+            "frames_per_inference_second": self.frames / self.inference_seconds if self.inference_seconds else 0,
+        }
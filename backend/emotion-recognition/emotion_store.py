@@ -0,0 +1,311 @@
+import os
+import sys
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+
+# Raw samples kept per session (about an hour at the frontend's one frame per second)
+SESSION_CAPACITY = int(os.getenv("EMOTION_SESSION_CAPACITY", "3600"))
+# Sessions idle this long lose their raw samples; their aggregates are kept for AGGREGATE_TTL_SECONDS
+SESSION_TTL_SECONDS = float(os.getenv("EMOTION_SESSION_TTL_SECONDS", "3600"))
+AGGREGATE_TTL_SECONDS = float(os.getenv("EMOTION_AGGREGATE_TTL_SECONDS", str(24 * 3600)))
+JANITOR_INTERVAL_SECONDS = float(os.getenv("EMOTION_JANITOR_INTERVAL_SECONDS", "60"))
+
+# Session aggregates: confidence histogram bins over [0, 1], smoothing factor of the
+# dominant-emotion estimate per face frame, and how often the smoothed estimate is sampled
+CONFIDENCE_BINS = 10
+EMA_ALPHA = float(os.getenv("EMOTION_EMA_ALPHA", "0.2"))
+TIMELINE_INTERVAL_SECONDS = float(os.getenv("EMOTION_TIMELINE_INTERVAL_SECONDS", "5"))
+# Once the timeline holds this many points, every other one is dropped and the sampling interval doubles
+MAX_TIMELINE_POINTS = int(os.getenv("EMOTION_MAX_TIMELINE_POINTS", "720"))
+
+NO_FACE = -1  # Class ID of frames without a detected face
+INITIAL_RING_SIZE = 64
+
+class EmotionRing:
+    """
+    Fixed-capacity ring buffer of per-frame samples as compact numeric columns.
+
+    Storage starts small and doubles up to `capacity`; once full, each new
+    sample overwrites the oldest.
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.start = 0
+        self.size = 0
+        self._allocate(min(INITIAL_RING_SIZE, capacity))
+
+    def _allocate(self, length: int):
+        old = (self.timestamps, self.class_ids, self.confidences, self.face_counts) if self.size else None
+        self.timestamps = np.zeros(length, dtype=np.float64)  # Unix seconds
+        self.class_ids = np.full(length, NO_FACE, dtype=np.int16)
+        self.confidences = np.zeros(length, dtype=np.float32)
+        self.face_counts = np.zeros(length, dtype=np.uint8)
+        if old:
+            for new, previous in zip((self.timestamps, self.class_ids, self.confidences, self.face_counts), old):
+                new[:self.size] = previous[:self.size]
+
+    def append(self, timestamp: float, class_id: int, confidence: float, face_count: int):
+        if self.size == len(self.timestamps) < self.capacity:
+            # Not wrapped yet, so the samples are in order from index 0
+            self._allocate(min(2 * len(self.timestamps), self.capacity))
+        if self.size < self.capacity:
+            i = self.size
+            self.size += 1
+        else:
+            i = self.start
+            self.start = (self.start + 1) % self.capacity
+        self.timestamps[i] = timestamp
+        self.class_ids[i] = class_id
+        self.confidences[i] = confidence
+        self.face_counts[i] = min(face_count, 255)
+
+    def ordered(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """The buffered samples, oldest first, as (timestamps, class_ids, confidences, face_counts)."""
+        order = (self.start + np.arange(self.size)) % len(self.timestamps)
+        return self.timestamps[order], self.class_ids[order], self.confidences[order], self.face_counts[order]
+
+    @property
+    def nbytes(self) -> int:
+        return self.timestamps.nbytes + self.class_ids.nbytes + self.confidences.nbytes + self.face_counts.nbytes
+
+class EmotionAggregates:
+    """
+    Whole-session emotion statistics, updated on every sample and kept after the raw samples are gone.
+
+    Per-class arrays (counts, confidence sums and histograms, transitions,
+    the smoothed class distribution) are indexed by the store's class IDs
+    and grow when a new class first appears.
+    """
+
+    def __init__(self):
+        self.frames = 0
+        self.face_frames = 0
+        self.face_count_total = 0
+        self.first_at: float | None = None
+        self.last_at: float | None = None
+        self.class_counts = np.zeros(0, dtype=np.int64)
+        self.confidence_sums = np.zeros(0, dtype=np.float64)  # Confidence-weighted class counts
+        self.confidence_hist = np.zeros((0, CONFIDENCE_BINS), dtype=np.int64)
+        self.transitions = np.zeros((0, 0), dtype=np.int64)  # [from, to] over consecutive face frames
+        self.ema = np.zeros(0, dtype=np.float64)  # Exponentially smoothed class distribution
+        self._prev_class = NO_FACE
+        # Smoothed dominant class, sampled every TIMELINE_INTERVAL_SECONDS
+        self.timeline_times = np.zeros(0, dtype=np.float64)
+        self.timeline_classes = np.zeros(0, dtype=np.int16)
+        self.timeline_size = 0
+        self.timeline_interval = TIMELINE_INTERVAL_SECONDS
+
+    def _grow(self, classes: int):
+        extra = classes - len(self.class_counts)
+        self.class_counts = np.pad(self.class_counts, (0, extra))
+        self.confidence_sums = np.pad(self.confidence_sums, (0, extra))
+        self.confidence_hist = np.pad(self.confidence_hist, ((0, extra), (0, 0)))
+        self.transitions = np.pad(self.transitions, ((0, extra), (0, extra)))
+        self.ema = np.pad(self.ema, (0, extra))
+
+    def update(self, timestamp: float, class_id: int, confidence: float, face_count: int):
+        self.frames += 1
+        self.face_count_total += face_count
+        self.first_at = timestamp if self.first_at is None else self.first_at
+        self.last_at = timestamp
+        if class_id != NO_FACE:
+            if class_id >= len(self.class_counts):
+                self._grow(class_id + 1)
+            self.face_frames += 1
+            self.class_counts[class_id] += 1
+            self.confidence_sums[class_id] += confidence
+            self.confidence_hist[class_id, min(int(confidence * CONFIDENCE_BINS), CONFIDENCE_BINS - 1)] += 1
+            if self._prev_class != NO_FACE:
+                self.transitions[self._prev_class, class_id] += 1
+            self._prev_class = class_id
+            self.ema *= 1 - EMA_ALPHA
+            self.ema[class_id] += EMA_ALPHA
+        if not self.timeline_size or timestamp - self.timeline_times[self.timeline_size - 1] >= self.timeline_interval:
+            self._add_timeline_point(timestamp)
+
+    def _add_timeline_point(self, timestamp: float):
+        if self.timeline_size >= MAX_TIMELINE_POINTS:
+            # Halve the resolution of the whole timeline so it stays bounded for long sessions
+            kept = slice(0, self.timeline_size, 2)
+            self.timeline_times[:(self.timeline_size + 1) // 2] = self.timeline_times[kept].copy()
+            self.timeline_classes[:(self.timeline_size + 1) // 2] = self.timeline_classes[kept].copy()
+            self.timeline_size = (self.timeline_size + 1) // 2
+            self.timeline_interval *= 2
+        if self.timeline_size == len(self.timeline_times):
+            length = min(max(16, 2 * self.timeline_size), MAX_TIMELINE_POINTS)
+            self.timeline_times = np.resize(self.timeline_times, length)
+            self.timeline_classes = np.resize(self.timeline_classes, length)
+        self.timeline_times[self.timeline_size] = timestamp
+        self.timeline_classes[self.timeline_size] = int(self.ema.argmax()) if self.ema.any() else NO_FACE
+        self.timeline_size += 1
+
+    def snapshot(self, classes: List[str]) -> Dict[str, Any]:
+        """The aggregates as plain JSON-ready values, with class IDs resolved to `classes` names."""
+        names = classes[:len(self.class_counts)]
+        face_frames = max(self.face_frames, 1)
+        weight_total = self.confidence_sums.sum() or 1.0
+        switches = int(self.transitions.sum() - np.trace(self.transitions))
+        sources, targets = np.nonzero(self.transitions)
+
+        # Consecutive timeline points with the same smoothed emotion form one segment
+        times = self.timeline_times[:self.timeline_size]
+        timeline_classes = self.timeline_classes[:self.timeline_size]
+        starts = np.flatnonzero(np.diff(timeline_classes, prepend=-2))
+        return {
+            "frames": self.frames,
+            "face_frames": self.face_frames,
+            "avg_face_count": self.face_count_total / self.frames if self.frames else 0.0,
+            "duration_seconds": (self.last_at - self.first_at) if self.frames else 0.0,
+            "dominant_emotion": names[int(self.class_counts.argmax())] if self.face_frames else None,
+            "smoothed_emotion": names[int(self.ema.argmax())] if self.ema.any() else None,
+            "emotions": {
+                name: {
+                    "frames": int(self.class_counts[i]),
+                    "share": float(self.class_counts[i] / face_frames),
+                    "weighted_share": float(self.confidence_sums[i] / weight_total),
+                    "mean_confidence": float(self.confidence_sums[i] / self.class_counts[i]) if self.class_counts[i] else None,
+                    "confidence_histogram": self.confidence_hist[i].tolist(),
+                }
+                for i, name in enumerate(names) if self.class_counts[i]
+            },
+            "switches": switches,
+            "switch_rate": switches / max(int(self.transitions.sum()), 1),
+            "transitions": [
+                {"from": names[a], "to": names[b], "count": int(self.transitions[a, b])}
+                for a, b in zip(sources.tolist(), targets.tolist()) if a != b
+            ],
+            "timeline": [
+                {
+                    "start": datetime.utcfromtimestamp(times[i]).isoformat(),
+                    "emotion": names[timeline_classes[i]] if timeline_classes[i] != NO_FACE else None,
+                }
+                for i in starts.tolist()
+            ],
+        }
+
+    @property
+    def nbytes(self) -> int:
+        arrays = (
+            self.class_counts, self.confidence_sums, self.confidence_hist, self.transitions,
+            self.ema, self.timeline_times, self.timeline_classes,
+        )
+        return sys.getsizeof(self) + sum(array.nbytes for array in arrays)
+
+class SessionEmotions:
+    def __init__(self, capacity: int):
+        self.ring: EmotionRing | None = EmotionRing(capacity)
+        self.aggregates = EmotionAggregates()
+        self.last_write_at = time.time()
+
+class EmotionStore:
+    """
+    Per-session emotion samples held in memory with bounded size.
+
+    Each session keeps its latest `capacity` frames in a ring buffer of
+    numeric columns (timestamp, class ID, confidence, face count), with class
+    names interned once for the whole store, plus running aggregates over
+    every frame it has seen. `evict_idle` drops the raw samples of sessions
+    idle for `ttl` seconds and forgets sessions entirely after `aggregate_ttl`.
+    """
+
+    def __init__(self, capacity: int = SESSION_CAPACITY, ttl: float = SESSION_TTL_SECONDS, aggregate_ttl: float = AGGREGATE_TTL_SECONDS):
+        self.capacity = capacity
+        self.ttl = ttl
+        self.aggregate_ttl = aggregate_ttl
+        self.classes: List[str] = []
+        self._class_ids: Dict[str, int] = {}
+        self._sessions: Dict[str, SessionEmotions] = {}
+
+    def __contains__(self, session_id: str) -> bool:
+        return session_id in self._sessions
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def class_id(self, emotion: str | None) -> int:
+        if emotion is None:
+            return NO_FACE
+        class_id = self._class_ids.get(emotion)
+        if class_id is None:
+            class_id = self._class_ids[emotion] = len(self.classes)
+            self.classes.append(emotion)
+        return class_id
+
+    def append(self, session_id: str, timestamp: float, emotion: str | None, confidence: float | None, face_count: int):
+        """Record one analyzed frame (`emotion` is None when no face was found)."""
+        session = self._sessions.get(session_id)
+        if session is None:
+            session = self._sessions[session_id] = SessionEmotions(self.capacity)
+        elif session.ring is None:
+            # Back after its raw samples were evicted: start a new buffer, keep the aggregates
+            session.ring = EmotionRing(self.capacity)
+        class_id = self.class_id(emotion)
+        confidence = confidence or 0.0
+        session.ring.append(timestamp, class_id, confidence, face_count)
+        session.aggregates.update(timestamp, class_id, confidence, face_count)
+        session.last_write_at = time.time()
+
+    def aggregates(self, session_id: str) -> EmotionAggregates | None:
+        session = self._sessions.get(session_id)
+        return session.aggregates if session else None
+
+    def snapshot(self, session_id: str) -> Dict[str, Any] | None:
+        """A session's aggregates as plain values (see `EmotionAggregates.snapshot`), or None if unknown."""
+        aggregates = self.aggregates(session_id)
+        return aggregates.snapshot(self.classes) if aggregates else None
+
+    def samples(self, session_id: str, limit: int | None = None) -> List[Dict[str, Any]]:
+        """The session's buffered frames (the latest `limit` if given), oldest first, as dicts."""
+        session = self._sessions.get(session_id)
+        if session is None or session.ring is None:
+            return []
+        timestamps, class_ids, confidences, face_counts = (
+            column[-limit:] if limit else column for column in session.ring.ordered()
+        )
+        return [
+            {
+                "timestamp": datetime.utcfromtimestamp(timestamp).isoformat(),
+                "emotion": self.classes[class_id] if class_id != NO_FACE else None,
+                "confidence": round(confidence, 4) if class_id != NO_FACE else None,
+                "face_count": face_count,
+            }
+            for timestamp, class_id, confidence, face_count in zip(
+                timestamps.tolist(), class_ids.tolist(), confidences.tolist(), face_counts.tolist()
+            )
+        ]
+
+    def evict_idle(self, now: float | None = None) -> Tuple[int, int]:
+        """Drop raw samples of idle sessions and forget long-idle ones; returns (buffers freed, sessions dropped)."""
+        now = time.time() if now is None else now
+        freed = dropped = 0
+        for session_id, session in list(self._sessions.items()):
+            idle = now - session.last_write_at
+            if self.aggregate_ttl > 0 and idle >= self.aggregate_ttl:
+                del self._sessions[session_id]
+                dropped += 1
+            elif self.ttl > 0 and idle >= self.ttl and session.ring is not None:
+                session.ring = None
+                freed += 1
+        return freed, dropped
+
+    def memory_bytes(self) -> int:
+        """Approximate footprint of the stored samples and aggregates."""
+        return sum(
+            (session.ring.nbytes if session.ring else 0) + session.aggregates.nbytes
+            for session in self._sessions.values()
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        rings = [session.ring for session in self._sessions.values() if session.ring is not None]
+        return {
+            "sessions": len(self._sessions),
+            "buffered_sessions": len(rings),
+            "buffered_frames": sum(ring.size for ring in rings),
+            "capacity_per_session": self.capacity,
+            "memory_bytes": self.memory_bytes(),
+            "classes": self.classes,
+        }
@@ -0,0 +1,95 @@
+"""
+Export the YOLO emotion model to ONNX for the ONNX Runtime backend (EMOTION_BACKEND=onnx).
+
+    python export_onnx.py models/best_v2.pt
+    python export_onnx.py models/best-combo.pt --int8 --calibration calibration_frames/
+
+The export has a dynamic batch axis so the service can run micro-batches in
+one call. With --int8 a quantized copy (<name>.int8.onnx) is written too:
+statically quantized on the calibration frames if given (the faster option on
+CPU), otherwise with dynamic weight-only quantization.
+"""
+import argparse
+import glob
+import os
+from typing import Dict, Iterator, List
+
+import cv2
+import numpy as np
+import onnx
+import onnxruntime as ort
+from onnxruntime.quantization import CalibrationDataReader, QuantFormat, QuantType, quantize_dynamic, quantize_static
+from onnxruntime.quantization.shape_inference import quant_pre_process
+
+from emotion_model import IMAGE_SIZE, letterbox
+
+CALIBRATION_PATTERNS = ("*.jpg", "*.jpeg", "*.png")
+
+def export_onnx(weights: str, imgsz: int = IMAGE_SIZE, dynamic: bool = True) -> str:
+    """Export a YOLO .pt checkpoint to ONNX next to it; returns the .onnx path."""
+    from ultralytics import YOLO
+
+    return YOLO(weights).export(format="onnx", imgsz=imgsz, dynamic=dynamic, simplify=True)
+
+class FrameCalibrationReader(CalibrationDataReader):
+    """Feeds calibration frames to the static quantizer, preprocessed exactly as at inference."""
+
+    def __init__(self, paths: List[str], input_name: str, imgsz: int):
+        self._frames: Iterator[Dict[str, np.ndarray]] = (
+            {input_name: letterbox(image, (imgsz, imgsz))[None]}
+            for image in (cv2.imread(path) for path in paths) if image is not None
+        )
+
+    def get_next(self) -> Dict[str, np.ndarray] | None:
+        return next(self._frames, None)
+
+def quantize_int8(onnx_path: str, calibration_dir: str | None, imgsz: int = IMAGE_SIZE, max_frames: int = 200) -> str:
+    """Write an INT8 copy of an exported model; returns its path."""
+    root, _ = os.path.splitext(onnx_path)
+    prepared_path, int8_path = f"{root}.prep.onnx", f"{root}.int8.onnx"
+    quant_pre_process(onnx_path, prepared_path)
+    try:
+        if calibration_dir:
+            paths = sorted(path for pattern in CALIBRATION_PATTERNS for path in glob.glob(os.path.join(calibration_dir, pattern)))
+            if not paths:
+                raise ValueError(f"No calibration images ({', '.join(CALIBRATION_PATTERNS)}) in {calibration_dir}")
+            input_name = ort.InferenceSession(onnx_path, providers=["CPUExecutionProvider"]).get_inputs()[0].name
+            reader = FrameCalibrationReader(paths[:max_frames], input_name, imgsz)
+            quantize_static(
+                prepared_path, int8_path, reader,
+                quant_format=QuantFormat.QDQ,
+                activation_type=QuantType.QUInt8,
+                weight_type=QuantType.QInt8,
+                per_channel=True,
+            )
+            print(f"Statically quantized on {min(len(paths), max_frames)} calibration frames")
+        else:
+            quantize_dynamic(prepared_path, int8_path, weight_type=QuantType.QInt8)
+            print("Dynamically quantized (weights only); pass --calibration for static quantization")
+    finally:
+        if os.path.exists(prepared_path):
+            os.remove(prepared_path)
+
+    # Keep the class names and input size the service reads from the model metadata
+    source, quantized = onnx.load(onnx_path), onnx.load(int8_path)
+    existing = {prop.key for prop in quantized.metadata_props}
+    for prop in source.metadata_props:
+        if prop.key not in existing:
+            quantized.metadata_props.append(prop)
+    onnx.save(quantized, int8_path)
+    return int8_path
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export the YOLO emotion model to ONNX, optionally with an INT8 copy.")
+    parser.add_argument("weights", nargs="?", default="models/best_v2.pt", help="YOLO checkpoint (.pt)")
+    parser.add_argument("--imgsz", type=int, default=IMAGE_SIZE, help="Input size the model is exported for")
+    parser.add_argument("--static-batch", dest="dynamic", action="store_false", help="Export with a fixed batch of 1")
+    parser.add_argument("--int8", action="store_true", help="Also write an INT8-quantized model")
+    parser.add_argument("--calibration", help="Directory of representative frames for static INT8 quantization")
+    parser.add_argument("--calibration-frames", type=int, default=200, help="Calibration frames used at most")
+    args = parser.parse_args()
+
+    onnx_path = export_onnx(args.weights, args.imgsz, args.dynamic)
+    print(f"Exported {onnx_path}")
+    if args.int8:
+        print(f"Wrote {quantize_int8(onnx_path, args.calibration, args.imgsz, args.calibration_frames)}")
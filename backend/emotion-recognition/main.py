@@ -1,12 +1,22 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, Header, HTTPException, Request
 from pydantic import BaseModel
 import base64
 import cv2
 import numpy as np
-from typing import Any, Dict, List
 from datetime import datetime
 import logging
 from fastapi.middleware.cors import CORSMiddleware
+import os
+import asyncio
+import time
+import sys
+from typing import Any, Dict, Tuple
+from emotion_model import MODEL_PATH, BACKEND, MicroBatcher, create_model
+from emotion_store import JANITOR_INTERVAL_SECONDS, EmotionStore
+
+# Modules shared between the services live in backend/common
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.admission import AdmissionRejected, FrameAdmission
 
 app = FastAPI(title="Emotion Recognition API")
 
@@ -23,8 +33,36 @@ app.add_middleware(
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# In-memory storage for emotion data
-emotion_data_storage: Dict[str, List[Dict[str, Any]]] = {}
+# Admission control for incoming frames: bounded queue, newest frame per session wins
+frame_admission = FrameAdmission(
+    max_in_flight=int(os.getenv("EMOTION_MAX_IN_FLIGHT", "8")),
+    max_queued=int(os.getenv("EMOTION_MAX_QUEUED_FRAMES", "32")),
+    deadline=float(os.getenv("EMOTION_FRAME_DEADLINE_SECONDS", "1.0")),
+)
+
+# YOLO emotion model (EMOTION_BACKEND), loaded at startup; concurrent frames are micro-batched into one predict call
+emotion_batcher = MicroBatcher(create_model(BACKEND, MODEL_PATH))
+
+# Short reading of each emotion class for the response
+EMOTION_INTERPRETATIONS = {
+    "angry": "The user's expression suggests frustration or irritation.",
+    "anger": "The user's expression suggests frustration or irritation.",
+    "contempt": "The user's expression suggests disapproval or disengagement.",
+    "disgust": "The user's expression suggests aversion to the current content.",
+    "fear": "The user's expression suggests anxiety or apprehension.",
+    "happy": "The user appears content and positively engaged.",
+    "neutral": "The user appears calm based on facial features.",
+    "sad": "The user's expression suggests low mood or discouragement.",
+    "surprise": "The user's expression suggests surprise or heightened attention.",
+}
+
+# Per-session emotion samples: bounded ring buffers plus running aggregates, evicted when idle
+emotion_store = EmotionStore()
+
+# Last emotion report per session with the frame watermark it covers; rebuilt only once new frames arrive
+Watermark = Tuple[float | None, int]  # (first frame time, frames appended)
+emotion_reports: Dict[str, Tuple[Watermark, Dict[str, str]]] = {}
+_emotion_report_builds: Dict[Tuple[str, Watermark], asyncio.Task] = {}
 
 class FrameRequest(BaseModel):
     frame: str  # Base64-encoded JPEG image
@@ -36,51 +74,70 @@ class EmotionResponse(BaseModel):
     summary: str
     stats: str
     interpretation: str
+    emotion: str | None = None  # Most confident detection, if a face was found
+    confidence: float | None = None
+    face_count: int = 0
     error: str | None = None
+    dropped: bool = False  # True if the frame was shed under load and not analyzed
 
-@app.post("/analyze-live-emotion", response_model=EmotionResponse)
-async def analyze_live_emotion(request: FrameRequest):
-    """
-    Analyze a video frame for emotion recognition.
-    Expects a base64-encoded JPEG image and session ID.
-    Returns emotion analysis results or an error.
-    """
+def decode_frame(frame: str) -> np.ndarray:
+    """Decode a base64 data-URL JPEG into a BGR image."""
+    frame_data = base64.b64decode(frame.split(",")[1])  # Remove "data:image/jpeg;base64,"
+    return decode_jpeg(frame_data)
+
+def decode_jpeg(frame_data: bytes) -> np.ndarray:
+    """Decode raw JPEG bytes into a BGR image without copying the buffer."""
+    nparr = np.frombuffer(frame_data, np.uint8)
+    img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+
+    if img is None:
+        raise ValueError("Failed to decode image")
+    return img
+
+async def process_frame(session_id: str, img_source: str | bytes) -> EmotionResponse:
+    """Analyze one frame (data URL or raw JPEG bytes) and store the result."""
     try:
-        # Decode base64 frame
-        frame_data = base64.b64decode(request.frame.split(",")[1])  # Remove "data:image/jpeg;base64,"
-        nparr = np.frombuffer(frame_data, np.uint8)
-        img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+        img = decode_jpeg(img_source) if isinstance(img_source, bytes) else decode_frame(img_source)
 
-        if img is None:
-            raise ValueError("Failed to decode image")
+        detections = await emotion_batcher.predict(img)
+        captured_at = time.time()
 
-        # Placeholder for emotion recognition logic
-        # Replace with actual model inference (e.g., DeepFace, custom model)
-        summary = "Neutral emotion detected"
-        stats = "Confidence: 0.8"
-        interpretation = "The user appears calm based on facial features."
+        # Report the most confident face
+        if detections:
+            emotion, confidence = detections[0]["emotion"], detections[0]["confidence"]
+            summary = f"Detected {len(detections)} face(s): {emotion}"
+            stats = f"Confidence: {confidence:.2f}"
+            interpretation = EMOTION_INTERPRETATIONS.get(
+                emotion.lower(), f"The user's expression was classified as {emotion}."
+            )
+        else:
+            emotion = confidence = None
+            summary = "Detected 0 face(s)"
+            stats = "No face detected"
+            interpretation = "No face was visible, possibly due to lighting or camera positioning."
 
         # Store results
         result = {
-            "session_id": request.session_id,
-            "timestamp": datetime.utcnow().isoformat(),
+            "session_id": session_id,
+            "timestamp": datetime.utcfromtimestamp(captured_at).isoformat(),
             "summary": summary,
             "stats": stats,
             "interpretation": interpretation,
+            "emotion": emotion,
+            "confidence": confidence,
+            "face_count": len(detections),
         }
 
-        if request.session_id not in emotion_data_storage:
-            emotion_data_storage[request.session_id] = []
-        emotion_data_storage[request.session_id].append(result)
+        emotion_store.append(session_id, captured_at, emotion, confidence, len(detections))
 
-        logger.info(f"Emotion analysis completed for session {request.session_id}")
+        logger.info(f"Emotion analysis completed for session {session_id}")
 
         return EmotionResponse(**result)
 
     except Exception as e:
         logger.error(f"Error processing frame: {str(e)}")
         return EmotionResponse(
-            session_id=request.session_id,
+            session_id=session_id,
             timestamp=datetime.utcnow().isoformat(),
             summary="",
             stats="",
@@ -88,6 +145,200 @@ async def analyze_live_emotion(request: FrameRequest):
             error=str(e)
         )
 
+async def process_admitted_frame(session_id: str, img_source: str | bytes) -> EmotionResponse:
+    """Run `process_frame` behind the admission queue, shedding stale frames under load."""
+    try:
+        admitted = await frame_admission.admit(session_id)
+    except AdmissionRejected as e:
+        logger.warning(f"Rejected frame for session {session_id}: {str(e)}")
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "1"})
+    if not admitted:
+        logger.info(f"Dropped stale frame for session {session_id}")
+        return EmotionResponse(
+            session_id=session_id,
+            timestamp=datetime.utcnow().isoformat(),
+            summary="",
+            stats="",
+            interpretation="",
+            error="Frame dropped: superseded by a newer frame or not processed before its deadline",
+            dropped=True
+        )
+    try:
+        return await process_frame(session_id, img_source)
+    finally:
+        frame_admission.release()
+
+@app.post("/analyze-live-emotion", response_model=EmotionResponse)
+async def analyze_live_emotion(request: FrameRequest):
+    """
+    Analyze a video frame for emotion recognition.
+    Expects a base64-encoded JPEG image and session ID.
+    Returns emotion analysis results or an error.
+    """
+    return await process_admitted_frame(request.session_id, request.frame)
+
+@app.post("/analyze-live-emotion-raw", response_model=EmotionResponse)
+async def analyze_live_emotion_raw(request: Request, x_session_id: str = Header(...)):
+    """
+    Binary variant of /analyze-live-emotion.
+    Expects the JPEG bytes as the request body (application/octet-stream or image/jpeg)
+    and the session ID in the X-Session-ID header.
+    """
+    frame_data = await request.body()
+    return await process_admitted_frame(x_session_id, frame_data)
+
+class EmotionReportRequest(BaseModel):
+    session_id: str
+
+class EmotionReportResponse(BaseModel):
+    session_id: str
+    frames: int
+    summary: str
+    stats: str
+    interpretation: str
+    cached: bool = False  # True if no frames arrived since the report was built
+    error: str | None = None
+
+async def _build_emotion_report(session_id: str, snapshot: Dict[str, Any], watermark: Watermark) -> Dict[str, str]:
+    # report.py creates its RAG and Groq clients on import, so it is only loaded once a report is asked for
+    from report import INTERPRETATION_ERROR, build_report
+
+    report = await build_report(snapshot)
+    current = emotion_reports.get(session_id)
+    # A failed interpretation is not cached; a build overtaken by a newer one does not replace it
+    if report["interpretation"] != INTERPRETATION_ERROR and (current is None or current[0][1] <= watermark[1]):
+        emotion_reports[session_id] = (watermark, report)
+    return report
+
+async def get_emotion_report(session_id: str) -> Tuple[Dict[str, str], int, bool] | None:
+    """The session's report (sections, frames covered, whether cached), or None for an unknown session."""
+    aggregates = emotion_store.aggregates(session_id)
+    if aggregates is None:
+        return None
+    watermark = (aggregates.first_at, aggregates.frames)
+    cached = emotion_reports.get(session_id)
+    if cached is not None and cached[0] == watermark:
+        return cached[1], watermark[1], True
+
+    # Concurrent requests at the same watermark share one build
+    key = (session_id, watermark)
+    build = _emotion_report_builds.get(key)
+    if build is None:
+        build = asyncio.ensure_future(
+            _build_emotion_report(session_id, emotion_store.snapshot(session_id), watermark)
+        )
+        _emotion_report_builds[key] = build
+        build.add_done_callback(lambda _: _emotion_report_builds.pop(key, None))
+    # Shielded so a client disconnecting does not cancel the build for the others
+    return await asyncio.shield(build), watermark[1], False
+
+@app.get("/debug/admission")
+async def admission_stats():
+    """Debug endpoint exposing frame queue depth and drop counters."""
+    return frame_admission.stats()
+
+@app.get("/debug/inference")
+async def inference_stats():
+    """Debug endpoint exposing micro-batching counters (batches, mean batch size, throughput)."""
+    return emotion_batcher.stats()
+
+@app.get("/emotion-aggregates/{session_id}")
+async def emotion_aggregates(session_id: str):
+    """
+    A session's emotion aggregates, maintained as frames are analyzed: per-emotion counts and
+    confidence histograms, transitions between emotions, and the smoothed dominant-emotion timeline.
+    """
+    snapshot = emotion_store.snapshot(session_id)
+    if snapshot is None:
+        error_msg = f"No emotion data available for session {session_id}"
+        logger.warning(error_msg)
+        raise HTTPException(status_code=404, detail=error_msg)
+    return {"session_id": session_id, **snapshot}
+
+@app.post("/generate-emotion-report", response_model=EmotionReportResponse)
+async def generate_emotion_report(request: EmotionReportRequest):
+    """
+    Generate a session's emotion report with psychological interpretation from its aggregates.
+    The report is cached until new frames arrive for the session, so polling it is free.
+    """
+    try:
+        if not request.session_id:
+            logger.warning("Received empty session ID")
+            raise HTTPException(status_code=400, detail="Session ID is required")
+
+        result = await get_emotion_report(request.session_id)
+        if result is None:
+            error_msg = f"No emotion data available for session {request.session_id}"
+            logger.warning(error_msg)
+            raise HTTPException(status_code=404, detail=error_msg)
+
+        report, frames, cached = result
+        logger.info(f"Emotion report for session {request.session_id}: {frames} frames ({'cached' if cached else 'built'})")
+        return EmotionReportResponse(session_id=request.session_id, frames=frames, cached=cached, **report)
+
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        logger.error(f"Error generating emotion report for session {request.session_id}: {str(e)}")
+        return EmotionReportResponse(
+            session_id=request.session_id,
+            frames=0,
+            summary="",
+            stats="",
+            interpretation="",
+            error=str(e)
+        )
+
+@app.get("/emotion-samples/{session_id}")
+async def emotion_samples(session_id: str, limit: int | None = None):
+    """A session's latest per-frame emotion samples from its ring buffer (the last `limit` if given), oldest first."""
+    if session_id not in emotion_store:
+        error_msg = f"No emotion data available for session {session_id}"
+        logger.warning(error_msg)
+        raise HTTPException(status_code=404, detail=error_msg)
+    if limit is not None and limit <= 0:
+        raise HTTPException(status_code=400, detail="limit must be positive")
+    return {"session_id": session_id, "samples": emotion_store.samples(session_id, limit)}
+
+@app.get("/debug/emotion-store")
+async def emotion_store_stats():
+    """Debug endpoint exposing the emotion store's sessions, buffered frames and memory footprint."""
+    return emotion_store.stats()
+
+async def evict_idle_sessions():
+    """Periodically free the raw samples of idle sessions and forget long-idle ones."""
+    while True:
+        await asyncio.sleep(JANITOR_INTERVAL_SECONDS)
+        try:
+            freed, dropped = emotion_store.evict_idle()
+            for session_id in [session_id for session_id in emotion_reports if session_id not in emotion_store]:
+                del emotion_reports[session_id]
+            if freed or dropped:
+                logger.info(
+                    f"Evicted raw samples of {freed} idle session(s) and dropped {dropped}; "
+                    f"emotion store now {emotion_store.memory_bytes()} bytes"
+                )
+        except Exception as e:
+            logger.error(f"Failed to evict idle emotion sessions: {str(e)}")
+
+session_janitor: asyncio.Task | None = None
+
+@app.on_event("startup")
+async def startup_event():
+    """Load and warm up the emotion model before serving frames, and start the session janitor."""
+    global session_janitor
+    session_janitor = asyncio.create_task(evict_idle_sessions())
+    try:
+        await emotion_batcher.start()
+    except Exception as e:
+        # The API still starts; frames are answered with an error until the model is available
+        logger.error(f"Failed to load emotion model: {str(e)}")
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    session_janitor.cancel()
+    await emotion_batcher.stop()
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
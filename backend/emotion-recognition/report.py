@@ -4,7 +4,7 @@ from pinecone import Pinecone
 from langchain_community.embeddings import CohereEmbeddings
 from groq import AsyncGroq
 from rich.console import Console
-from typing import List, Dict, Any
+from typing import Dict, Any
 
 # Load environment variables
 load_dotenv()
@@ -19,6 +19,7 @@ You are a psychological data analyst. Your job is to:
 Context (if any):
 {context}
 """
+INTERPRETATION_ERROR = "An error occurred while interpreting the data."
 
 # Init clients
 console = Console()
@@ -34,37 +35,52 @@ embeddings = CohereEmbeddings(
 )
 
 # Summarize emotion data
-def summarize_emotion_data(emotion_data: List[Dict[str, Any]]) -> str:
-    if not emotion_data:
+def summarize_emotion_data(aggregates: Dict[str, Any] | None) -> str:
+    """Summary of a session from its emotion aggregates (EmotionStore.snapshot)."""
+    if not aggregates or not aggregates.get("frames"):
         return "No emotion data available."
-    
-    summaries = [d.get("summary", "No summary") for d in emotion_data]
-    unique_summaries = list(set(summaries))
-    
+
+    frames, face_frames = aggregates["frames"], aggregates["face_frames"]
+    emotions = sorted(aggregates["emotions"].items(), key=lambda item: item[1]["frames"], reverse=True)
+    distribution = ", ".join(f"{name} {stats['share']:.1%}" for name, stats in emotions)
+    dominant = aggregates["dominant_emotion"]
     summary = f"""
 Emotion Data Summary:
-- Total frames analyzed: {len(emotion_data)}
-- Unique emotional states detected: {len(unique_summaries)}
-- Sample summaries: {unique_summaries[:3] if unique_summaries else 'None'}
+- Total frames analyzed: {frames} over {aggregates['duration_seconds'] / 60:.1f} minutes
+- Frames with a detected face: {face_frames} ({face_frames / frames:.1%})
+- Dominant emotion: {f"{dominant} ({aggregates['emotions'][dominant]['share']:.1%} of face frames)" if dominant else 'None'}
+- Emotion distribution: {distribution or 'None'}
 """
     return summary.strip()
 
 # Analyze emotion data
-def analyze_emotion_data(emotion_data: List[Dict[str, Any]]) -> str:
-    if not emotion_data:
+def analyze_emotion_data(aggregates: Dict[str, Any] | None) -> str:
+    """Statistical analysis of a session from its emotion aggregates (EmotionStore.snapshot)."""
+    if not aggregates or not aggregates.get("frames"):
         return "No analysis possible due to missing data."
-    
+
     analysis = []
-    summaries = [d.get("summary", "") for d in emotion_data]
-    face_counts = [int(s.split()[1]) if s.startswith("Detected") else 0 for s in summaries]
-    
-    avg_face_count = sum(face_counts) / len(face_counts) if face_counts else 0
-    analysis.append(f"- Average faces detected per frame: {avg_face_count:.2f}")
-    
-    interpretations = [d.get("interpretation", "") for d in emotion_data]
-    unique_interpretations = list(set([i for i in interpretations if i]))
-    analysis.append(f"- Emotional interpretations: {', '.join(unique_interpretations[:3]) if unique_interpretations else 'None'}")
-    
+    analysis.append(f"- Average faces detected per frame: {aggregates['avg_face_count']:.2f}")
+
+    confidences = [
+        f"{name} {stats['mean_confidence']:.2f}"
+        for name, stats in aggregates["emotions"].items() if stats["mean_confidence"] is not None
+    ]
+    analysis.append(f"- Mean confidence by emotion: {', '.join(confidences) if confidences else 'None'}")
+
+    analysis.append(
+        f"- Emotion changes between consecutive detections: {aggregates['switches']} ({aggregates['switch_rate']:.1%})"
+    )
+    transitions = [
+        f"{t['from']} -> {t['to']} ({t['count']})"
+        for t in sorted(aggregates["transitions"], key=lambda t: t["count"], reverse=True)[:3]
+    ]
+    analysis.append(f"- Most frequent transitions: {', '.join(transitions) if transitions else 'None'}")
+
+    # Smoothed trajectory, e.g. "neutral -> happy -> neutral"
+    trajectory = [segment["emotion"] or "no face" for segment in aggregates["timeline"]]
+    analysis.append(f"- Smoothed emotional trajectory: {' -> '.join(trajectory[:8]) if trajectory else 'None'}{' -> ...' if len(trajectory) > 8 else ''}")
+
     return "\n".join(analysis)
 
 # Retrieve context with RAG
@@ -105,21 +121,27 @@ Please provide a psychological interpretation based on this data. Focus on emoti
         return res.choices[0].message.content
     except Exception as e:
         console.print(f"Error during Groq call: {e}", style="red")
-        return "An error occurred while interpreting the data."
+        return INTERPRETATION_ERROR
 
-# Main function for testing
-async def generate_report(emotion_data: List[Dict[str, Any]]) -> str:
-    csv_summary = summarize_emotion_data(emotion_data)
-    stats_summary = analyze_emotion_data(emotion_data)
+# Report sections: summary, statistics and the LLM interpretation
+async def build_report(aggregates: Dict[str, Any] | None) -> Dict[str, str]:
+    csv_summary = summarize_emotion_data(aggregates)
+    stats_summary = analyze_emotion_data(aggregates)
     rag_context = await get_rag_context("psychological interpretation of emotion data from facial recognition")
     interpretation = await interpret_with_groq(csv_summary, stats_summary, rag_context)
-    return f"{csv_summary}\n\n{stats_summary}\n\n{interpretation}"
+    return {"summary": csv_summary, "stats": stats_summary, "interpretation": interpretation}
+
+# Main function for testing
+async def generate_report(aggregates: Dict[str, Any] | None) -> str:
+    report = await build_report(aggregates)
+    return f"{report['summary']}\n\n{report['stats']}\n\n{report['interpretation']}"
 
 if __name__ == "__main__":
     import asyncio
+    from emotion_store import EmotionStore
     # Test with sample data
-    sample_data = [
-        {"session_id": "test", "summary": "Detected 1 face(s)", "stats": "Face detection confidence: 0.8", "interpretation": "Presence of faces suggests user engagement"}
-    ]
-    result = asyncio.run(generate_report(sample_data))
+    store = EmotionStore()
+    for i, emotion in enumerate(["neutral"] * 20 + ["happy"] * 15 + [None] * 2 + ["sad", "neutral"] * 4):
+        store.append("test", 1000.0 + i, emotion, 0.8, 0 if emotion is None else 1)
+    result = asyncio.run(generate_report(store.snapshot("test")))
     console.print(result, style="cyan")
\ No newline at end of file
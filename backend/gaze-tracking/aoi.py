@@ -0,0 +1,271 @@
+import json
+import math
+import os
+from typing import Any, Dict, List, Sequence, Tuple
+
+import numpy as np
+
+from gaze_archive import MISSING_TIMESTAMP, ArchivedSession
+from gaze_stats import frame_gaze
+
+# Areas of interest (AOIs) are named rectangles or polygons in normalized frame
+# coordinates ([0, 1] on both axes, origin top left). Layout files are JSON:
+#   {"frame_size": [640, 480], "aois": [{"name": "Left", "rect": [0, 0, 213, 240]},
+#                                       {"name": "Question", "polygon": [[x, y], ...]}]}
+# "frame_size" is optional; when given, coordinates are pixels of a frame that size.
+# A point inside several AOIs belongs to the first one listed.
+AOI_CONFIG = os.getenv("GAZE_AOI_CONFIG", "")
+# Longer pauses between samples (dropped frames, paused capture) do not count as dwell time
+AOI_MAX_GAP_SECONDS = float(os.getenv("GAZE_AOI_MAX_GAP_SECONDS", "2.0"))
+
+# Three zones across the top half of a 640x480 frame, as eye_tracking.py always used
+EYE_TRACKING_LAYOUT = {
+    "frame_size": [640, 480],
+    "aois": [
+        {"name": "Left", "rect": [0, 0, 213, 240]},
+        {"name": "Center", "rect": [214, 0, 426, 240]},
+        {"name": "Right", "rect": [427, 0, 640, 240]},
+    ],
+}
+# The center of the frame, then its four quadrants, as gaze.py always used
+QUADRANT_LAYOUT = {
+    "aois": [
+        {"name": "center", "rect": [0.25, 0.25, 0.75, 0.75]},
+        {"name": "top_left", "rect": [0, 0, 0.5, 0.5]},
+        {"name": "top_right", "rect": [0.5, 0, 1, 0.5]},
+        {"name": "bottom_left", "rect": [0, 0.5, 0.5, 1]},
+        {"name": "bottom_right", "rect": [0.5, 0.5, 1, 1]},
+    ],
+}
+
+class AOILayout:
+    """
+    A set of AOIs with a uniform-grid spatial index for classifying gaze points.
+
+    Each grid cell lists, in priority order, the AOIs whose bounding box
+    overlaps it. Classification looks up every point's cell at once and then
+    tests candidates slot by slot over the whole array (bounding boxes for
+    rectangles, even-odd crossings for polygons), so the cost grows with the
+    number of AOIs overlapping a cell rather than with the size of the layout.
+    """
+
+    def __init__(self, names: List[str], shapes: List[np.ndarray], is_rect: List[bool], grid_size: int | None = None):
+        if len(set(names)) != len(names):
+            raise ValueError("AOI names must be unique")
+        self.names = names
+        self.polygons = shapes  # (n, 2) vertex arrays; rectangles as their 4 corners
+        self.is_rect = np.array(is_rect, dtype=bool)
+        self.bounds = np.array(
+            [[*shape.min(axis=0), *shape.max(axis=0)] for shape in shapes], dtype=np.float64
+        ).reshape(-1, 4)
+        self._build_index(grid_size or max(4, min(64, 2 * math.ceil(math.sqrt(len(names))))))
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any] | List[Dict[str, Any]]) -> "AOILayout":
+        """Build a layout from its JSON form (a dict with "aois", or a bare list of AOIs)."""
+        aois = config.get("aois", []) if isinstance(config, dict) else config
+        frame_size = config.get("frame_size") if isinstance(config, dict) else None
+        scale = np.array(frame_size, dtype=np.float64) if frame_size else np.ones(2)
+        names, shapes, is_rect = [], [], []
+        for aoi in aois:
+            name = str(aoi.get("name", ""))
+            if not name:
+                raise ValueError("Every AOI needs a name")
+            if "rect" in aoi:
+                x0, y0, x1, y1 = (float(v) for v in aoi["rect"])
+                if x1 < x0 or y1 < y0:
+                    raise ValueError(f"AOI {name}: rect must be [x_min, y_min, x_max, y_max]")
+                vertices = np.array([[x0, y0], [x1, y0], [x1, y1], [x0, y1]])
+                is_rect.append(True)
+            elif "polygon" in aoi:
+                vertices = np.asarray(aoi["polygon"], dtype=np.float64)
+                if vertices.ndim != 2 or vertices.shape[1] != 2 or len(vertices) < 3:
+                    raise ValueError(f"AOI {name}: polygon must be a list of at least 3 [x, y] points")
+                is_rect.append(False)
+            else:
+                raise ValueError(f"AOI {name} needs a rect or a polygon")
+            names.append(name)
+            shapes.append(vertices / scale)
+        return cls(names, shapes, is_rect)
+
+    def __len__(self):
+        return len(self.names)
+
+    def _build_index(self, grid_size: int):
+        self.grid_size = grid_size
+        if not len(self):
+            self.origin, self.cell_size = np.zeros(2), np.ones(2)
+            self._cells = np.full((1, 1), -1, dtype=np.int32)
+            return
+        self.origin = self.bounds[:, :2].min(axis=0)
+        extent = self.bounds[:, 2:].max(axis=0) - self.origin
+        self.cell_size = np.where(extent > 0, extent / grid_size, 1.0)
+
+        cells: List[List[int]] = [[] for _ in range(grid_size * grid_size)]
+        first = self._cell_coords(self.bounds[:, 0], self.bounds[:, 1])
+        last = self._cell_coords(self.bounds[:, 2], self.bounds[:, 3])
+        for aoi, ((cx0, cy0), (cx1, cy1)) in enumerate(zip(first.tolist(), last.tolist())):
+            for cy in range(cy0, cy1 + 1):
+                for cx in range(cx0, cx1 + 1):
+                    cells[cy * grid_size + cx].append(aoi)
+        # Padded candidate table: one row per cell, AOIs in priority order, -1 after the last
+        width = max(1, max(len(candidates) for candidates in cells))
+        self._cells = np.full((len(cells), width), -1, dtype=np.int32)
+        for cell, candidates in enumerate(cells):
+            self._cells[cell, :len(candidates)] = candidates
+
+    def _cell_coords(self, x: np.ndarray, y: np.ndarray) -> np.ndarray:
+        cell = np.floor((np.column_stack([x, y]) - self.origin) / self.cell_size).astype(np.int64)
+        return np.clip(cell, 0, self.grid_size - 1)
+
+    def classify(self, x: Sequence[float] | np.ndarray, y: Sequence[float] | np.ndarray) -> np.ndarray:
+        """AOI index of every point (-1 outside all AOIs), for whole arrays of normalized coordinates."""
+        x = np.asarray(x, dtype=np.float64).ravel()
+        y = np.asarray(y, dtype=np.float64).ravel()
+        labels = np.full(len(x), -1, dtype=np.int32)
+        if not len(self) or not len(x):
+            return labels
+
+        # Points off the indexed area cannot be in any AOI; boundaries are inclusive
+        upper = self.origin + self.cell_size * self.grid_size
+        pending = np.flatnonzero(
+            (x >= self.origin[0]) & (x <= upper[0]) & (y >= self.origin[1]) & (y <= upper[1])
+        )
+        cells = self._cell_coords(x[pending], y[pending])
+        candidates = self._cells[cells[:, 1] * self.grid_size + cells[:, 0]]
+        for slot in range(candidates.shape[1]):
+            if not len(pending):
+                break
+            aoi = candidates[:, slot]
+            hit = self._contains(aoi, x[pending], y[pending])
+            labels[pending[hit]] = aoi[hit]
+            # Points stay pending while they have candidates left
+            keep = ~hit & (aoi >= 0)
+            pending, candidates = pending[keep], candidates[keep]
+        return labels
+
+    def _contains(self, aoi: np.ndarray, x: np.ndarray, y: np.ndarray) -> np.ndarray:
+        """Whether each point lies in its paired AOI (-1 pairs never match)."""
+        valid = aoi >= 0
+        b = self.bounds[np.where(valid, aoi, 0)]
+        inside = valid & (x >= b[:, 0]) & (x <= b[:, 2]) & (y >= b[:, 1]) & (y <= b[:, 3])
+        polygon_points = np.flatnonzero(inside & ~self.is_rect[np.where(valid, aoi, 0)])
+        if len(polygon_points):
+            order = polygon_points[np.argsort(aoi[polygon_points], kind="stable")]
+            ids, starts = np.unique(aoi[order], return_index=True)
+            for polygon, group in zip(ids.tolist(), np.split(order, starts[1:])):
+                inside[group] = points_in_polygon(x[group], y[group], self.polygons[polygon])
+        return inside
+
+    def containing(self, x: float, y: float) -> List[int]:
+        """Indices of every AOI containing one point, in priority order (the first is its `classify` label)."""
+        if not len(self):
+            return []
+        cell = self._cell_coords(np.array([x]), np.array([y]))[0]
+        candidates = self._cells[cell[1] * self.grid_size + cell[0]]
+        candidates = candidates[candidates >= 0]
+        hits = self._contains(candidates, np.full(len(candidates), x), np.full(len(candidates), y))
+        return candidates[hits].tolist()
+
+    def name_of(self, label: int) -> str | None:
+        return self.names[label] if label >= 0 else None
+
+    def summarize(self, labels: np.ndarray, times: np.ndarray, max_gap: float = AOI_MAX_GAP_SECONDS) -> Dict[str, Any]:
+        """Per-AOI samples and dwell time plus the transition counts of a labelled gaze sequence."""
+        dwell, transitions = dwell_and_transitions(labels, times, len(self), max_gap)
+        samples = np.bincount(labels[labels >= 0], minlength=len(self))
+        sources, targets = np.nonzero(transitions)
+        return {
+            "aois": [
+                {"name": name, "samples": int(n), "dwell_seconds": round(float(seconds), 3)}
+                for name, n, seconds in zip(self.names, samples.tolist(), dwell.tolist())
+            ],
+            "outside_samples": int(np.count_nonzero(labels < 0)),
+            "transitions": [
+                {"from": self.names[a], "to": self.names[b], "count": int(transitions[a, b])}
+                for a, b in zip(sources.tolist(), targets.tolist())
+            ],
+        }
+
+def summarize_session(layout: AOILayout, session: ArchivedSession, max_gap: float = AOI_MAX_GAP_SECONDS) -> Dict[str, Any]:
+    """AOI dwell and transitions of a stored session, from each frame's mean gaze point."""
+    x, y, valid = frame_gaze(session.columns)
+    labels = layout.classify(x, y)
+    labels[~valid] = -1  # Frames without eyes only carry a placeholder point
+    times = np.where(session.timestamps == MISSING_TIMESTAMP, np.nan, session.timestamps / 1e6)
+    return {"frames": len(labels), "valid_frames": int(np.count_nonzero(valid)), **layout.summarize(labels, times, max_gap)}
+
+def points_in_polygon(x: np.ndarray, y: np.ndarray, vertices: np.ndarray) -> np.ndarray:
+    """Even-odd point-in-polygon test of many points against one polygon."""
+    xi, yi = vertices[:, 0], vertices[:, 1]
+    xj, yj = np.roll(xi, 1), np.roll(yi, 1)
+    px, py = x[:, None], y[:, None]
+    spans = (yi > py) != (yj > py)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        crossing_x = xi + (py - yi) * (xj - xi) / (yj - yi)
+    return np.count_nonzero(spans & (px < crossing_x), axis=1) % 2 == 1
+
+def dwell_and_transitions(labels: np.ndarray, times: np.ndarray, aoi_count: int, max_gap: float = AOI_MAX_GAP_SECONDS) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Dwell seconds per AOI and the AOI-to-AOI transition matrix of a gaze sequence.
+
+    Each sample lasts until the next one; gaps longer than `max_gap` (or
+    negative, or with an unknown time) count for nothing. Transitions count
+    changes between consecutive samples inside AOIs, so a glance that leaves
+    every AOI and comes back to the same one is not a transition.
+    """
+    labels = np.asarray(labels)
+    times = np.asarray(times, dtype=np.float64)
+    dt = np.diff(times)
+    counted = (labels[:-1] >= 0) & np.isfinite(dt) & (dt >= 0) & (dt <= max_gap)
+    dwell = np.bincount(labels[:-1][counted], weights=dt[counted], minlength=aoi_count)
+
+    visits = labels[labels >= 0].astype(np.int64)
+    moved = visits[1:] != visits[:-1]
+    pairs = visits[:-1][moved] * aoi_count + visits[1:][moved]
+    transitions = np.bincount(pairs, minlength=aoi_count * aoi_count).reshape(aoi_count, aoi_count)
+    return dwell, transitions
+
+class AOITracker:
+    """Dwell time and transitions of a live gaze stream, updated one sample at a time."""
+
+    def __init__(self, layout: AOILayout, max_gap: float = AOI_MAX_GAP_SECONDS):
+        self.layout = layout
+        self.max_gap = max_gap
+        self.samples = np.zeros(len(layout), dtype=np.int64)
+        self.dwell = np.zeros(len(layout))
+        self.transitions = np.zeros((len(layout), len(layout)), dtype=np.int64)
+        self._prev_label = -1
+        self._prev_time: float | None = None
+        self._last_aoi = -1
+
+    def update(self, label: int, timestamp: float):
+        """Add one sample (its AOI index, or -1) captured at `timestamp` seconds."""
+        if self._prev_label >= 0 and self._prev_time is not None and 0 <= timestamp - self._prev_time <= self.max_gap:
+            self.dwell[self._prev_label] += timestamp - self._prev_time
+        if label >= 0:
+            self.samples[label] += 1
+            if self._last_aoi >= 0 and label != self._last_aoi:
+                self.transitions[self._last_aoi, label] += 1
+            self._last_aoi = label
+        self._prev_label, self._prev_time = label, timestamp
+
+    def summary(self) -> str:
+        lines = [
+            f"{name}: {seconds:.1f}s dwell, {n} samples"
+            for name, seconds, n in zip(self.layout.names, self.dwell.tolist(), self.samples.tolist())
+        ]
+        sources, targets = np.nonzero(self.transitions)
+        lines += [
+            f"{self.layout.names[a]} -> {self.layout.names[b]}: {self.transitions[a, b]}"
+            for a, b in zip(sources.tolist(), targets.tolist())
+        ]
+        return "\n".join(lines)
+
+def load_layout(path: str | None = None, default: Dict[str, Any] | None = None) -> AOILayout:
+    """Load an AOI layout file (GAZE_AOI_CONFIG by default), or build `default` if none is configured."""
+    path = path or AOI_CONFIG
+    if not path:
+        return AOILayout.from_config(default or QUADRANT_LAYOUT)
+    with open(path, "r") as f:
+        return AOILayout.from_config(json.load(f))
@@ -0,0 +1,173 @@
+import asyncio
+import json
+import logging
+import os
+import re
+import time
+from dataclasses import asdict, dataclass
+from typing import Dict, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Per-user (or per-device) calibration profiles, one JSON file each
+CALIBRATION_DIR = os.getenv("GAZE_CALIBRATION_DIR", "calibration_profiles")
+
+# Eye-detection threshold used without a profile, and as a fraction of the profile's open-eye EAR
+DEFAULT_EYE_THRESHOLD = 0.1
+EYE_DETECTION_RATIO = 0.35
+# Blink threshold as a fraction of the open-eye EAR (eye_tracking.py's dynamic threshold)
+BLINK_THRESHOLD_RATIO = 0.7
+# Refinement averages over about this many recent open-eye samples
+REFINE_WINDOW = 300
+# Frames a new API client is observed for before its profile is created (about 3 seconds)
+CALIBRATION_FRAMES = 90
+# Unknown profile IDs still being calibrated at most; the least recently seen is dropped beyond this
+MAX_CALIBRATING = int(os.getenv("GAZE_MAX_CALIBRATING_PROFILES", "1000"))
+
+@dataclass
+class CalibrationProfile:
+    profile_id: str
+    ear_mean: float  # Average EAR with the eyes open
+    pupil_base_size: float | None = None  # Median iris radius in pixels at the capture resolution
+    samples: int = 0
+    updated_at: float = 0.0
+
+    @classmethod
+    def from_samples(cls, profile_id: str, ears: List[float], pupil_sizes: List[float]) -> "CalibrationProfile":
+        """Build a profile from a calibration pass (frames captured with the eyes open)."""
+        pupil_sizes = sorted(pupil_sizes)
+        return cls(
+            profile_id=profile_id,
+            ear_mean=sum(ears) / len(ears),
+            pupil_base_size=pupil_sizes[len(pupil_sizes) // 2] if pupil_sizes else None,
+            samples=len(ears),
+            updated_at=time.time(),
+        )
+
+    @property
+    def blink_threshold(self) -> float:
+        return self.ear_mean * BLINK_THRESHOLD_RATIO
+
+    @property
+    def eye_threshold(self) -> float:
+        return self.ear_mean * EYE_DETECTION_RATIO
+
+    def observe(self, ear: float) -> bool:
+        """
+        Refine the open-eye EAR with one frame; returns False if the frame was not used.
+
+        Frames below the blink threshold are ignored so blinks do not drag the
+        baseline down. Samples are averaged over a sliding window of about
+        REFINE_WINDOW frames, so the profile follows slow drift (lighting, camera
+        placement) without forgetting the calibration at once. The pupil baseline
+        is left alone: dilation is measured against it.
+        """
+        if ear < self.blink_threshold:
+            return False
+        self.samples += 1
+        self.ear_mean += (ear - self.ear_mean) / min(self.samples, REFINE_WINDOW)
+        self.updated_at = time.time()
+        return True
+
+def profile_path(profile_id: str, directory: str = CALIBRATION_DIR) -> str:
+    safe_id = re.sub(r'[^\w\-\.]', '_', profile_id).strip('.')
+    return os.path.join(directory, f"{safe_id}.json")
+
+def load_profile(profile_id: str, directory: str = CALIBRATION_DIR) -> CalibrationProfile | None:
+    """Load a saved profile, or None if there is none (or it is unreadable)."""
+    try:
+        with open(profile_path(profile_id, directory), "r") as f:
+            return CalibrationProfile(**json.load(f))
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logger.error(f"Failed to load calibration profile {profile_id}: {str(e)}")
+        return None
+
+def save_profile(profile: CalibrationProfile, directory: str = CALIBRATION_DIR):
+    """Save a profile atomically."""
+    os.makedirs(directory, exist_ok=True)
+    path = profile_path(profile.profile_id, directory)
+    with open(path + ".tmp", "w") as f:
+        json.dump(asdict(profile), f, indent=2)
+    os.replace(path + ".tmp", path)
+
+class ProfileStore:
+    """
+    Calibration profiles held in memory by the gaze API.
+
+    All profiles are loaded at startup. Frames from clients that send a
+    profile ID refine it in place; for an unknown ID, the first
+    CALIBRATION_FRAMES frames with a face calibrate a new profile; at most
+    MAX_CALIBRATING such calibrations are pending, and `expire_calibrations`
+    drops those abandoned for too long. Changed profiles are written back by
+    `save_dirty` (periodically and on shutdown).
+    """
+
+    def __init__(self, directory: str = CALIBRATION_DIR, refine: bool = True):
+        self.directory = directory
+        self.refine = refine
+        self._profiles: Dict[str, CalibrationProfile] = {}
+        self._dirty: set = set()
+        # Pending calibrations, least recently seen first, with the time each was last seen
+        self._calibrating: Dict[str, Tuple[List[float], float]] = {}
+
+    def load(self):
+        os.makedirs(self.directory, exist_ok=True)
+        for name in os.listdir(self.directory):
+            if name.endswith(".json"):
+                profile = load_profile(name[:-len(".json")], self.directory)
+                if profile is not None:
+                    self._profiles[profile.profile_id] = profile
+        logger.info(f"Loaded {len(self._profiles)} calibration profiles from {self.directory}")
+
+    def __len__(self):
+        return len(self._profiles)
+
+    def get(self, profile_id: str | None) -> CalibrationProfile | None:
+        return self._profiles.get(profile_id) if profile_id else None
+
+    def put(self, profile: CalibrationProfile):
+        self._profiles[profile.profile_id] = profile
+        self._dirty.add(profile.profile_id)
+
+    def eye_threshold(self, profile_id: str | None) -> float:
+        """Eye-detection EAR threshold for a client, or the default without a profile."""
+        profile = self.get(profile_id)
+        return profile.eye_threshold if profile else DEFAULT_EYE_THRESHOLD
+
+    def observe(self, profile_id: str | None, ear: float | None):
+        """Calibrate or refine a client's profile with a frame's mean EAR, if refinement is enabled."""
+        if not self.refine or not profile_id or ear is None:
+            return
+        profile = self.get(profile_id)
+        if profile is None:
+            samples, _ = self._calibrating.pop(profile_id, ([], 0.0))
+            samples.append(ear)
+            if len(samples) >= CALIBRATION_FRAMES:
+                self.put(CalibrationProfile.from_samples(profile_id, samples, []))
+                logger.info(f"Calibrated profile {profile_id}: EAR {self._profiles[profile_id].ear_mean:.3f}")
+            else:
+                self._calibrating[profile_id] = (samples, time.time())
+                if len(self._calibrating) > MAX_CALIBRATING:
+                    del self._calibrating[next(iter(self._calibrating))]
+        elif profile.observe(ear):
+            self._dirty.add(profile_id)
+
+    def expire_calibrations(self, idle_seconds: float) -> int:
+        """Drop pending calibrations not seen for `idle_seconds`; returns how many."""
+        cutoff = time.time() - idle_seconds
+        expired = [profile_id for profile_id, (_, seen_at) in self._calibrating.items() if seen_at < cutoff]
+        for profile_id in expired:
+            del self._calibrating[profile_id]
+        return len(expired)
+
+    async def save_dirty(self):
+        """Write back every profile changed since the last save."""
+        dirty, self._dirty = self._dirty, set()
+        for profile_id in dirty:
+            try:
+                await asyncio.to_thread(save_profile, self._profiles[profile_id], self.directory)
+            except Exception as e:
+                self._dirty.add(profile_id)
+                logger.error(f"Failed to save calibration profile {profile_id}: {str(e)}")
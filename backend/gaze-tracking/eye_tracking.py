@@ -1,16 +1,24 @@
 import csv
 import cv2
-import numpy as np
 from scipy.spatial import distance
 import os
+import queue
+import threading
 import time
 from datetime import datetime
 import mediapipe as mp
 import argparse
+from aoi import EYE_TRACKING_LAYOUT, AOITracker, load_layout
+from calibration import CalibrationProfile, load_profile, save_profile
+from landmarks import eye_aspect_ratios, iris_centers, iris_radii, landmarks_to_array
 
 # Parse duration argument
 parser = argparse.ArgumentParser()
 parser.add_argument('--duration', type=int, default=300, help='Duration of eye tracking in seconds')
+parser.add_argument('--profile', default='default', help='Calibration profile (user or device) to load and update')
+parser.add_argument('--recalibrate', action='store_true', help='Run the calibration pass even if the profile exists')
+parser.add_argument('--no-refine', dest='refine', action='store_false', help='Do not refine the profile during capture')
+parser.add_argument('--aoi-config', help='AOI layout JSON file (default: GAZE_AOI_CONFIG, else three zones across the top half)')
 args = parser.parse_args()
 capture_duration = args.duration
 
@@ -26,25 +34,15 @@ face_mesh = mp_face_mesh.FaceMesh(
 INITIAL_EAR_THRESHOLD = 0.25
 FIXATION_THRESHOLD = 40
 BLINK_CONSEC_FRAMES = 2
-AOI_ZONES = {
-    "Left": (0, 0, 213, 240),
-    "Center": (214, 0, 426, 240),
-    "Right": (427, 0, 640, 240)
-}
 CSV_FILENAME = "eye_tracking_data_media.csv"
+CSV_FLUSH_INTERVAL = 1.0  # Seconds between flushes of the buffered CSV writer
+LOG_QUEUE_SIZE = 1024  # Rows waiting for the writer thread before inference blocks
+FPS_REPORT_INTERVAL = 5.0
 FIELD_NAMES = [
     "timestamp", "gaze_x", "gaze_y", "blink_rate", 
     "pupil_dilation", "fixation_duration", "aoi", "ear_value"
 ]
 
-# Landmark indices
-LEFT_EYE_INDICES = [362, 385, 387, 263, 373, 380]
-RIGHT_EYE_INDICES = [33, 160, 158, 133, 153, 144]
-LEFT_IRIS_CENTER = 468
-RIGHT_IRIS_CENTER = 473
-LEFT_IRIS_RADIUS_INDICES = [469, 470, 471, 472]
-RIGHT_IRIS_RADIUS_INDICES = [474, 475, 476, 477]
-
 # State variables
 blink_counter = 0
 frame_counter = 0
@@ -55,6 +53,8 @@ calibrated = False
 dynamic_ear_threshold = INITIAL_EAR_THRESHOLD
 ear_values = []
 pupil_base_size = None
+aoi_layout = load_layout(args.aoi_config, EYE_TRACKING_LAYOUT)
+aoi_tracker = AOITracker(aoi_layout)
 
 def init_csv():
     if not os.path.exists(CSV_FILENAME):
@@ -62,39 +62,67 @@ def init_csv():
             writer = csv.DictWriter(f, fieldnames=FIELD_NAMES)
             writer.writeheader()
 
-def log_data(data):
-    with open(CSV_FILENAME, 'a', newline='') as f:
+class RateCounter:
+    """Counts events (frames) and reports their rate overall and since the last report."""
+
+    def __init__(self):
+        self.count = 0
+        self.start = self._window_start = time.monotonic()
+        self._window_count = 0
+
+    def tick(self):
+        self.count += 1
+
+    def overall(self) -> float:
+        elapsed = time.monotonic() - self.start
+        return self.count / elapsed if elapsed > 0 else 0.0
+
+    def recent(self) -> float:
+        now = time.monotonic()
+        rate = (self.count - self._window_count) / (now - self._window_start) if now > self._window_start else 0.0
+        self._window_count, self._window_start = self.count, now
+        return rate
+
+def put_latest(frames: queue.Queue, item):
+    """Queue a frame, replacing the one still waiting if the consumer has fallen behind."""
+    try:
+        frames.put_nowait(item)
+        return False
+    except queue.Full:
+        try:
+            frames.get_nowait()
+        except queue.Empty:
+            pass
+        frames.put_nowait(item)
+        return True
+
+def capture_frames(cap, frames: queue.Queue, stop: threading.Event, rate: RateCounter, dropped: RateCounter):
+    """Capture thread: read and mirror camera frames; only the newest one waits for inference."""
+    while not stop.is_set():
+        ret, frame = cap.read()
+        if not ret:
+            break
+        rate.tick()
+        if put_latest(frames, (time.time(), cv2.flip(frame, 1))):
+            dropped.tick()
+    put_latest(frames, None)
+
+def write_rows(rows: queue.Queue):
+    """Logging thread: append rows to the CSV through one open, buffered writer."""
+    with open(CSV_FILENAME, 'a', newline='', buffering=1 << 16) as f:
         writer = csv.DictWriter(f, fieldnames=FIELD_NAMES)
-        writer.writerow(data)
-
-def calculate_ear(eye_points):
-    v1 = distance.euclidean(eye_points[1], eye_points[5])
-    v2 = distance.euclidean(eye_points[2], eye_points[4])
-    h = distance.euclidean(eye_points[0], eye_points[3])
-    return (v1 + v2) / (2.0 * h)
-
-def get_eye_ear(face_landmarks, eye_indices, frame_width, frame_height):
-    eye_points = []
-    for index in eye_indices:
-        landmark = face_landmarks.landmark[index]
-        x = int(landmark.x * frame_width)
-        y = int(landmark.y * frame_height)
-        eye_points.append((x, y))
-    return calculate_ear(eye_points)
-
-def get_iris_center(face_landmarks, iris_index, frame_width, frame_height):
-    landmark = face_landmarks.landmark[iris_index]
-    return (int(landmark.x * frame_width), int(landmark.y * frame_height))
-
-def get_iris_radius(face_landmarks, center, radius_indices, frame_width, frame_height):
-    center_x, center_y = center
-    total_dist = 0.0
-    for index in radius_indices:
-        landmark = face_landmarks.landmark[index]
-        x = landmark.x * frame_width
-        y = landmark.y * frame_height
-        total_dist += distance.euclidean((x, y), (center_x, center_y))
-    return total_dist / len(radius_indices)
+        last_flush = time.monotonic()
+        while True:
+            try:
+                row = rows.get(timeout=CSV_FLUSH_INTERVAL)
+                if row is None:
+                    break
+                writer.writerow(row)
+            except queue.Empty:
+                pass
+            if time.monotonic() - last_flush >= CSV_FLUSH_INTERVAL:
+                f.flush()
+                last_flush = time.monotonic()
 
 # Initialize
 init_csv()
@@ -102,62 +130,88 @@ cap = cv2.VideoCapture(0)
 cap.set(cv2.CAP_PROP_FRAME_WIDTH, 640)
 cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 480)
 
-print("Calibrating... (keep eyes open)")
-calibration_frames = []
-start_time = time.time()
-while time.time() - start_time < 3:
-    ret, frame = cap.read()
-    if ret:
-        frame = cv2.flip(frame, 1)
+# Capture -> inference (this thread, which also owns the preview window) -> logging,
+# connected by a one-slot frame queue and a bounded row queue
+frames: queue.Queue = queue.Queue(maxsize=1)
+log_rows: queue.Queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+stop_capture = threading.Event()
+capture_rate, dropped_frames = RateCounter(), RateCounter()
+capture_thread = threading.Thread(
+    target=capture_frames, args=(cap, frames, stop_capture, capture_rate, dropped_frames), daemon=True
+)
+writer_thread = threading.Thread(target=write_rows, args=(log_rows,), daemon=True)
+capture_thread.start()
+writer_thread.start()
+
+# A saved profile skips the calibration pass
+profile = None if args.recalibrate else load_profile(args.profile)
+if profile:
+    print(f"Loaded calibration profile '{args.profile}'")
+else:
+    print("Calibrating... (keep eyes open)")
+    calibration_frames = []
+    start_time = time.time()
+    while time.time() - start_time < 3:
+        try:
+            item = frames.get(timeout=1.0)
+        except queue.Empty:
+            continue
+        if item is None:
+            break
+        _, frame = item
         results = face_mesh.process(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
         if results.multi_face_landmarks:
-            face_landmarks = results.multi_face_landmarks[0]
-            ear_left = get_eye_ear(face_landmarks, LEFT_EYE_INDICES, 640, 480)
-            ear_right = get_eye_ear(face_landmarks, RIGHT_EYE_INDICES, 640, 480)
-            avg_ear = (ear_left + ear_right) / 2.0
-            ear_values.append(avg_ear)
-            left_iris = get_iris_center(face_landmarks, LEFT_IRIS_CENTER, 640, 480)
-            right_iris = get_iris_center(face_landmarks, RIGHT_IRIS_CENTER, 640, 480)
-            left_radius = get_iris_radius(face_landmarks, left_iris, LEFT_IRIS_RADIUS_INDICES, 640, 480)
-            right_radius = get_iris_radius(face_landmarks, right_iris, RIGHT_IRIS_RADIUS_INDICES, 640, 480)
-            calibration_frames.append((left_radius + right_radius) / 2.0)
-
-if ear_values:
-    dynamic_ear_threshold = np.mean(ear_values) * 0.7
-    print(f"Adjusted EAR threshold: {dynamic_ear_threshold:.2f}")
+            points = landmarks_to_array(results.multi_face_landmarks[0], 640, 480)
+            ear_values.append(eye_aspect_ratios(points).mean())
+            calibration_frames.append(iris_radii(points).mean())
 
-if calibration_frames:
-    pupil_base_size = np.median(calibration_frames)
-    print(f"Base pupil size: {pupil_base_size:.2f}px")
-    calibrated = True
+    if ear_values:
+        profile = CalibrationProfile.from_samples(args.profile, ear_values, calibration_frames)
+        save_profile(profile)
+        print(f"Saved calibration profile '{args.profile}'")
+
+if profile:
+    dynamic_ear_threshold = profile.blink_threshold
+    print(f"Adjusted EAR threshold: {dynamic_ear_threshold:.2f}")
+    if profile.pupil_base_size:
+        pupil_base_size = profile.pupil_base_size
+        print(f"Base pupil size: {pupil_base_size:.2f}px")
+        calibrated = True
 
 print(f"Capturing eye tracking data for {capture_duration} seconds...")
 start_time = time.time()
+processing_rate = RateCounter()
+last_fps_report = time.monotonic()
 
-# Main loop
+# Main loop: inference on the newest captured frame
 while time.time() - start_time < capture_duration:
+    try:
+        item = frames.get(timeout=1.0)
+    except queue.Empty:
+        continue
+    if item is None:
+        break  # Camera stopped delivering frames
+    # Timings use the capture time, not the time the frame reached inference
+    captured_at, frame = item
+
     log_entry = {
-        "timestamp": datetime.now().isoformat(),
+        "timestamp": datetime.fromtimestamp(captured_at).isoformat(),
         "gaze_x": None, "gaze_y": None,
         "blink_rate": 0.0, "pupil_dilation": None,
         "fixation_duration": 0.0, "aoi": "None",
         "ear_value": None
     }
-    
-    ret, frame = cap.read()
-    if not ret:
-        break
 
-    frame = cv2.flip(frame, 1)
     results = face_mesh.process(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
     frame_height, frame_width = frame.shape[:2]
+    aoi_label = -1
 
     if results.multi_face_landmarks:
-        face_landmarks = results.multi_face_landmarks[0]
-        ear_left = get_eye_ear(face_landmarks, LEFT_EYE_INDICES, frame_width, frame_height)
-        ear_right = get_eye_ear(face_landmarks, RIGHT_EYE_INDICES, frame_width, frame_height)
-        avg_ear = (ear_left + ear_right) / 2.0
+        points = landmarks_to_array(results.multi_face_landmarks[0], frame_width, frame_height)
+        avg_ear = eye_aspect_ratios(points).mean()
         log_entry["ear_value"] = avg_ear
+        if profile and args.refine and profile.observe(avg_ear):
+            dynamic_ear_threshold = profile.blink_threshold
 
         if avg_ear < dynamic_ear_threshold:
             blink_frames += 1
@@ -166,42 +220,58 @@ while time.time() - start_time < capture_duration:
                 blink_counter += 1
             blink_frames = 0
 
-        left_iris = get_iris_center(face_landmarks, LEFT_IRIS_CENTER, frame_width, frame_height)
-        right_iris = get_iris_center(face_landmarks, RIGHT_IRIS_CENTER, frame_width, frame_height)
+        left_iris, right_iris = iris_centers(points).astype(int)
         gaze_x = (left_iris[0] + right_iris[0]) // 2
         gaze_y = (left_iris[1] + right_iris[1]) // 2
         log_entry["gaze_x"], log_entry["gaze_y"] = gaze_x, gaze_y
 
         movement = distance.euclidean((gaze_x, gaze_y), last_gaze)
         if movement < FIXATION_THRESHOLD:
-            fixation_start = fixation_start or time.time()
-            log_entry["fixation_duration"] = time.time() - fixation_start
+            fixation_start = fixation_start or captured_at
+            log_entry["fixation_duration"] = captured_at - fixation_start
         else:
-            fixation_start = time.time()
+            fixation_start = captured_at
         last_gaze = (gaze_x, gaze_y)
 
-        current_aoi = []
-        for zone, (x1, y1, x2, y2) in AOI_ZONES.items():
-            if x1 <= gaze_x <= x2 and y1 <= gaze_y <= y2:
-                current_aoi.append(zone)
-        log_entry["aoi"] = ",".join(current_aoi) if current_aoi else "None"
+        # The CSV lists every zone the gaze is in; dwell and transitions use the first (highest priority)
+        zones = aoi_layout.containing(gaze_x / frame_width, gaze_y / frame_height)
+        aoi_label = zones[0] if zones else -1
+        log_entry["aoi"] = ",".join(aoi_layout.names[zone] for zone in zones) or "None"
 
         if calibrated:
-            left_radius = get_iris_radius(face_landmarks, left_iris, LEFT_IRIS_RADIUS_INDICES, frame_width, frame_height)
-            right_radius = get_iris_radius(face_landmarks, right_iris, RIGHT_IRIS_RADIUS_INDICES, frame_width, frame_height)
-            pupil_size = (left_radius + right_radius) / 2.0
+            pupil_size = iris_radii(points).mean()
             pupil_dilation = ((pupil_size - pupil_base_size) / pupil_base_size) * 100
             log_entry["pupil_dilation"] = pupil_dilation
 
-    fps = cap.get(cv2.CAP_PROP_FPS)
-    log_entry["blink_rate"] = (blink_counter / (frame_counter / fps)) * 60 if frame_counter > 0 else 0
+    # Blinks per minute of capture time (frames dropped for falling behind still count as time)
+    elapsed = captured_at - start_time
+    log_entry["blink_rate"] = (blink_counter / elapsed) * 60 if frame_counter > 0 and elapsed > 0 else 0
 
-    log_data(log_entry)
+    aoi_tracker.update(aoi_label, captured_at)
+    log_rows.put(log_entry)
     frame_counter += 1
+    processing_rate.tick()
+
+    if time.monotonic() - last_fps_report >= FPS_REPORT_INTERVAL:
+        print(f"Capture {capture_rate.recent():.1f} fps, processing {processing_rate.recent():.1f} fps, "
+              f"{dropped_frames.count} frames dropped")
+        last_fps_report = time.monotonic()
+
     cv2.imshow('Eye Tracking', frame)
     if cv2.waitKey(1) & 0xFF == ord('q'):
         break
 
+stop_capture.set()
+capture_thread.join()
+log_rows.put(None)
+writer_thread.join()
+if profile and args.refine:
+    save_profile(profile)
+
 print("✅ Eye tracking capture finished.")
+print(f"Average capture {capture_rate.overall():.1f} fps, processing {processing_rate.overall():.1f} fps, "
+      f"{dropped_frames.count} of {capture_rate.count} frames dropped")
+print("AOI dwell and transitions:")
+print(aoi_tracker.summary())
 cap.release()
 cv2.destroyAllWindows()
\ No newline at end of file
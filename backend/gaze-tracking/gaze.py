@@ -4,6 +4,7 @@ import cv2
 import numpy as np
 import requests
 import os
+from aoi import QUADRANT_LAYOUT, load_layout
 
 # Set global variables
 IMG_PATH = "image.jpg"
@@ -62,6 +63,8 @@ def draw_gaze(img: np.ndarray, gaze: dict):
     return img
 
 if __name__ == "__main__":
+    # Center and quadrants of the frame unless GAZE_AOI_CONFIG names another layout
+    aoi_layout = load_layout(default=QUADRANT_LAYOUT)
     cap = cv2.VideoCapture(0)
     
     while True:
@@ -85,20 +88,10 @@ if __name__ == "__main__":
             
             cv2.circle(frame, gaze_point, 25, (0, 0, 255), -1)
             
-            # Define quadrants
-            quadrants = [
-                ("center", (int(image_width / 4), int(image_height / 4), int(image_width / 4 * 3), int(image_height / 4 * 3))),
-                ("top_left", (0, 0, int(image_width / 2), int(image_height / 2))),
-                ("top_right", (int(image_width / 2), 0, image_width, int(image_height / 2))),
-                ("bottom_left", (0, int(image_height / 2), int(image_width / 2), image_height)),
-                ("bottom_right", (int(image_width / 2), int(image_height / 2), image_width, image_height)),
-            ]
-            
-            for quadrant, (x_min, y_min, x_max, y_max) in quadrants:
-                if x_min <= gaze_point[0] <= x_max and y_min <= gaze_point[1] <= y_max:
-                    # Show quadrant in top left of screen
-                    cv2.putText(frame, quadrant, (10, 50), cv2.FONT_HERSHEY_PLAIN, 3, (255, 0, 0), 3)
-                    break
+            aoi = aoi_layout.name_of(int(aoi_layout.classify([gaze_point[0] / image_width], [gaze_point[1] / image_height])[0]))
+            if aoi:
+                # Show the AOI in top left of screen
+                cv2.putText(frame, aoi, (10, 50), cv2.FONT_HERSHEY_PLAIN, 3, (255, 0, 0), 3)
         
         cv2.imshow("Gaze Detection", frame)
         
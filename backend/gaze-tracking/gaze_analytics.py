@@ -0,0 +1,264 @@
+"""
+Offline analytics for eye_tracking.py logs (eye_tracking_data_media.csv and the like).
+
+Each CSV is streamed in chunks and folded into running per-file state, so
+memory stays bounded however large the logs are; files are analyzed in
+parallel worker processes and summarized in a single table.
+
+    python gaze_analytics.py eye_tracking_data_media.csv other_logs/*.csv --output summary.csv
+"""
+import argparse
+import glob
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List
+
+import numpy as np
+import pandas as pd
+
+from gaze_stats import run_lengths
+
+# Same defaults as the live capture in eye_tracking.py
+FIXATION_THRESHOLD = 40  # Pixels between consecutive gaze samples
+BLINK_CONSEC_FRAMES = 2
+EAR_THRESHOLD_RATIO = 0.7  # Blink threshold as a fraction of the calibration EAR
+CALIBRATION_FRAMES = 90  # About 3 seconds of capture
+MIN_FIXATION_SECONDS = 0.1
+# Longer pauses between rows (restarted capture, appended sessions) do not count as time spent
+MAX_FRAME_GAP_SECONDS = 1.0
+CHUNK_ROWS = 100_000
+
+LOG_COLUMNS = ["timestamp", "gaze_x", "gaze_y", "pupil_dilation", "aoi", "ear_value"]
+
+class LogAnalyzer:
+    """
+    Running analytics for one log, fed one chunk at a time.
+
+    Every metric is computed with array operations over the chunk; the only
+    state carried between chunks is the previous frame and any blink,
+    fixation or saccade still in progress at the chunk boundary.
+    """
+
+    def __init__(self, ear_threshold: float | None = None):
+        self.ear_threshold = ear_threshold
+        self.rows = 0
+        self.face_frames = 0
+        self.duration = 0.0
+        # Previous frame, for frame durations and AOI dwell
+        self.prev_time: float | None = None
+        self.prev_aoi: str | None = None
+        self.dwell: Dict[str, float] = {}
+        # Blinks: closed-eye frames in the run still open at the end of the last chunk,
+        # and EAR values waiting for the threshold to be calibrated
+        self.blinks = 0
+        self.closed_run = 0
+        self.calibration_ear = np.empty(0)
+        # Fixations and saccades: previous gaze sample and the movement still in progress
+        self.prev_gaze: np.ndarray | None = None
+        self.prev_gaze_time = 0.0
+        self.fixation_start: float | None = None
+        self.in_saccade = False
+        self.fixations = 0
+        self.fixation_time = 0.0
+        self.fixation_max = 0.0
+        self.saccades = 0
+        self.saccade_distance = 0.0
+        # Pupil dilation: sums for its mean, spread and least-squares trend over time
+        self.pupil_origin: float | None = None
+        self.pupil_sums = np.zeros(6)  # n, sum t, sum y, sum t*t, sum t*y, sum y*y
+
+    def feed(self, chunk: pd.DataFrame):
+        """Fold one chunk of log rows into the running state."""
+        times = pd.to_datetime(chunk["timestamp"], errors="coerce", format="ISO8601")
+        valid = times.notna().to_numpy()
+        self.rows += len(chunk)
+        if not valid.any():
+            return
+        chunk = chunk[valid]
+        t = times[valid].astype("int64").to_numpy() / 1e9
+        gaze = np.column_stack([
+            pd.to_numeric(chunk["gaze_x"], errors="coerce").to_numpy(dtype=float),
+            pd.to_numeric(chunk["gaze_y"], errors="coerce").to_numpy(dtype=float),
+        ])
+        ear = pd.to_numeric(chunk["ear_value"], errors="coerce").to_numpy(dtype=float)
+        pupil = pd.to_numeric(chunk["pupil_dilation"], errors="coerce").to_numpy(dtype=float)
+        aoi = chunk["aoi"].fillna("None").astype(str).to_numpy()
+
+        self._feed_dwell(t, aoi)
+        face = ~np.isnan(ear)
+        self.face_frames += int(face.sum())
+        self._feed_blinks(ear[face])
+        has_gaze = ~np.isnan(gaze).any(axis=1)
+        self._feed_fixations(t[has_gaze], gaze[has_gaze])
+        has_pupil = ~np.isnan(pupil)
+        self._feed_pupil(t[has_pupil], pupil[has_pupil])
+
+    def _feed_dwell(self, t: np.ndarray, aoi: np.ndarray):
+        # Each frame lasts until the next one, so a frame's duration is known once the next arrives
+        prev_times = np.concatenate(([t[0] if self.prev_time is None else self.prev_time], t[:-1]))
+        prev_aois = np.concatenate(([self.prev_aoi or "None"], aoi[:-1]))
+        dt = t - prev_times
+        dt[(dt < 0) | (dt > MAX_FRAME_GAP_SECONDS)] = 0.0
+        self.duration += float(dt.sum())
+        zones, zone_index = np.unique(prev_aois, return_inverse=True)
+        for zone, seconds in zip(zones, np.bincount(zone_index, weights=dt)):
+            self.dwell[zone] = self.dwell.get(zone, 0.0) + float(seconds)
+        self.prev_time, self.prev_aoi = float(t[-1]), aoi[-1]
+
+    def _feed_blinks(self, ear: np.ndarray, final: bool = False):
+        if self.ear_threshold is None:
+            # Calibrate on the first frames with a face, as the live capture does
+            self.calibration_ear = np.concatenate((self.calibration_ear, ear))
+            if len(self.calibration_ear) < CALIBRATION_FRAMES and not final:
+                return
+            if not len(self.calibration_ear):
+                return
+            self.ear_threshold = float(self.calibration_ear[:CALIBRATION_FRAMES].mean() * EAR_THRESHOLD_RATIO)
+            ear, self.calibration_ear = self.calibration_ear, np.empty(0)
+        if not len(ear):
+            return
+        closed = ear < self.ear_threshold
+        runs = run_lengths(closed)
+        if closed[0]:
+            runs[0] += self.closed_run
+        elif self.closed_run >= BLINK_CONSEC_FRAMES:
+            self.blinks += 1  # The eye reopened right at the chunk boundary
+        # A blink is counted when the eye reopens; a run reaching the chunk's end is still open
+        if closed[-1]:
+            self.closed_run = int(runs[-1])
+            runs = runs[:-1]
+        else:
+            self.closed_run = 0
+        self.blinks += int((runs >= BLINK_CONSEC_FRAMES).sum())
+
+    def _feed_fixations(self, t: np.ndarray, gaze: np.ndarray):
+        if not len(t):
+            return
+        if self.prev_gaze is None:
+            self.prev_gaze, self.prev_gaze_time = gaze[0], float(t[0])
+            t, gaze = t[1:], gaze[1:]
+            if not len(t):
+                return
+        # Step i goes from sample i to sample i + 1, sample 0 being the last one of the previous chunk
+        times = np.concatenate(([self.prev_gaze_time], t))
+        steps = np.linalg.norm(np.diff(np.vstack((self.prev_gaze, gaze)), axis=0), axis=1)
+        # A long pause between samples ends any fixation or saccade in progress
+        paused = np.diff(times) > MAX_FRAME_GAP_SECONDS
+        stable = (steps < FIXATION_THRESHOLD) & ~paused
+
+        # Fixations: runs of stable steps, from the run's first sample to its last
+        edges = np.diff(np.concatenate(([0], stable.view(np.int8), [0])))
+        starts, ends = np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+        start_times = times[starts]
+        if self.fixation_start is not None:
+            if len(starts) and starts[0] == 0:
+                start_times[0] = self.fixation_start
+            else:
+                # The fixation in progress ended with the previous chunk's last sample
+                starts, ends = np.concatenate(([0], starts)), np.concatenate(([0], ends))
+                start_times = np.concatenate(([self.fixation_start], start_times))
+        self.fixation_start = None
+        if len(ends) and ends[-1] == len(stable):
+            self.fixation_start = float(start_times[-1])
+            start_times, ends = start_times[:-1], ends[:-1]
+        durations = times[ends] - start_times
+        durations = durations[durations >= MIN_FIXATION_SECONDS]
+        self.fixations += len(durations)
+        self.fixation_time += float(durations.sum())
+        if len(durations):
+            self.fixation_max = max(self.fixation_max, float(durations.max()))
+
+        # Saccades: runs of larger steps; one that continues from the previous chunk is not counted again
+        moving = ~stable & ~paused
+        self.saccades += len(run_lengths(moving)) - int(bool(moving[0] and self.in_saccade))
+        self.saccade_distance += float(steps[moving].sum())
+        self.in_saccade = bool(moving[-1])
+        self.prev_gaze, self.prev_gaze_time = gaze[-1], float(t[-1])
+
+    def _feed_pupil(self, t: np.ndarray, pupil: np.ndarray):
+        if not len(t):
+            return
+        if self.pupil_origin is None:
+            self.pupil_origin = float(t[0])
+        minutes = (t - self.pupil_origin) / 60.0
+        self.pupil_sums += (
+            len(t), minutes.sum(), pupil.sum(),
+            (minutes * minutes).sum(), (minutes * pupil).sum(), (pupil * pupil).sum(),
+        )
+
+    def summary(self) -> Dict[str, Any]:
+        # Logs shorter than the calibration window are calibrated on what they have
+        self._feed_blinks(np.empty(0), final=True)
+        n, st, sy, stt, sty, syy = self.pupil_sums
+        pupil_mean = sy / n if n else None
+        pupil_std = float(np.sqrt(max(syy / n - pupil_mean ** 2, 0.0))) if n else None
+        spread = n * stt - st * st
+        pupil_trend = (n * sty - st * sy) / spread if n > 1 and spread > 0 else None
+        minutes = self.duration / 60.0
+        summary = {
+            "rows": self.rows,
+            "face_frames": self.face_frames,
+            "duration_min": round(minutes, 2),
+            "ear_threshold": round(self.ear_threshold, 3) if self.ear_threshold is not None else None,
+            "blinks": self.blinks,
+            "blink_rate_per_min": round(self.blinks / minutes, 2) if minutes else None,
+            "fixations": self.fixations,
+            "fixation_mean_ms": round(1000 * self.fixation_time / self.fixations, 1) if self.fixations else None,
+            "fixation_max_s": round(self.fixation_max, 2),
+            "fixation_time_pct": round(100 * self.fixation_time / self.duration, 1) if self.duration else None,
+            "saccades": self.saccades,
+            "saccade_mean_px": round(self.saccade_distance / self.saccades, 1) if self.saccades else None,
+            "pupil_mean_pct": round(pupil_mean, 2) if pupil_mean is not None else None,
+            "pupil_std_pct": round(pupil_std, 2) if pupil_std is not None else None,
+            "pupil_trend_pct_per_min": round(pupil_trend, 3) if pupil_trend is not None else None,
+        }
+        for zone, seconds in sorted(self.dwell.items()):
+            summary[f"dwell_{zone}_s"] = round(seconds, 1)
+        return summary
+
+def analyze_log(path: str, chunk_rows: int = CHUNK_ROWS, ear_threshold: float | None = None) -> Dict[str, Any]:
+    """Analyze one log file in chunks of `chunk_rows` rows."""
+    analyzer = LogAnalyzer(ear_threshold)
+    try:
+        chunks = pd.read_csv(
+            path,
+            usecols=lambda column: column in LOG_COLUMNS,
+            dtype=str,
+            chunksize=chunk_rows,
+            on_bad_lines="skip",
+        )
+        for chunk in chunks:
+            # Columns missing from the header (older logs) are treated as empty
+            for column in LOG_COLUMNS:
+                if column not in chunk:
+                    chunk[column] = None
+            analyzer.feed(chunk)
+    except Exception as e:
+        return {"file": path, "error": str(e)}
+    return {"file": path, **analyzer.summary()}
+
+def analyze_logs(paths: List[str], workers: int, chunk_rows: int = CHUNK_ROWS, ear_threshold: float | None = None) -> pd.DataFrame:
+    """Analyze several logs in parallel and return one summary row per file."""
+    if workers <= 1 or len(paths) <= 1:
+        rows = [analyze_log(path, chunk_rows, ear_threshold) for path in paths]
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, len(paths))) as pool:
+            rows = list(pool.map(analyze_log, paths, [chunk_rows] * len(paths), [ear_threshold] * len(paths)))
+    return pd.DataFrame(rows).set_index("file")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Summarize eye_tracking.py CSV logs: blinks, fixations, saccades, pupil trend and AOI dwell.")
+    parser.add_argument("logs", nargs="+", help="CSV log files or glob patterns")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Files analyzed in parallel")
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS, help="Rows read per chunk")
+    parser.add_argument("--ear-threshold", type=float, default=None, help="Blink EAR threshold (default: calibrated per file)")
+    parser.add_argument("--output", help="Also write the summary table to this CSV file")
+    args = parser.parse_args()
+
+    paths = sorted({path for pattern in args.logs for path in (glob.glob(pattern) or [pattern])})
+    table = analyze_logs(paths, args.workers, args.chunk_rows, args.ear_threshold)
+    with pd.option_context("display.max_columns", None, "display.width", 200):
+        print(table.T.to_string())
+    if args.output:
+        table.to_csv(args.output)
+        print(f"Summary written to {args.output}")
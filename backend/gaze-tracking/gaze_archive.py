@@ -0,0 +1,149 @@
+import json
+import os
+import struct
+import zlib
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, Iterator, List, NamedTuple
+
+import numpy as np
+
+from gaze_export import parse_timestamp
+from gaze_stats import GazeColumns, session_to_columns
+
+# Columnar archive of a completed session:
+#   b"GZA1" | uint32 header length | JSON header | padding to 8 bytes | column data
+# The header lists each column's dtype, offset and stored length. Uncompressed
+# columns are read through a memory map; zlib-compressed ones are inflated on read.
+ARCHIVE_SUFFIX = ".gza"
+ARCHIVE_MAGIC = b"GZA1"
+ARCHIVE_COMPRESSIONS = ("none", "zlib")
+ARCHIVE_COLUMNS = (
+    ("timestamp", "<i8"),  # Microseconds since the Unix epoch (UTC), MISSING_TIMESTAMP if unreadable
+    ("eye_count", "u1"),
+    ("point_count", "u1"),
+    ("x", "<f4"),
+    ("y", "<f4"),
+)
+MISSING_TIMESTAMP = np.iinfo(np.int64).min
+EPOCH = datetime(1970, 1, 1)
+
+class ArchivedSession(NamedTuple):
+    timestamps: np.ndarray  # int64 microseconds, one entry per frame
+    columns: GazeColumns
+
+def timestamp_to_micros(timestamp: Any) -> int:
+    """Encode a stored ISO 8601 timestamp as UTC microseconds since the epoch."""
+    try:
+        return (parse_timestamp(timestamp) - EPOCH) // timedelta(microseconds=1)
+    except (TypeError, ValueError):
+        return MISSING_TIMESTAMP
+
+def micros_to_timestamp(micros: int) -> str | None:
+    """Decode an archived timestamp back to the ISO 8601 form written by the capture endpoints."""
+    if micros == MISSING_TIMESTAMP:
+        return None
+    return (EPOCH + timedelta(microseconds=int(micros))).isoformat()
+
+def records_to_archive(records: List[Dict[str, Any]]) -> ArchivedSession:
+    """Convert stored gaze records into archive columns."""
+    timestamps = np.fromiter(
+        (timestamp_to_micros(record.get("timestamp")) for record in records), dtype=np.int64, count=len(records)
+    )
+    return ArchivedSession(timestamps, session_to_columns(records))
+
+def concat_archives(parts: Iterable[ArchivedSession]) -> ArchivedSession:
+    """Join archived sessions end to end, in order."""
+    parts = list(parts)
+    return ArchivedSession(
+        np.concatenate([part.timestamps for part in parts]),
+        GazeColumns(*(np.concatenate(column) for column in zip(*(part.columns for part in parts)))),
+    )
+
+def data_start(header_size: int) -> int:
+    """File offset of the column data, which starts 8-byte aligned after the header."""
+    return (len(ARCHIVE_MAGIC) + 4 + header_size + 7) // 8 * 8
+
+def write_archive(path: str, archive: ArchivedSession, compression: str = "none"):
+    """Write a session archive atomically (temporary file, then rename)."""
+    if compression not in ARCHIVE_COMPRESSIONS:
+        raise ValueError(f"Unsupported archive compression {compression}; use one of {list(ARCHIVE_COMPRESSIONS)}")
+    arrays = {"timestamp": archive.timestamps, **archive.columns._asdict()}
+
+    # Column offsets are relative to the start of the data and 8-byte aligned
+    blobs: List[bytes] = []
+    columns = {}
+    offset = 0
+    for name, dtype in ARCHIVE_COLUMNS:
+        blob = np.ascontiguousarray(arrays[name], dtype=dtype).tobytes()
+        if compression == "zlib":
+            blob = zlib.compress(blob)
+        padding = -len(blob) % 8
+        columns[name] = {"dtype": dtype, "offset": offset, "length": len(blob)}
+        blobs.append(blob + b"\0" * padding)
+        offset += len(blob) + padding
+    header = json.dumps({
+        "frames": len(archive.timestamps),
+        "points": len(archive.columns.x),
+        "compression": compression,
+        "columns": columns,
+    }).encode()
+
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(ARCHIVE_MAGIC + struct.pack("<I", len(header)) + header)
+        f.write(b"\0" * (data_start(len(header)) - f.tell()))
+        f.writelines(blobs)
+    os.replace(tmp_path, path)
+
+def read_archive_header(path: str) -> Dict[str, Any]:
+    """Read an archive's header, with column offsets made absolute."""
+    with open(path, "rb") as f:
+        magic, header_size = struct.unpack("<4sI", f.read(len(ARCHIVE_MAGIC) + 4))
+        if magic != ARCHIVE_MAGIC:
+            raise ValueError(f"{path} is not a gaze session archive")
+        header = json.loads(f.read(header_size))
+    for column in header["columns"].values():
+        column["offset"] += data_start(header_size)
+    return header
+
+def read_archive(path: str) -> ArchivedSession:
+    """
+    Open a session archive.
+
+    Uncompressed columns are zero-copy views of a read-only memory map, so
+    opening an archive costs the same however long the session was.
+    """
+    header = read_archive_header(path)
+    columns = header["columns"]
+    if header["compression"] == "none":
+        mapped = np.memmap(path, dtype=np.uint8, mode="r")
+        arrays = {
+            name: mapped[c["offset"]:c["offset"] + c["length"]].view(c["dtype"]) for name, c in columns.items()
+        }
+    else:
+        with open(path, "rb") as f:
+            raw = f.read()
+        arrays = {
+            name: np.frombuffer(zlib.decompress(raw[c["offset"]:c["offset"] + c["length"]]), dtype=c["dtype"])
+            for name, c in columns.items()
+        }
+    return ArchivedSession(
+        arrays["timestamp"],
+        GazeColumns(arrays["eye_count"], arrays["point_count"], arrays["x"], arrays["y"]),
+    )
+
+def iter_archive_records(archive: ArchivedSession, session_id: str) -> Iterator[Dict[str, Any]]:
+    """Rebuild the stored records of an archived session one at a time."""
+    columns = archive.columns
+    end_offsets = np.cumsum(columns.point_count, dtype=np.int64)
+    start = 0
+    for i, end in enumerate(end_offsets.tolist()):
+        yield {
+            "session_id": session_id,
+            "timestamp": micros_to_timestamp(archive.timestamps[i]),
+            "eye_count": int(columns.eye_count[i]),
+            "gaze_points": [
+                {"x": x, "y": y} for x, y in zip(columns.x[start:end].tolist(), columns.y[start:end].tolist())
+            ],
+        }
+        start = end
@@ -0,0 +1,90 @@
+import csv
+import io
+import json
+from datetime import datetime, timezone
+from typing import Any, AsyncIterator, Dict, List
+
+# Columns available to raw-data exports; gaze_x/gaze_y are the mean of the frame's gaze points
+EXPORT_FIELDS = ("session_id", "timestamp", "eye_count", "gaze_points", "gaze_x", "gaze_y")
+DEFAULT_EXPORT_FIELDS = ("timestamp", "eye_count", "gaze_points")
+EXPORT_FORMATS = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+# Records serialized per streamed chunk
+EXPORT_CHUNK_RECORDS = 500
+
+def parse_fields(fields: str | None) -> List[str]:
+    """Parse a comma-separated field list, rejecting unknown fields."""
+    if not fields:
+        return list(DEFAULT_EXPORT_FIELDS)
+    selected = [field.strip() for field in fields.split(",") if field.strip()]
+    unknown = [field for field in selected if field not in EXPORT_FIELDS]
+    if unknown or not selected:
+        raise ValueError(f"Unknown export fields {unknown}; available fields: {list(EXPORT_FIELDS)}")
+    return selected
+
+def parse_timestamp(timestamp: str) -> datetime:
+    """Parse an ISO 8601 timestamp as naive UTC, the form stored with each record."""
+    parsed = datetime.fromisoformat(timestamp)
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+def in_time_range(record: Dict[str, Any], start: datetime | None, end: datetime | None) -> bool:
+    """Whether a record falls in [start, end); records without a readable timestamp only pass an open range."""
+    if start is None and end is None:
+        return True
+    try:
+        timestamp = parse_timestamp(record["timestamp"])
+    except (KeyError, TypeError, ValueError):
+        return False
+    return (start is None or timestamp >= start) and (end is None or timestamp < end)
+
+def select_fields(record: Dict[str, Any], fields: List[str]) -> Dict[str, Any]:
+    """Project a stored record onto the requested export fields."""
+    points = record.get("gaze_points", [])
+    row = {}
+    for field in fields:
+        if field == "gaze_x":
+            row[field] = sum(p["x"] for p in points) / len(points) if points else None
+        elif field == "gaze_y":
+            row[field] = sum(p["y"] for p in points) / len(points) if points else None
+        else:
+            row[field] = record.get(field)
+    return row
+
+async def export_chunks(
+    records: AsyncIterator[Dict[str, Any]],
+    export_format: str,
+    fields: List[str],
+    start: datetime | None = None,
+    end: datetime | None = None,
+) -> AsyncIterator[str]:
+    """
+    Serialize records as NDJSON or CSV text chunks of EXPORT_CHUNK_RECORDS rows.
+
+    Only one chunk is held in memory at a time, however long the session is.
+    """
+    buffer = io.StringIO()
+    writer = None
+    if export_format == "csv":
+        writer = csv.DictWriter(buffer, fieldnames=fields)
+        writer.writeheader()
+
+    rows = 0
+    async for record in records:
+        if not in_time_range(record, start, end):
+            continue
+        row = select_fields(record, fields)
+        if writer is not None:
+            if "gaze_points" in row:
+                row["gaze_points"] = json.dumps(row["gaze_points"], separators=(",", ":"))
+            writer.writerow(row)
+        else:
+            buffer.write(json.dumps(row, separators=(",", ":")) + "\n")
+        rows += 1
+        if rows % EXPORT_CHUNK_RECORDS == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+
+    if buffer.tell():
+        yield buffer.getvalue()
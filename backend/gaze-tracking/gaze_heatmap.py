@@ -0,0 +1,66 @@
+import asyncio
+import os
+
+import cv2
+import numpy as np
+
+# Resolution of each session's gaze histogram over the normalized frame (bins per axis)
+HEATMAP_BINS = int(os.getenv("GAZE_HEATMAP_BINS", "64"))
+# New samples a session takes before its cached PNG is rendered again
+HEATMAP_RENDER_EVERY = int(os.getenv("GAZE_HEATMAP_RENDER_EVERY", "30"))
+HEATMAP_PNG_SIZE = int(os.getenv("GAZE_HEATMAP_PNG_SIZE", "256"))
+
+class GazeHeatmap:
+    """
+    Fixed-size 2D histogram of a session's gaze points.
+
+    Each sample increments one bin, so keeping the heatmap current costs the
+    same however long the session runs. The rendered PNG is cached and only
+    redrawn once HEATMAP_RENDER_EVERY new samples have arrived.
+    """
+
+    def __init__(self, bins: int = HEATMAP_BINS):
+        self.bins = bins
+        self.counts = np.zeros((bins, bins), dtype=np.uint32)  # Rows are y (top first), columns x
+        self.samples = 0
+        self._png: bytes | None = None
+        self._png_samples = 0
+
+    def _bin(self, value: float) -> int:
+        return min(max(int(value * self.bins), 0), self.bins - 1)
+
+    def add(self, x: float, y: float):
+        """Count one normalized gaze point."""
+        self.counts[self._bin(y), self._bin(x)] += 1
+        self.samples += 1
+
+    def add_many(self, x: np.ndarray, y: np.ndarray):
+        """Count arrays of normalized gaze points at once."""
+        finite = np.isfinite(x) & np.isfinite(y)
+        ix = np.clip((x[finite] * self.bins).astype(np.int64), 0, self.bins - 1)
+        iy = np.clip((y[finite] * self.bins).astype(np.int64), 0, self.bins - 1)
+        self.counts += np.bincount(iy * self.bins + ix, minlength=self.bins * self.bins).reshape(self.bins, self.bins).astype(np.uint32)
+        self.samples += int(np.count_nonzero(finite))
+
+    async def render_png(self) -> bytes:
+        """The heatmap as a PNG, re-rendered (off the event loop) only when the cached one is stale."""
+        if self._png is None or self.samples - self._png_samples >= HEATMAP_RENDER_EVERY:
+            samples, counts = self.samples, self.counts.copy()
+            self._png = await asyncio.to_thread(render_heatmap, counts, HEATMAP_PNG_SIZE)
+            self._png_samples = samples
+        return self._png
+
+def render_heatmap(counts: np.ndarray, size: int) -> bytes:
+    """Render histogram counts as a smoothed, color-mapped PNG of `size` x `size` pixels."""
+    # Log scale so a long fixation does not wash out the rest of the map
+    density = np.log1p(counts.astype(np.float32))
+    density = cv2.resize(density, (size, size), interpolation=cv2.INTER_LINEAR)
+    density = cv2.GaussianBlur(density, (0, 0), sigmaX=size / counts.shape[0])
+    peak = float(density.max())
+    if peak > 0:
+        density /= peak
+    image = cv2.applyColorMap((density * 255).astype(np.uint8), cv2.COLORMAP_JET)
+    ok, png = cv2.imencode(".png", image)
+    if not ok:
+        raise ValueError("Failed to encode heatmap PNG")
+    return png.tobytes()
@@ -0,0 +1,252 @@
+import math
+from typing import Any, Dict, List, NamedTuple, Tuple
+
+import numpy as np
+
+from gaze_heatmap import GazeHeatmap
+
+# Fixation heuristic: consecutive gaze points closer than this (normalized units) are "stable"
+FIXATION_THRESHOLD = 0.05
+MIN_FIXATION_FRAMES = 2  # At least 2 stable steps for a fixation
+
+class GazeColumns(NamedTuple):
+    """A session's gaze records as contiguous per-frame and per-point arrays."""
+    eye_count: np.ndarray  # uint8, one entry per frame
+    point_count: np.ndarray  # uint8, gaze points stored for each frame
+    x: np.ndarray  # float32, one entry per gaze point, in capture order
+    y: np.ndarray  # float32
+
+def session_to_columns(session_data: List[Dict[str, Any]]) -> GazeColumns:
+    """Convert stored gaze records into columnar arrays in a single pass."""
+    frames = len(session_data)
+    eye_count = np.fromiter((entry.get("eye_count", 0) for entry in session_data), dtype=np.uint8, count=frames)
+    point_count = np.fromiter((len(entry.get("gaze_points", [])) for entry in session_data), dtype=np.uint8, count=frames)
+    total_points = int(point_count.sum(dtype=np.int64))
+    x = np.fromiter((p["x"] for entry in session_data for p in entry.get("gaze_points", [])), dtype=np.float32, count=total_points)
+    y = np.fromiter((p["y"] for entry in session_data for p in entry.get("gaze_points", [])), dtype=np.float32, count=total_points)
+    return GazeColumns(eye_count, point_count, x, y)
+
+def frame_gaze(columns: GazeColumns) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Mean gaze point of every frame and whether the frame had eyes detected (otherwise its point is a placeholder)."""
+    frames = len(columns.point_count)
+    frame_index = np.repeat(np.arange(frames), columns.point_count)
+    counts = np.maximum(columns.point_count, 1)
+    x = np.bincount(frame_index, weights=columns.x, minlength=frames) / counts
+    y = np.bincount(frame_index, weights=columns.y, minlength=frames) / counts
+    return x, y, (columns.eye_count > 0) & (columns.point_count > 0)
+
+def stable_steps(x: np.ndarray, y: np.ndarray) -> np.ndarray:
+    """For each step between consecutive gaze points, whether it moved less than FIXATION_THRESHOLD."""
+    return np.hypot(np.diff(x), np.diff(y)) < FIXATION_THRESHOLD
+
+def run_lengths(stable: np.ndarray) -> np.ndarray:
+    """Lengths of the runs of consecutive True values, in order."""
+    edges = np.diff(np.concatenate(([0], stable.view(np.int8), [0])))
+    return np.flatnonzero(edges == -1) - np.flatnonzero(edges == 1)
+
+class GazeAccumulator:
+    """
+    Running gaze statistics for one session, updated one record at a time.
+
+    Holds everything the gaze report needs (frame and eye counts, running
+    mean/variance and range of the gaze points, fixation state machine) and
+    the gaze heatmap, so a report costs the same however long the session ran.
+    """
+
+    def __init__(self):
+        self.total_frames = 0
+        self.valid_frames = 0
+        self.eye_count_total = 0
+        self.point_count = 0
+        self.sum_x = 0.0
+        self.sum_y = 0.0
+        # Welford state for the variance of each axis
+        self._mean_x = 0.0
+        self._mean_y = 0.0
+        self._m2_x = 0.0
+        self._m2_y = 0.0
+        self.min_x = math.inf
+        self.max_x = -math.inf
+        self.min_y = math.inf
+        self.max_y = -math.inf
+        # Fixation state machine
+        self._prev_point = None
+        self._fixation_duration = 0
+        self._fixation_count = 0
+        # Points of frames with eyes detected (not the fallback point)
+        self.heatmap = GazeHeatmap()
+        self.last_timestamp: str | None = None  # Of the latest record, so new ones can be kept in time order
+
+    @classmethod
+    def from_records(cls, records: List[Dict[str, Any]]) -> "GazeAccumulator":
+        accumulator = cls()
+        for record in records:
+            accumulator.update(record)
+        return accumulator
+
+    @classmethod
+    def from_columns(cls, columns: GazeColumns) -> "GazeAccumulator":
+        """Seed an accumulator from a whole session at once with the vectorized kernel."""
+        accumulator = cls()
+        accumulator.total_frames = len(columns.eye_count)
+        accumulator.valid_frames = int(np.count_nonzero(columns.eye_count))
+        accumulator.eye_count_total = int(columns.eye_count.sum(dtype=np.int64))
+        x, y = columns.x.astype(np.float64), columns.y.astype(np.float64)
+        accumulator.point_count = len(x)
+        if len(x):
+            accumulator.sum_x, accumulator.sum_y = float(x.sum()), float(y.sum())
+            accumulator._mean_x, accumulator._mean_y = float(x.mean()), float(y.mean())
+            accumulator._m2_x = float(x.var() * len(x))
+            accumulator._m2_y = float(y.var() * len(y))
+            accumulator.min_x, accumulator.max_x = float(x.min()), float(x.max())
+            accumulator.min_y, accumulator.max_y = float(y.min()), float(y.max())
+            accumulator._prev_point = (float(x[-1]), float(y[-1]))
+
+            stable = stable_steps(columns.x, columns.y)
+            runs = run_lengths(stable)
+            # A run touching the last point is still open and stays in the state machine
+            if len(runs) and stable[-1]:
+                accumulator._fixation_duration = int(runs[-1])
+                runs = runs[:-1]
+            accumulator._fixation_count = int(np.count_nonzero(runs >= MIN_FIXATION_FRAMES))
+
+            detected = np.repeat(columns.eye_count > 0, columns.point_count)
+            accumulator.heatmap.add_many(x[detected], y[detected])
+        return accumulator
+
+    def update(self, record: Dict[str, Any]):
+        """Fold one stored gaze record into the running statistics."""
+        eye_count = record["eye_count"]
+        self.last_timestamp = record.get("timestamp", self.last_timestamp)
+        self.total_frames += 1
+        self.eye_count_total += eye_count
+        if eye_count > 0:
+            self.valid_frames += 1
+
+        for point in record["gaze_points"]:
+            x, y = point["x"], point["y"]
+            self.point_count += 1
+            self.sum_x += x
+            self.sum_y += y
+
+            delta_x = x - self._mean_x
+            self._mean_x += delta_x / self.point_count
+            self._m2_x += delta_x * (x - self._mean_x)
+            delta_y = y - self._mean_y
+            self._mean_y += delta_y / self.point_count
+            self._m2_y += delta_y * (y - self._mean_y)
+
+            self.min_x = min(self.min_x, x)
+            self.max_x = max(self.max_x, x)
+            self.min_y = min(self.min_y, y)
+            self.max_y = max(self.max_y, y)
+
+            if self._prev_point is not None:
+                if math.hypot(x - self._prev_point[0], y - self._prev_point[1]) < FIXATION_THRESHOLD:
+                    self._fixation_duration += 1
+                else:
+                    if self._fixation_duration >= MIN_FIXATION_FRAMES:
+                        self._fixation_count += 1
+                    self._fixation_duration = 0
+            self._prev_point = (x, y)
+            if eye_count > 0:
+                self.heatmap.add(x, y)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Current statistics, in the same shape as `compute_gaze_stats`."""
+        if self.point_count:
+            x_std = math.sqrt(self._m2_x / self.point_count)
+            y_std = math.sqrt(self._m2_y / self.point_count)
+            avg_gaze_x = self.sum_x / self.point_count
+            avg_gaze_y = self.sum_y / self.point_count
+            x_range = (self.min_x, self.max_x)
+            y_range = (self.min_y, self.max_y)
+        else:
+            x_std = y_std = avg_gaze_x = avg_gaze_y = 0
+            x_range = y_range = (0, 0)
+
+        # A fixation still in progress counts as one
+        fixation_count = self._fixation_count
+        if self._fixation_duration >= MIN_FIXATION_FRAMES:
+            fixation_count += 1
+
+        return {
+            "total_frames": self.total_frames,
+            "valid_frames": self.valid_frames,
+            "avg_eye_count": self.eye_count_total / self.total_frames if self.total_frames else 0,
+            "avg_gaze_x": avg_gaze_x,
+            "avg_gaze_y": avg_gaze_y,
+            "x_range": x_range,
+            "y_range": y_range,
+            "x_std": x_std,
+            "y_std": y_std,
+            "gaze_stability": (x_std + y_std) / 2,
+            "fixation_count": fixation_count,
+        }
+
+def compute_gaze_stats(session_data: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Compute the gaze report statistics from scratch over all stored records."""
+    return columnar_gaze_stats(session_to_columns(session_data))
+
+def columnar_gaze_stats(columns: GazeColumns) -> Dict[str, Any]:
+    """Vectorized gaze report statistics over a session's columnar arrays."""
+    total_frames = len(columns.eye_count)
+    x, y = columns.x, columns.y
+
+    if len(x):
+        avg_gaze_x = float(x.mean(dtype=np.float64))
+        avg_gaze_y = float(y.mean(dtype=np.float64))
+        x_range = (float(x.min()), float(x.max()))
+        y_range = (float(y.min()), float(y.max()))
+        # Gaze stability (standard deviation of gaze points)
+        x_std = float(x.std(dtype=np.float64))
+        y_std = float(y.std(dtype=np.float64))
+    else:
+        avg_gaze_x = avg_gaze_y = x_std = y_std = 0
+        x_range = y_range = (0, 0)
+
+    return {
+        "total_frames": total_frames,
+        "valid_frames": int(np.count_nonzero(columns.eye_count)),
+        "avg_eye_count": float(columns.eye_count.sum(dtype=np.int64)) / total_frames if total_frames else 0,
+        "avg_gaze_x": avg_gaze_x,
+        "avg_gaze_y": avg_gaze_y,
+        "x_range": x_range,
+        "y_range": y_range,
+        "x_std": x_std,
+        "y_std": y_std,
+        "gaze_stability": (x_std + y_std) / 2,
+        "fixation_count": int(np.count_nonzero(run_lengths(stable_steps(x, y)) >= MIN_FIXATION_FRAMES)),
+    }
+
+def format_gaze_report(stats: Dict[str, Any]) -> Dict[str, str]:
+    """Render the summary, stats and interpretation texts of a gaze report."""
+    valid_frames = stats["valid_frames"]
+    total_frames = stats["total_frames"]
+    avg_eye_count = stats["avg_eye_count"]
+    avg_gaze_x, avg_gaze_y = stats["avg_gaze_x"], stats["avg_gaze_y"]
+    x_range, y_range = stats["x_range"], stats["y_range"]
+    x_std, y_std = stats["x_std"], stats["y_std"]
+    gaze_stability = stats["gaze_stability"]
+    fixation_count = stats["fixation_count"]
+
+    summary = f"Eye tracking analysis completed: {valid_frames}/{total_frames} frames with eye detections"
+    stats_text = (
+        f"Average eyes detected per frame: {avg_eye_count:.2f}\n"
+        f"Average gaze position: X={avg_gaze_x:.2f}, Y={avg_gaze_y:.2f}\n"
+        f"Gaze range: X={x_range[0]:.2f}-{x_range[1]:.2f}, Y={y_range[0]:.2f}-{y_range[1]:.2f}\n"
+        f"Gaze stability (std dev): X={x_std:.3f}, Y={y_std:.3f}\n"
+        f"Fixation count: {fixation_count}"
+    )
+    interpretation = (
+        f"The gaze tracking data indicates that the user's eyes were detected in {valid_frames} out of {total_frames} frames, "
+        f"with an average of {avg_eye_count:.2f} eyes per frame, suggesting reliable tracking for most of the session. "
+        f"The average gaze position (X={avg_gaze_x:.2f}, Y={avg_gaze_y:.2f}) and range (X={x_range[0]:.2f}-{x_range[1]:.2f}, "
+        f"Y={y_range[0]:.2f}-{y_range[1]:.2f}) indicate that the user's attention was generally centered with moderate movement, "
+        f"reflecting engagement with the visual stimuli.\n\n"
+        f"The gaze stability (standard deviation: X={x_std:.3f}, Y={y_std:.3f}) suggests {'high' if gaze_stability < 0.05 else 'moderate' if gaze_stability < 0.1 else 'low'} "
+        f"consistency in gaze patterns. {'High stability may indicate focused attention or low cognitive load, potentially reflecting a calm state.' if gaze_stability < 0.05 else 'Moderate stability suggests typical engagement with some exploration, possibly indicating curiosity or moderate cognitive processing.' if gaze_stability < 0.1 else 'Low stability may suggest distractibility, high cognitive load, or emotional arousal.'}\n\n"
+        f"The detection of {fixation_count} fixation periods (sequences of stable gaze) suggests {'sustained attention on specific points, possibly indicating deep focus or processing of key information.' if fixation_count > 5 else 'intermittent focus with frequent shifts, potentially reflecting scanning behavior or divided attention.' if fixation_count > 2 else 'minimal sustained focus, which may indicate distraction or lack of engagement.'}\n\n"
+        f"Psychologically, these patterns may correlate with {'a calm and focused state, potentially conducive to effective cognitive processing.' if gaze_stability < 0.05 and fixation_count > 5 else 'a balanced state with active engagement, suitable for learning or interaction.' if gaze_stability < 0.1 and fixation_count > 2 else 'a state of potential stress, distraction, or high cognitive demand, warranting further exploration of emotional or environmental factors.'}"
+    )
+    return {"summary": summary, "stats": stats_text, "interpretation": interpretation}
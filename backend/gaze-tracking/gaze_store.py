@@ -0,0 +1,348 @@
+import asyncio
+import json
+import logging
+import os
+import re
+from typing import Any, AsyncIterator, Dict, List
+
+import aiofiles
+
+from gaze_archive import ARCHIVE_SUFFIX, ArchivedSession, concat_archives, iter_archive_records, read_archive, read_archive_header, records_to_archive, write_archive
+from gaze_stats import GazeColumns
+from session_catalog import SessionCatalog
+
+logger = logging.getLogger(__name__)
+
+# File-based storage for gaze data.
+# Each session is an append-only newline-delimited JSON log (one record per frame),
+# so storing a frame costs the same no matter how long the session has been running.
+DATA_DIR = "gaze_data"
+LOG_SUFFIX = ".ndjson"
+LEGACY_SUFFIX = ".json"  # Pretty-printed JSON arrays written by earlier versions
+# Idle sessions are compacted into a columnar archive (see gaze_archive); frames captured
+# afterwards go to a new log, read after the archive
+MAX_WRITE_RETRIES = 3
+os.makedirs(DATA_DIR, exist_ok=True)
+
+def sanitize_session_id(session_id: str) -> str:
+    """Sanitize session ID to be safe for filenames on all platforms."""
+    # Replace invalid characters (including :, which is invalid on Windows) with _
+    # Allow alphanumeric, -, _, and . for compatibility
+    sanitized = re.sub(r'[^\w\-\.]', '_', session_id)
+    # Remove leading/trailing dots and ensure no double underscores
+    sanitized = sanitized.strip('.').replace('__', '_')
+    if sanitized != session_id:
+        logger.debug(f"Sanitized session ID: {session_id} -> {sanitized}")
+    return sanitized
+
+def session_log_path(session_id: str) -> str:
+    """Path of the append-only log for a session."""
+    return os.path.join(DATA_DIR, f"{sanitize_session_id(session_id)}{LOG_SUFFIX}")
+
+def legacy_session_path(session_id: str) -> str:
+    """Path of a session stored in the old whole-file JSON format."""
+    return os.path.join(DATA_DIR, f"{sanitize_session_id(session_id)}{LEGACY_SUFFIX}")
+
+def count_stored_frames(file_path: str) -> int:
+    """Count the records in a stored session file without keeping it in memory."""
+    if file_path.endswith(LEGACY_SUFFIX):
+        with open(file_path, "r") as f:
+            return len(json.load(f))
+    if file_path.endswith(ARCHIVE_SUFFIX):
+        return read_archive_header(file_path)["frames"]
+    frames = 0
+    with open(file_path, "rb") as f:
+        while chunk := f.read(1 << 20):
+            frames += chunk.count(b"\n")
+    return frames
+
+# Index of stored sessions, updated on every write; loaded from disk at startup
+session_catalog = SessionCatalog(DATA_DIR, (LOG_SUFFIX, LEGACY_SUFFIX, ARCHIVE_SUFFIX), count_stored_frames, ARCHIVE_SUFFIX)
+
+def archive_session_path(session_id: str) -> str:
+    """Path of the columnar archive of a session's older frames."""
+    return os.path.join(DATA_DIR, f"{sanitize_session_id(session_id)}{ARCHIVE_SUFFIX}")
+
+def encode_record(record: Dict[str, Any]) -> str:
+    """Serialize one gaze record as a single NDJSON line."""
+    return json.dumps(record, separators=(",", ":")) + "\n"
+
+async def write_gaze_lines(key: str, lines: List[str]):
+    """Append already-encoded records to a session log (by catalog key) in a single write, with retry logic."""
+    file_path = os.path.join(DATA_DIR, f"{key}{LOG_SUFFIX}")
+    payload = "".join(lines)
+
+    for attempt in range(1, MAX_WRITE_RETRIES + 1):
+        try:
+            async with aiofiles.open(file_path, "a") as f:
+                await f.write(payload)
+            session_catalog.record_write(key, len(lines), len(payload))
+            logger.debug(f"Flushed {len(lines)} gaze records for session {key} to {file_path}")
+            return
+        except Exception as e:
+            logger.error(f"Failed to append gaze data for session {key} on attempt {attempt}: {str(e)}")
+            if attempt == MAX_WRITE_RETRIES:
+                raise
+            await asyncio.sleep(1)  # Wait before retrying without blocking other requests
+
+class GazeWriteBuffer:
+    """
+    Write-behind buffer that group-commits gaze records per session.
+
+    Records are queued in arrival order and written to the session log in one
+    append once a session has `batch_size` pending records, every
+    `flush_interval` seconds, and whenever a flush is requested explicitly
+    (before a report, on shutdown). Records not yet flushed are lost if the
+    process dies. Sessions are keyed by their sanitized ID, the same key the
+    catalog, archiving and deletion use, so all of them share one lock.
+    """
+
+    def __init__(self, batch_size: int, flush_interval: float):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._pending: Dict[str, List[str]] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._flusher: asyncio.Task | None = None
+
+    def pending_count(self, session_id: str) -> int:
+        return len(self._pending.get(sanitize_session_id(session_id), []))
+
+    async def append(self, session_id: str, record: Dict[str, Any]):
+        """Queue a record; flushes the session inline once its batch is full."""
+        await self.append_many(session_id, [record])
+
+    async def append_many(self, session_id: str, records: List[Dict[str, Any]]):
+        """Queue records in order; flushes the session at most once, if its batch is full."""
+        key = sanitize_session_id(session_id)
+        # Queue before the first await so records keep their arrival order
+        pending = self._pending.setdefault(key, [])
+        pending.extend(encode_record(record) for record in records)
+        if len(pending) >= self.batch_size:
+            try:
+                await self.flush_key(key)
+            except Exception as e:
+                # The batch stays queued and is retried by the next flush
+                logger.error(f"Failed to flush gaze data for session {session_id}: {str(e)}")
+
+    def session_lock(self, key: str) -> asyncio.Lock:
+        """Lock held while a session's files are written, compacted or deleted, by catalog key."""
+        return self._locks.setdefault(key, asyncio.Lock())
+
+    async def flush(self, session_id: str):
+        """Write all pending records of a session to its log."""
+        await self.flush_key(sanitize_session_id(session_id))
+
+    async def flush_key(self, key: str):
+        async with self.session_lock(key):
+            await self.write_pending(key)
+
+    async def write_pending(self, key: str):
+        """Write a session's pending records; the caller holds its session lock."""
+        lines = self._pending.pop(key, None)
+        if not lines:
+            return
+        try:
+            await write_gaze_lines(key, lines)
+        except Exception:
+            # Put the batch back in front of anything queued meanwhile so order is preserved
+            self._pending[key] = lines + self._pending.get(key, [])
+            raise
+
+    def discard(self, key: str):
+        """Drop a session's pending records; the caller holds its session lock."""
+        self._pending.pop(key, None)
+
+    async def flush_all(self):
+        for key in list(self._pending):
+            try:
+                await self.flush_key(key)
+            except Exception as e:
+                logger.error(f"Failed to flush gaze data for session {key}: {str(e)}")
+
+    async def _run_flusher(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush_all()
+
+    def start(self):
+        if self._flusher is None:
+            self._flusher = asyncio.create_task(self._run_flusher())
+
+    async def stop(self):
+        """Stop the periodic flusher and write everything still pending."""
+        if self._flusher is not None:
+            self._flusher.cancel()
+            try:
+                await self._flusher
+            except asyncio.CancelledError:
+                pass
+            self._flusher = None
+        await self.flush_all()
+
+gaze_buffer = GazeWriteBuffer(
+    batch_size=int(os.getenv("GAZE_FLUSH_BATCH_SIZE", "32")),
+    flush_interval=float(os.getenv("GAZE_FLUSH_INTERVAL_SECONDS", "1.0")),
+)
+
+def parse_log_lines(lines, session_id: str) -> List[Dict[str, Any]]:
+    """Decode NDJSON lines, skipping a torn trailing line left by an interrupted write."""
+    data = []
+    for line_number, line in enumerate(lines, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            data.append(json.loads(line))
+        except json.JSONDecodeError:
+            logger.warning(f"Skipping corrupt record {line_number} in gaze log for session {session_id}")
+    return data
+
+async def load_gaze_data(session_id: str) -> List[Dict[str, Any]]:
+    """Load all gaze records of a session, in capture order."""
+    try:
+        file_path = session_log_path(session_id)
+        legacy_path = legacy_session_path(session_id)
+        archive_path = archive_session_path(session_id)
+        logger.info(f"Loading gaze data for session {session_id} from {file_path}")
+
+        data: List[Dict[str, Any]] = []
+        # Read all files under the session lock so a concurrent compaction is never seen half done
+        async with gaze_buffer.session_lock(sanitize_session_id(session_id)):
+            if os.path.exists(archive_path):
+                data.extend(iter_archive_records(read_archive(archive_path), session_id))
+            if os.path.exists(legacy_path):
+                async with aiofiles.open(legacy_path, "r") as f:
+                    data.extend(json.loads(await f.read()))
+            log_exists = os.path.exists(file_path)
+            if log_exists:
+                async with aiofiles.open(file_path, "r") as f:
+                    data.extend(parse_log_lines(await f.readlines(), session_id))
+        if not log_exists and not data:
+            logger.warning(f"No gaze data file found for session {session_id} at {file_path}")
+            return []
+
+        logger.info(f"Loaded {len(data)} gaze data entries for session {session_id}")
+        return data
+    except Exception as e:
+        logger.error(f"Failed to load gaze data for session {session_id}: {str(e)}")
+        return []
+
+async def iter_gaze_records(session_id: str) -> AsyncIterator[Dict[str, Any]]:
+    """Yield a session's gaze records in capture order, reading the log one line at a time."""
+    archive_path = archive_session_path(session_id)
+    legacy_path = legacy_session_path(session_id)
+    file_path = session_log_path(session_id)
+    archived, legacy, log = None, [], None
+    # Open every file under the session lock: a compaction replacing the archive and removing the log
+    # afterwards does not affect the open archive map and log handle, so no frame is read twice
+    async with gaze_buffer.session_lock(sanitize_session_id(session_id)):
+        if os.path.exists(archive_path):
+            archived = read_archive(archive_path)
+        if os.path.exists(legacy_path):
+            # Old whole-file sessions can only be read in one piece
+            async with aiofiles.open(legacy_path, "r") as f:
+                legacy = json.loads(await f.read())
+        if os.path.exists(file_path):
+            log = await aiofiles.open(file_path, "r")
+
+    try:
+        if archived is not None:
+            for record in iter_archive_records(archived, session_id):
+                yield record
+        for record in legacy:
+            yield record
+        if log is not None:
+            line_number = 0
+            async for line in log:
+                line_number += 1
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    logger.warning(f"Skipping corrupt record {line_number} in gaze log for session {session_id}")
+                    continue
+                yield record
+    finally:
+        if log is not None:
+            await log.close()
+
+async def load_gaze_timeline(session_id: str) -> ArchivedSession:
+    """
+    Load a session as per-frame timestamps and gaze columns.
+
+    Archived frames are used straight from the memory-mapped archive; only
+    frames captured since the session was archived are parsed.
+    """
+    archive_path = archive_session_path(session_id)
+    if not os.path.exists(archive_path):
+        return records_to_archive(await load_gaze_data(session_id))
+    newer = []
+    file_path = session_log_path(session_id)
+    # The archive and log are read together so a concurrent compaction cannot count frames twice
+    async with gaze_buffer.session_lock(sanitize_session_id(session_id)):
+        try:
+            archived = read_archive(archive_path)
+        except Exception as e:
+            logger.error(f"Failed to read gaze archive for session {session_id}: {str(e)}")
+            return records_to_archive([])
+        if os.path.exists(file_path):
+            async with aiofiles.open(file_path, "r") as f:
+                newer = parse_log_lines(await f.readlines(), session_id)
+    if not newer:
+        return archived
+    return concat_archives([archived, records_to_archive(newer)])
+
+async def load_gaze_columns(session_id: str) -> GazeColumns:
+    """Load a session as gaze columns for statistics."""
+    return (await load_gaze_timeline(session_id)).columns
+
+def _compact_session(key: str, compression: str) -> int:
+    """Merge a session's archive, legacy file and log into a new archive; returns its size."""
+    archive_path = os.path.join(DATA_DIR, f"{key}{ARCHIVE_SUFFIX}")
+    legacy_path = os.path.join(DATA_DIR, f"{key}{LEGACY_SUFFIX}")
+    file_path = os.path.join(DATA_DIR, f"{key}{LOG_SUFFIX}")
+
+    parts = []
+    if os.path.exists(archive_path):
+        parts.append(read_archive(archive_path))
+    records: List[Dict[str, Any]] = []
+    if os.path.exists(legacy_path):
+        with open(legacy_path, "r") as f:
+            records.extend(json.load(f))
+    if os.path.exists(file_path):
+        with open(file_path, "r") as f:
+            records.extend(parse_log_lines(f, key))
+    parts.append(records_to_archive(records))
+
+    write_archive(archive_path, concat_archives(parts), compression)
+    # A crash before the sources are removed would leave their frames both archived and in the log
+    for path in (legacy_path, file_path):
+        if os.path.exists(path):
+            os.remove(path)
+    return os.path.getsize(archive_path)
+
+async def archive_session(key: str, compression: str = "none"):
+    """Compact an idle session into its columnar archive, given its catalog key (sanitized ID)."""
+    async with gaze_buffer.session_lock(key):
+        # Frames still in the write buffer go into the archive too, not into a log about to be removed
+        await gaze_buffer.write_pending(key)
+        byte_size = await asyncio.to_thread(_compact_session, key, compression)
+        session_catalog.mark_archived(key, byte_size)
+
+def session_exists(session_id: str) -> bool:
+    """Whether any gaze data has been stored for a session."""
+    return sanitize_session_id(session_id) in session_catalog
+
+async def delete_session(key: str):
+    """Delete a stored session's files and catalog entry, given its catalog key (sanitized ID)."""
+    async with gaze_buffer.session_lock(key):
+        # Frames still buffered would otherwise recreate the log as an orphan the catalog no longer tracks
+        gaze_buffer.discard(key)
+        for suffix in session_catalog.suffixes:
+            try:
+                os.remove(os.path.join(DATA_DIR, f"{key}{suffix}"))
+            except FileNotFoundError:
+                pass
+        session_catalog.remove(key)
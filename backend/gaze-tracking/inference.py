@@ -0,0 +1,305 @@
+import asyncio
+import multiprocessing
+import os
+import time
+from collections import OrderedDict
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Dict, List, Tuple
+
+import cv2
+import mediapipe as mp
+import numpy as np
+
+from calibration import DEFAULT_EYE_THRESHOLD
+from landmarks import eye_aspect_ratios, iris_centers, landmarks_to_array
+
+# Number of FaceMesh worker processes; 0 runs inference on a single in-process thread instead
+INFERENCE_WORKERS = int(os.getenv("GAZE_INFERENCE_WORKERS", str(max(1, (os.cpu_count() or 2) - 1))))
+
+# Per-session trackers kept by each worker, and how long an unused one stays open
+TRACKERS_PER_WORKER = int(os.getenv("GAZE_TRACKERS_PER_WORKER", "8"))
+TRACKER_IDLE_SECONDS = float(os.getenv("GAZE_TRACKER_IDLE_SECONDS", "60"))
+# Sessions remembered by the router; older sessions are re-assigned if they come back
+MAX_ROUTED_SESSIONS = 4096
+
+# Frames whose longer side is at least twice this are decoded at 1/2, 1/4 or 1/8 scale; 0 disables
+DECODE_TARGET_SIZE = int(os.getenv("GAZE_DECODE_TARGET_SIZE", "640"))
+# Crop around the face found in the previous frame, padded by this fraction of its size on each side
+FACE_ROI_ENABLED = os.getenv("GAZE_FACE_ROI", "1") != "0"
+FACE_ROI_PADDING = float(os.getenv("GAZE_FACE_ROI_PADDING", "0.3"))
+
+# JPEG start-of-frame markers (baseline, progressive, lossless...), which carry the image size
+JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+REDUCED_DECODE_FLAGS = (
+    (8, cv2.IMREAD_REDUCED_COLOR_8),
+    (4, cv2.IMREAD_REDUCED_COLOR_4),
+    (2, cv2.IMREAD_REDUCED_COLOR_2),
+)
+
+def create_face_mesh():
+    """Create a MediaPipe Face Mesh in video (tracking) mode."""
+    return mp.solutions.face_mesh.FaceMesh(
+        max_num_faces=1,
+        refine_landmarks=True,
+        min_detection_confidence=0.5,
+        min_tracking_confidence=0.5
+    )
+
+class SessionTracker:
+    """
+    A session's FaceMesh plus the face region found in its previous frame.
+
+    `roi` is (x0, y0, x1, y1) normalized to the full frame, or None when the
+    face has to be searched for on the whole frame.
+    """
+
+    def __init__(self):
+        self.face_mesh = create_face_mesh()
+        self.roi: Tuple[float, float, float, float] | None = None
+
+    def update_roi(self, points: np.ndarray | None, frame_width: int, frame_height: int):
+        """Move the crop to follow the face, or drop it when the face was lost."""
+        if points is None or not FACE_ROI_ENABLED:
+            self.roi = None
+            return
+        x0, y0 = points.min(axis=0) / (frame_width, frame_height)
+        x1, y1 = points.max(axis=0) / (frame_width, frame_height)
+        # Keep the crop while the face stays inside it with half the padding to spare:
+        # every change of crop makes FaceMesh re-detect instead of tracking
+        margin = 0.5 * FACE_ROI_PADDING * max(x1 - x0, y1 - y0)
+        if self.roi is not None:
+            rx0, ry0, rx1, ry1 = self.roi
+            if rx0 <= x0 - margin and ry0 <= y0 - margin and x1 + margin <= rx1 and y1 + margin <= ry1:
+                return
+        pad = 2 * margin
+        self.roi = (max(0.0, x0 - pad), max(0.0, y0 - pad), min(1.0, x1 + pad), min(1.0, y1 + pad))
+
+    def close(self):
+        self.face_mesh.close()
+
+class TrackerPool:
+    """
+    SessionTrackers keyed by session, owned by one worker.
+
+    FaceMesh keeps temporal state between frames and only takes its cheap
+    landmark-tracking path when consecutive frames show the same face, so every
+    session gets its own instance. At most `capacity` trackers stay open: the
+    least recently used one is closed to make room, and trackers unused for
+    `idle_timeout` seconds are closed as well.
+    """
+
+    def __init__(self, capacity: int, idle_timeout: float):
+        self.capacity = max(1, capacity)
+        self.idle_timeout = idle_timeout
+        self._trackers: "OrderedDict[str, Tuple[SessionTracker, float]]" = OrderedDict()
+
+    def get(self, session_id: str) -> SessionTracker:
+        now = time.monotonic()
+        self.close_idle(now)
+        entry = self._trackers.pop(session_id, None)
+        tracker = entry[0] if entry else SessionTracker()
+        self._trackers[session_id] = (tracker, now)
+        while len(self._trackers) > self.capacity:
+            _, (evicted, _) = self._trackers.popitem(last=False)
+            evicted.close()
+        return tracker
+
+    def close_idle(self, now: float | None = None) -> int:
+        now = time.monotonic() if now is None else now
+        closed = 0
+        # Entries are in least-recently-used order, so stop at the first fresh one
+        while self._trackers:
+            session_id, (tracker, last_used) = next(iter(self._trackers.items()))
+            if now - last_used < self.idle_timeout:
+                break
+            del self._trackers[session_id]
+            tracker.close()
+            closed += 1
+        return closed
+
+    def close_all(self):
+        while self._trackers:
+            _, (tracker, _) = self._trackers.popitem(last=False)
+            tracker.close()
+
+    def __len__(self):
+        return len(self._trackers)
+
+# Trackers owned by the current worker (process, or the single inference thread)
+_trackers = TrackerPool(TRACKERS_PER_WORKER, TRACKER_IDLE_SECONDS)
+
+def close_trackers():
+    """Release this worker's MediaPipe resources."""
+    _trackers.close_all()
+
+def close_idle_trackers() -> int:
+    """Close this worker's idle trackers; returns how many are still open."""
+    _trackers.close_idle()
+    return len(_trackers)
+
+def warm_up() -> int:
+    """Load the MediaPipe model in a worker ahead of the first frame; returns the worker's PID."""
+    create_face_mesh().close()
+    return os.getpid()
+
+def jpeg_size(frame_data: bytes) -> Tuple[int, int] | None:
+    """Read (width, height) from a JPEG header without decoding it; None if it cannot be found."""
+    if frame_data[:2] != b"\xff\xd8":
+        return None
+    i = 2
+    while i + 9 <= len(frame_data):
+        if frame_data[i] != 0xFF:
+            return None
+        marker = frame_data[i + 1]
+        if marker == 0xFF:  # Fill byte
+            i += 1
+            continue
+        if marker in JPEG_SOF_MARKERS:
+            height = int.from_bytes(frame_data[i + 5:i + 7], "big")
+            width = int.from_bytes(frame_data[i + 7:i + 9], "big")
+            return width, height
+        if marker == 0x01 or 0xD0 <= marker <= 0xD7:  # Markers without a length field
+            i += 2
+            continue
+        i += 2 + int.from_bytes(frame_data[i + 2:i + 4], "big")
+    return None
+
+def decode_flags(frame_data: bytes, target_size: int = DECODE_TARGET_SIZE) -> int:
+    """
+    Pick the imdecode mode for a frame.
+
+    Large frames are decoded with libjpeg's DCT scaling, which skips most of
+    the decoding work, at the largest 1/2, 1/4 or 1/8 scale that keeps the
+    longer side at or above `target_size`.
+    """
+    size = jpeg_size(frame_data) if target_size > 0 else None
+    if size:
+        for factor, flags in REDUCED_DECODE_FLAGS:
+            if max(size) >= factor * target_size:
+                return flags
+    return cv2.IMREAD_COLOR
+
+def decode_jpeg(frame_data: bytes, flags: int = cv2.IMREAD_COLOR) -> np.ndarray:
+    """Decode raw JPEG bytes into a BGR image without copying the buffer."""
+    nparr = np.frombuffer(frame_data, np.uint8)
+    img = cv2.imdecode(nparr, flags)
+
+    if img is None:
+        raise ValueError("Failed to decode image")
+    return img
+
+def detect_face(img: np.ndarray, face_mesh) -> np.ndarray | None:
+    """Run MediaPipe on a BGR image; returns the face's (478, 2) pixel landmarks, or None."""
+    img_rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+    results = face_mesh.process(img_rgb)
+    if not results.multi_face_landmarks:
+        return None
+    frame_height, frame_width = img.shape[:2]
+    return landmarks_to_array(results.multi_face_landmarks[0], frame_width, frame_height)
+
+def track_gaze(
+    img: np.ndarray, tracker: SessionTracker, eye_threshold: float = DEFAULT_EYE_THRESHOLD
+) -> Tuple[int, List[Dict[str, float]], float | None]:
+    """
+    Track the face on a BGR frame.
+
+    Returns the eye count, the gaze points normalized to the full frame, and
+    the mean EAR of both eyes (None without a face) for calibration refinement.
+    An eye counts as detected when its EAR is above `eye_threshold`.
+    """
+    frame_height, frame_width = img.shape[:2]
+
+    points = None
+    if tracker.roi is not None:
+        x0, y0, x1, y1 = tracker.roi
+        left, top = int(x0 * frame_width), int(y0 * frame_height)
+        right, bottom = int(np.ceil(x1 * frame_width)), int(np.ceil(y1 * frame_height))
+        points = detect_face(img[top:bottom, left:right], tracker.face_mesh)
+        if points is not None:
+            points += (left, top)  # Back to full-frame pixels
+    if points is None:
+        # No crop yet, or the face left it: search the whole frame
+        points = detect_face(img, tracker.face_mesh)
+    tracker.update_roi(points, frame_width, frame_height)
+
+    eye_count = 0
+    gaze_points = []
+    mean_ear = None
+
+    if points is not None:
+        ears = eye_aspect_ratios(points)
+        centers = iris_centers(points) / (frame_width, frame_height)
+        mean_ear = float(ears.mean())
+
+        # Count eyes (left, then right) if detected (EAR above the client's calibrated threshold)
+        for ear, (x, y) in zip(ears, centers):
+            if ear > eye_threshold:
+                eye_count += 1
+                gaze_points.append({"x": float(x), "y": float(y)})
+
+    # Fallback: add a default gaze point if no eyes detected
+    if not gaze_points:
+        gaze_points.append({"x": 0.5, "y": 0.5})
+
+    return eye_count, gaze_points, mean_ear
+
+def analyze_jpeg(
+    frame_data: bytes, session_id: str, eye_threshold: float = DEFAULT_EYE_THRESHOLD
+) -> Tuple[int, List[Dict[str, float]], float | None]:
+    """Worker entry point: decode a JPEG frame and track gaze on it with the session's tracker."""
+    img = decode_jpeg(frame_data, decode_flags(frame_data))
+    return track_gaze(img, _trackers.get(session_id), eye_threshold)
+
+class InferencePool:
+    """
+    Session-affine pool of FaceMesh workers.
+
+    Each worker is its own single-process executor (or, with 0 workers, one
+    in-process thread) holding a TrackerPool. A session is pinned to the worker
+    that first served it, chosen as the one with the fewest sessions, so its
+    frames always reach the same tracker and are processed in order. Workers
+    receive the compressed JPEG rather than the decoded image, which keeps the
+    payload copied between processes around 30x smaller and moves decoding off
+    the event loop as well.
+    """
+
+    def __init__(self, workers: int):
+        if workers <= 0:
+            # FaceMesh is not thread-safe: a single thread owns the in-process trackers
+            self._workers: List[Executor] = [ThreadPoolExecutor(max_workers=1, thread_name_prefix="facemesh")]
+        else:
+            context = multiprocessing.get_context("spawn")
+            self._workers = [ProcessPoolExecutor(max_workers=1, mp_context=context) for _ in range(workers)]
+        self._routes: "OrderedDict[str, int]" = OrderedDict()
+        self._sessions_per_worker = [0] * len(self._workers)
+
+    def __len__(self):
+        return len(self._workers)
+
+    def worker_for(self, session_id: str) -> int:
+        worker = self._routes.pop(session_id, None)
+        if worker is None:
+            worker = min(range(len(self._workers)), key=self._sessions_per_worker.__getitem__)
+            self._sessions_per_worker[worker] += 1
+            if len(self._routes) >= MAX_ROUTED_SESSIONS:
+                _, forgotten = self._routes.popitem(last=False)
+                self._sessions_per_worker[forgotten] -= 1
+        self._routes[session_id] = worker
+        return worker
+
+    async def analyze(
+        self, frame_data: bytes, session_id: str, eye_threshold: float = DEFAULT_EYE_THRESHOLD
+    ) -> Tuple[int, List[Dict[str, float]], float | None]:
+        """Track gaze on a JPEG frame on the session's worker."""
+        loop = asyncio.get_running_loop()
+        executor = self._workers[self.worker_for(session_id)]
+        return await loop.run_in_executor(executor, analyze_jpeg, frame_data, session_id, eye_threshold)
+
+    async def broadcast(self, fn) -> List[Any]:
+        """Run `fn` once on every worker."""
+        loop = asyncio.get_running_loop()
+        return await asyncio.gather(*(loop.run_in_executor(executor, fn) for executor in self._workers))
+
+    def shutdown(self):
+        for executor in self._workers:
+            executor.shutdown(wait=True)
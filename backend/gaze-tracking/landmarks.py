@@ -0,0 +1,56 @@
+import numpy as np
+
+# MediaPipe Face Mesh landmark indices (refine_landmarks=True gives 478 landmarks)
+NUM_LANDMARKS = 478
+LEFT_EYE_INDICES = [362, 385, 387, 263, 373, 380]
+RIGHT_EYE_INDICES = [33, 160, 158, 133, 153, 144]
+LEFT_IRIS_CENTER = 468
+RIGHT_IRIS_CENTER = 473
+LEFT_IRIS_RADIUS_INDICES = [469, 470, 471, 472]
+RIGHT_IRIS_RADIUS_INDICES = [474, 475, 476, 477]
+
+# Index tables for both eyes at once; axis 0 is (left, right)
+EYE_INDICES = np.array([LEFT_EYE_INDICES, RIGHT_EYE_INDICES])
+IRIS_CENTER_INDICES = np.array([LEFT_IRIS_CENTER, RIGHT_IRIS_CENTER])
+IRIS_RADIUS_INDICES = np.array([LEFT_IRIS_RADIUS_INDICES, RIGHT_IRIS_RADIUS_INDICES])
+
+def landmarks_to_array(face_landmarks, frame_width: int, frame_height: int) -> np.ndarray:
+    """
+    Convert one MediaPipe face result into a (478, 2) array of pixel coordinates.
+
+    This is the only per-landmark Python loop; everything else works on the array.
+    """
+    points = np.fromiter(
+        (c for landmark in face_landmarks.landmark for c in (landmark.x, landmark.y)),
+        dtype=np.float64,
+        count=2 * len(face_landmarks.landmark),
+    ).reshape(-1, 2)
+    points *= (frame_width, frame_height)
+    return points
+
+def to_pixels(points: np.ndarray, frame_width: int, frame_height: int) -> np.ndarray:
+    """Scale normalized (..., 478, 2 or 3) landmarks, e.g. stored for offline reprocessing, to pixels."""
+    return points[..., :2] * (frame_width, frame_height)
+
+def eye_aspect_ratios(points: np.ndarray) -> np.ndarray:
+    """
+    Eye Aspect Ratio (EAR) of both eyes, for blink detection.
+
+    `points` holds pixel landmarks shaped (478, 2) for one frame or (N, 478, 2)
+    for many; the result is shaped (2,) or (N, 2) with columns (left, right).
+    """
+    eyes = points[..., EYE_INDICES, :2]  # (..., 2 eyes, 6 points, 2)
+    v1 = np.linalg.norm(eyes[..., 1, :] - eyes[..., 5, :], axis=-1)
+    v2 = np.linalg.norm(eyes[..., 2, :] - eyes[..., 4, :], axis=-1)
+    h = np.linalg.norm(eyes[..., 0, :] - eyes[..., 3, :], axis=-1)
+    return np.divide(v1 + v2, 2.0 * h, out=np.zeros_like(h), where=h > 0)
+
+def iris_centers(points: np.ndarray) -> np.ndarray:
+    """Iris centres of both eyes, shaped (..., 2 eyes, 2) with rows (left, right)."""
+    return points[..., IRIS_CENTER_INDICES, :2]
+
+def iris_radii(points: np.ndarray) -> np.ndarray:
+    """Mean distance of each iris contour to its centre, shaped (..., 2) with columns (left, right)."""
+    contour = points[..., IRIS_RADIUS_INDICES, :2]  # (..., 2 eyes, 4 points, 2)
+    centers = iris_centers(points)[..., np.newaxis, :]
+    return np.linalg.norm(contour - centers, axis=-1).mean(axis=-1)
@@ -1,18 +1,27 @@
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
+from fastapi import FastAPI, Header, HTTPException, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import Response, StreamingResponse
+from pydantic import BaseModel, field_validator
 import base64
-import cv2
-import numpy as np
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Tuple
+from dataclasses import asdict
 from datetime import datetime
 import logging
 from fastapi.middleware.cors import CORSMiddleware
-import mediapipe as mp
-from scipy.spatial import distance
-import json
 import os
-import re
+import asyncio
 import time
+import sys
+from gaze_store import DATA_DIR, archive_session, delete_session, gaze_buffer, iter_gaze_records, load_gaze_data, load_gaze_timeline, sanitize_session_id, session_catalog, session_exists
+from gaze_export import EXPORT_FORMATS, export_chunks, parse_fields, parse_timestamp
+from gaze_stats import GazeAccumulator, format_gaze_report
+from gaze_archive import micros_to_timestamp
+from aoi import AOILayout, load_layout, summarize_session
+from calibration import CalibrationProfile, ProfileStore
+from inference import INFERENCE_WORKERS, TRACKER_IDLE_SECONDS, InferencePool, close_idle_trackers, close_trackers, warm_up
+
+# Modules shared between the services live in backend/common
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.admission import AdmissionRejected, FrameAdmission
 
 app = FastAPI(title="Eye Tracking API")
 
@@ -29,76 +38,86 @@ app.add_middleware(
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 logger = logging.getLogger(__name__)
 
-# Initialize MediaPipe Face Mesh
-mp_face_mesh = mp.solutions.face_mesh
-face_mesh = mp_face_mesh.FaceMesh(
-    max_num_faces=1,
-    refine_landmarks=True,
-    min_detection_confidence=0.5,
-    min_tracking_confidence=0.5
+# Session-affine pool of FaceMesh workers; the event loop only awaits their results
+inference_pool = InferencePool(INFERENCE_WORKERS)
+
+# Admission control for frame captures: bounded queue, newest frame per session wins;
+# batches take several slots at once or are rejected, WebSocket frames are admitted one by one
+frame_admission = FrameAdmission(
+    max_in_flight=int(os.getenv("GAZE_MAX_IN_FLIGHT", str(max(1, INFERENCE_WORKERS)))),
+    max_queued=int(os.getenv("GAZE_MAX_QUEUED_FRAMES", "32")),
+    deadline=float(os.getenv("GAZE_FRAME_DEADLINE_SECONDS", "1.0")),
 )
 
-# Landmark indices
-LEFT_EYE_INDICES = [362, 385, 387, 263, 373, 380]
-RIGHT_EYE_INDICES = [33, 160, 158, 133, 153, 144]
-LEFT_IRIS_CENTER = 468
-RIGHT_IRIS_CENTER = 473
-
-# File-based storage for gaze data
-DATA_DIR = "gaze_data"
-os.makedirs(DATA_DIR, exist_ok=True)
-
-def sanitize_session_id(session_id: str) -> str:
-    """Sanitize session ID to be safe for filenames on all platforms."""
-    # Replace invalid characters (including :, which is invalid on Windows) with _
-    # Allow alphanumeric, -, _, and . for compatibility
-    sanitized = re.sub(r'[^\w\-\.]', '_', session_id)
-    # Remove leading/trailing dots and ensure no double underscores
-    sanitized = sanitized.strip('.').replace('__', '_')
-    logger.info(f"Sanitized session ID: {session_id} -> {sanitized}")
-    return sanitized
-
-def save_gaze_data(session_id: str, data: List[Dict[str, Any]]):
-    """Save gaze data to a JSON file with retry logic."""
-    max_retries = 3
-    sanitized_id = sanitize_session_id(session_id)
-    file_path = os.path.join(DATA_DIR, f"{sanitized_id}.json")
-    
-    for attempt in range(1, max_retries + 1):
+# Frames a WebSocket stream may have received but not yet processed
+WS_PIPELINE_DEPTH = int(os.getenv("GAZE_WS_PIPELINE_DEPTH", "2"))
+# Upper bound on frames accepted by one batch capture request
+MAX_BATCH_FRAMES = int(os.getenv("GAZE_MAX_BATCH_FRAMES", "120"))
+
+# Stored sessions expire after this long without writes, oldest first once over the disk quota (0 disables either)
+SESSION_TTL_SECONDS = float(os.getenv("GAZE_SESSION_TTL_SECONDS", str(7 * 24 * 3600)))
+DISK_QUOTA_BYTES = int(float(os.getenv("GAZE_DISK_QUOTA_MB", "0")) * 1024 * 1024)
+JANITOR_INTERVAL_SECONDS = float(os.getenv("GAZE_JANITOR_INTERVAL_SECONDS", "300"))
+# Sessions idle this long are compacted into a columnar archive ("none" keeps it memory-mappable, or "zlib")
+ARCHIVE_AFTER_SECONDS = float(os.getenv("GAZE_ARCHIVE_AFTER_SECONDS", "3600"))
+ARCHIVE_COMPRESSION = os.getenv("GAZE_ARCHIVE_COMPRESSION", "none")
+# Running stats (with their heatmap grid) unused this long are dropped and reseeded from disk on next use (0 keeps them)
+STATS_IDLE_SECONDS = float(os.getenv("GAZE_STATS_IDLE_SECONDS", "600"))
+
+# Calibration profiles per user or device; clients that send a profile ID get its eye threshold
+calibration_profiles = ProfileStore(refine=os.getenv("GAZE_REFINE_CALIBRATION", "1") != "0")
+
+# AOI layout for /gaze-aoi-report: GAZE_AOI_CONFIG, else the center and quadrants of the frame
+aoi_layout = load_layout()
+
+# Running report statistics per (sanitized) session ID, updated on every capture
+session_stats: Dict[str, GazeAccumulator] = {}
+_session_stats_loads: Dict[str, asyncio.Task] = {}
+_session_stats_used: Dict[str, float] = {}  # Last access (monotonic time) per session
+
+async def _load_session_stats(session_id: str) -> GazeAccumulator:
+    await gaze_buffer.flush(session_id)
+    timeline = await load_gaze_timeline(session_id)
+    accumulator = GazeAccumulator.from_columns(timeline.columns)
+    if len(timeline.timestamps):
+        accumulator.last_timestamp = micros_to_timestamp(int(timeline.timestamps.max()))
+    return accumulator
+
+async def get_session_stats(session_id: str) -> GazeAccumulator:
+    """Return the session's accumulator, seeding it once from disk (e.g. after a restart)."""
+    key = sanitize_session_id(session_id)
+    _session_stats_used[key] = time.monotonic()
+    accumulator = session_stats.get(key)
+    if accumulator is None:
+        # Concurrent first requests share one load so no capture is folded into a discarded accumulator
+        load = _session_stats_loads.get(key)
+        if load is None:
+            load = asyncio.ensure_future(_load_session_stats(session_id))
+            _session_stats_loads[key] = load
         try:
-            logger.info(f"Saving gaze data for session {session_id} to {file_path}, entries: {len(data)} (attempt {attempt})")
-            # Check file permissions
-            os.makedirs(DATA_DIR, exist_ok=True)
-            with open(file_path, "w") as f:
-                json.dump(data, f, indent=2)
-            logger.info(f"Successfully saved gaze data for session {session_id} to {file_path}")
-            return
-        except Exception as e:
-            logger.error(f"Failed to save gaze data for session {session_id} on attempt {attempt}: {str(e)}")
-            if attempt == max_retries:
-                raise HTTPException(status_code=500, detail=f"Failed to save gaze data after {max_retries} attempts: {str(e)}")
-            time.sleep(1)  # Wait before retrying
-
-def load_gaze_data(session_id: str) -> List[Dict[str, Any]]:
-    """Load gaze data from a JSON file."""
-    try:
-        sanitized_id = sanitize_session_id(session_id)
-        file_path = os.path.join(DATA_DIR, f"{sanitized_id}.json")
-        logger.info(f"Loading gaze data for session {session_id} from {file_path}")
-        if not os.path.exists(file_path):
-            logger.warning(f"No gaze data file found for session {session_id} at {file_path}")
-            return []
-        with open(file_path, "r") as f:
-            data = json.load(f)
-        logger.info(f"Loaded {len(data)} gaze data entries for session {session_id} from {file_path}")
-        return data
-    except Exception as e:
-        logger.error(f"Failed to load gaze data for session {session_id}: {str(e)}")
-        return []
+            accumulator = await load
+        finally:
+            _session_stats_loads.pop(key, None)
+        accumulator = session_stats.setdefault(key, accumulator)
+    return accumulator
+
+def evict_session_stats(key: str):
+    """Drop a session's running stats from memory; they are reseeded from disk if it is used again."""
+    session_stats.pop(key, None)
+    _session_stats_used.pop(key, None)
+
+def evict_idle_session_stats() -> int:
+    """Drop the running stats of sessions unused for STATS_IDLE_SECONDS; returns how many."""
+    cutoff = time.monotonic() - STATS_IDLE_SECONDS
+    idle = [key for key, used_at in _session_stats_used.items() if used_at < cutoff and key not in _session_stats_loads]
+    for key in idle:
+        evict_session_stats(key)
+    return len(idle)
 
 class FrameRequest(BaseModel):
     frame: str  # Base64-encoded JPEG image
     session_id: str
+    profile_id: str | None = None  # Calibration profile of the user or device
 
 class GazeResponse(BaseModel):
     session_id: str
@@ -106,131 +125,332 @@ class GazeResponse(BaseModel):
     eye_count: int
     gaze_points: List[Dict[str, float]]
     error: str | None = None
+    dropped: bool = False  # True if the frame was shed under load and not analyzed
+
+class BatchFrame(BaseModel):
+    frame: str  # Base64-encoded JPEG image
+    timestamp: str | None = None  # Client capture time (ISO 8601); server time if omitted
+
+    @field_validator("timestamp")
+    @classmethod
+    def normalize_timestamp(cls, timestamp: str | None) -> str | None:
+        """Store client times as naive UTC like server times; unparseable values are rejected (422)."""
+        return parse_timestamp(timestamp).isoformat() if timestamp is not None else None
+
+class BatchFrameRequest(BaseModel):
+    session_id: str
+    frames: List[BatchFrame]
+    profile_id: str | None = None
+
+class BatchGazeResponse(BaseModel):
+    session_id: str
+    results: List[GazeResponse]
+
+class CalibrationProfileRequest(BaseModel):
+    ear_mean: float  # Average eye aspect ratio with the eyes open
+    pupil_base_size: float | None = None
 
 class GazeReportRequest(BaseModel):
     session_id: str
+    include_data: bool = False  # Embed every stored frame; prefer /export-gaze-data for raw frames
 
 class GazeReportResponse(BaseModel):
     session_id: str
-    data: List[Dict[str, Any]]
+    data: List[Dict[str, Any]] | None = None
     summary: str
     stats: str
     interpretation: str
     error: str | None = None
 
-def calculate_ear(eye_points):
-    """Calculate Eye Aspect Ratio (EAR) for blink detection."""
-    v1 = distance.euclidean(eye_points[1], eye_points[5])
-    v2 = distance.euclidean(eye_points[2], eye_points[4])
-    h = distance.euclidean(eye_points[0], eye_points[3])
-    return (v1 + v2) / (2.0 * h) if h > 0 else 0
-
-def get_eye_ear(face_landmarks, eye_indices, frame_width, frame_height):
-    """Calculate EAR for a given eye using MediaPipe landmarks."""
-    eye_points = []
-    for index in eye_indices:
-        landmark = face_landmarks.landmark[index]
-        x = landmark.x * frame_width
-        y = landmark.y * frame_height
-        eye_points.append((x, y))
-    return calculate_ear(eye_points)
-
-def get_iris_center(face_landmarks, iris_index, frame_width, frame_height):
-    """Get the center of the iris using MediaPipe landmarks."""
-    landmark = face_landmarks.landmark[iris_index]
-    return (landmark.x * frame_width, landmark.y * frame_height)
+class AOIReportRequest(BaseModel):
+    session_id: str
+    layout: Dict[str, Any] | None = None  # AOI layout in the GAZE_AOI_CONFIG format; the configured layout if omitted
 
-@app.post("/capture-eye-tracking", response_model=GazeResponse)
-async def capture_eye_tracking(request: FrameRequest):
-    """
-    Analyze a video frame for eye tracking using MediaPipe.
-    Expects a base64-encoded JPEG image and session ID.
-    Returns gaze tracking results or an error.
-    """
+class AOIReportResponse(BaseModel):
+    session_id: str
+    frames: int = 0
+    valid_frames: int = 0
+    aois: List[Dict[str, Any]] = []  # Samples and dwell seconds per AOI, in layout order
+    outside_samples: int = 0
+    transitions: List[Dict[str, Any]] = []  # Non-zero AOI-to-AOI transition counts
+    error: str | None = None
+
+def decode_frame(frame: str) -> bytes:
+    """Extract the JPEG bytes from a base64 data URL."""
     try:
-        if not request.session_id:
+        return base64.b64decode(frame.split(",")[1])
+    except Exception as e:
+        raise ValueError(f"Invalid base64 frame data: {str(e)}")
+
+async def run_analyze_frame(img_source: str | bytes, session_id: str, profile_id: str | None = None) -> Tuple[int, List[Dict[str, float]]]:
+    """Track gaze on a frame (data URL or raw JPEG bytes) in the inference pool."""
+    frame_data = img_source if isinstance(img_source, bytes) else decode_frame(img_source)
+    eye_threshold = calibration_profiles.eye_threshold(profile_id)
+    eye_count, gaze_points, ear = await inference_pool.analyze(frame_data, session_id, eye_threshold)
+    calibration_profiles.observe(profile_id, ear)
+    if eye_count == 0:
+        logger.warning(f"No eyes detected for session {session_id}, using fallback gaze point")
+    return eye_count, gaze_points
+
+async def store_gaze_records(session_id: str, records: List[Dict[str, Any]]):
+    """Fold records into the session stats and queue them for storage as one batch."""
+    try:
+        accumulator = await get_session_stats(session_id)
+        # Update stats and queue the records with no await in between so both see the same order
+        for record in records:
+            # The log stays in time order: a record older than the last stored one (e.g. a batch
+            # racing a live capture) is stored at that time instead
+            last = accumulator.last_timestamp
+            if last is not None and parse_timestamp(record["timestamp"]) < parse_timestamp(last):
+                record["timestamp"] = last
+            accumulator.update(record)
+        await gaze_buffer.append_many(session_id, records)
+    except Exception as e:
+        logger.error(f"Failed to store gaze data for session {session_id}: {str(e)}")
+        raise ValueError(f"Data storage error: {str(e)}")
+
+async def process_frame(session_id: str, img_source: str | bytes, profile_id: str | None = None) -> GazeResponse:
+    """Track gaze on one frame (data URL or raw JPEG bytes) and store the result."""
+    try:
+        if not session_id:
             raise ValueError("Session ID is required")
         
-        logger.info(f"Processing frame for session {request.session_id}")
+        logger.info(f"Processing frame for session {session_id}")
 
-        # Decode base64 frame
-        try:
-            frame_data = base64.b64decode(request.frame.split(",")[1])
-        except Exception as e:
-            raise ValueError(f"Invalid base64 frame data: {str(e)}")
-        
-        nparr = np.frombuffer(frame_data, np.uint8)
-        img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-
-        if img is None:
-            raise ValueError("Failed to decode image")
-
-        # Process frame with MediaPipe
-        img_rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-        results = face_mesh.process(img_rgb)
-        frame_height, frame_width = img.shape[:2]
-
-        eye_count = 0
-        gaze_points = []
-
-        if results.multi_face_landmarks:
-            face_landmarks = results.multi_face_landmarks[0]
-            
-            # Process left eye
-            ear_left = get_eye_ear(face_landmarks, LEFT_EYE_INDICES, frame_width, frame_height)
-            left_iris = get_iris_center(face_landmarks, LEFT_IRIS_CENTER, frame_width, frame_height)
-            
-            # Process right eye
-            ear_right = get_eye_ear(face_landmarks, RIGHT_EYE_INDICES, frame_width, frame_height)
-            right_iris = get_iris_center(face_landmarks, RIGHT_IRIS_CENTER, frame_width, frame_height)
-
-            # Count eyes if detected (EAR > 0.1 for robustness)
-            if ear_left > 0.1:
-                eye_count += 1
-                gaze_points.append({"x": left_iris[0] / frame_width, "y": left_iris[1] / frame_height})
-            if ear_right > 0.1:
-                eye_count += 1
-                gaze_points.append({"x": right_iris[0] / frame_width, "y": right_iris[1] / frame_height})
-
-        # Fallback: add a default gaze point if no eyes detected
-        if not gaze_points:
-            gaze_points.append({"x": 0.5, "y": 0.5})
-            logger.warning(f"No eyes detected for session {request.session_id}, using fallback gaze point")
+        eye_count, gaze_points = await run_analyze_frame(img_source, session_id, profile_id)
 
         # Store results
         result = {
-            "session_id": request.session_id,
+            "session_id": session_id,
             "timestamp": datetime.utcnow().isoformat(),
             "eye_count": eye_count,
             "gaze_points": gaze_points,
         }
+        await store_gaze_records(session_id, [result])
 
-        try:
-            gaze_data = load_gaze_data(request.session_id)
-            gaze_data.append(result)
-            save_gaze_data(request.session_id, gaze_data)
-        except Exception as e:
-            logger.error(f"Failed to store gaze data for session {request.session_id}: {str(e)}")
-            raise ValueError(f"Data storage error: {str(e)}")
-
-        logger.info(f"Eye tracking completed for session {request.session_id}, eyes detected: {eye_count}, gaze points: {len(gaze_points)}")
+        logger.info(f"Eye tracking completed for session {session_id}, eyes detected: {eye_count}, gaze points: {len(gaze_points)}")
 
         return GazeResponse(**result)
 
     except Exception as e:
-        logger.error(f"Error processing frame for session {request.session_id}: {str(e)}")
+        logger.error(f"Error processing frame for session {session_id}: {str(e)}")
         return GazeResponse(
-            session_id=request.session_id,
+            session_id=session_id,
             timestamp=datetime.utcnow().isoformat(),
             eye_count=0,
             gaze_points=[{"x": 0.5, "y": 0.5}],
             error=str(e)
         )
 
+async def process_admitted_frame(session_id: str, img_source: str | bytes, profile_id: str | None = None) -> GazeResponse:
+    """Run `process_frame` behind the admission queue, shedding stale frames under load."""
+    try:
+        admitted = await frame_admission.admit(session_id)
+    except AdmissionRejected as e:
+        logger.warning(f"Rejected frame for session {session_id}: {str(e)}")
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "1"})
+    if not admitted:
+        logger.info(f"Dropped stale frame for session {session_id}")
+        return GazeResponse(
+            session_id=session_id,
+            timestamp=datetime.utcnow().isoformat(),
+            eye_count=0,
+            gaze_points=[{"x": 0.5, "y": 0.5}],
+            error="Frame dropped: superseded by a newer frame or not processed before its deadline",
+            dropped=True
+        )
+    try:
+        return await process_frame(session_id, img_source, profile_id)
+    finally:
+        frame_admission.release()
+
+@app.post("/capture-eye-tracking", response_model=GazeResponse)
+async def capture_eye_tracking(request: FrameRequest):
+    """
+    Analyze a video frame for eye tracking using MediaPipe.
+    Expects a base64-encoded JPEG image and session ID.
+    Returns gaze tracking results or an error.
+    """
+    return await process_admitted_frame(request.session_id, request.frame, request.profile_id)
+
+@app.post("/capture-eye-tracking-raw", response_model=GazeResponse)
+async def capture_eye_tracking_raw(request: Request, x_session_id: str = Header(""), x_profile_id: str = Header("")):
+    """
+    Binary variant of /capture-eye-tracking.
+    Expects the JPEG bytes as the request body (application/octet-stream or image/jpeg)
+    and the session ID in the X-Session-ID header, skipping base64 and the data-URL split.
+    An optional X-Profile-ID header selects the calibration profile.
+    """
+    frame_data = await request.body()
+    return await process_admitted_frame(x_session_id, frame_data, x_profile_id or None)
+
+@app.post("/capture-eye-tracking-batch", response_model=BatchGazeResponse)
+async def capture_eye_tracking_batch(request: BatchFrameRequest):
+    """
+    Analyze several buffered frames of one session in capture order.
+    Each frame carries its own capture timestamp; all successfully processed
+    frames are stored with a single storage commit.
+    Returns one gaze tracking result (or error) per frame, in request order.
+    """
+    if not request.session_id:
+        raise HTTPException(status_code=400, detail="Session ID is required")
+    if len(request.frames) > MAX_BATCH_FRAMES:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_BATCH_FRAMES} frames per batch")
+
+    # Frames are appended to the session log, which must stay in time order
+    timestamps = [batch_frame.timestamp or datetime.utcnow().isoformat() for batch_frame in request.frames]
+    capture_times = [parse_timestamp(timestamp) for timestamp in timestamps]
+    if any(later < earlier for earlier, later in zip(capture_times, capture_times[1:])):
+        raise HTTPException(status_code=422, detail="Frame timestamps must be in capture order")
+    last_timestamp = (await get_session_stats(request.session_id)).last_timestamp
+    if capture_times and last_timestamp is not None and capture_times[0] < parse_timestamp(last_timestamp):
+        raise HTTPException(
+            status_code=422,
+            detail=f"Frames must not be older than the session's last stored frame ({last_timestamp})"
+        )
+
+    # A batch holds a slot per frame (up to the whole pool) while it runs, or is rejected outright
+    slots = min(len(request.frames), frame_admission.max_in_flight)
+    try:
+        frame_admission.try_admit(slots)
+    except AdmissionRejected as e:
+        logger.warning(f"Rejected batch of {len(request.frames)} frames for session {request.session_id}: {str(e)}")
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "1"})
+
+    logger.info(f"Processing batch of {len(request.frames)} frames for session {request.session_id}")
+
+    # All frames are queued on the session's worker at once and processed back to back, in order
+    try:
+        outcomes = await asyncio.gather(
+            *(run_analyze_frame(batch_frame.frame, request.session_id, request.profile_id) for batch_frame in request.frames),
+            return_exceptions=True,
+        )
+    finally:
+        frame_admission.release(slots)
+
+    results: List[GazeResponse] = []
+    records: List[Dict[str, Any]] = []
+    for timestamp, outcome in zip(timestamps, outcomes):
+        if isinstance(outcome, Exception):
+            logger.error(f"Error processing batched frame for session {request.session_id}: {str(outcome)}")
+            results.append(GazeResponse(
+                session_id=request.session_id,
+                timestamp=timestamp,
+                eye_count=0,
+                gaze_points=[{"x": 0.5, "y": 0.5}],
+                error=str(outcome)
+            ))
+            continue
+        eye_count, gaze_points = outcome
+        record = {
+            "session_id": request.session_id,
+            "timestamp": timestamp,
+            "eye_count": eye_count,
+            "gaze_points": gaze_points,
+        }
+        records.append(record)
+        results.append(GazeResponse(**record))
+
+    if records:
+        try:
+            await store_gaze_records(request.session_id, records)
+            # A live capture stored meanwhile may have moved frames up to its time
+            stored = iter(records)
+            for result in results:
+                if result.error is None:
+                    result.timestamp = next(stored)["timestamp"]
+        except ValueError as e:
+            # Frames were analyzed but not stored: report it on every result that would have been
+            for result in results:
+                if result.error is None:
+                    result.error = str(e)
+
+    logger.info(f"Batch eye tracking completed for session {request.session_id}: {len(records)}/{len(request.frames)} frames processed")
+
+    return BatchGazeResponse(session_id=request.session_id, results=results)
+
+@app.websocket("/ws/eye-tracking/{session_id}")
+async def eye_tracking_stream(websocket: WebSocket, session_id: str, profile_id: str | None = None):
+    """
+    Streaming capture channel for continuous gaze frames.
+    The calibration profile is selected with the optional `profile_id` query parameter.
+    The client sends binary JPEG frames; for each one the server replies with a
+    compact JSON message {"seq", "timestamp", "eye_count", "gaze_points": [[x, y], ...]}
+    or {"seq", "error"} ({"seq", "error", "dropped": true} if shed by admission control).
+    Frames are received while the previous one is in FaceMesh;
+    results are stored exactly like /capture-eye-tracking results.
+    """
+    await websocket.accept()
+    logger.info(f"Eye tracking stream opened for session {session_id}")
+    frames: asyncio.Queue = asyncio.Queue(maxsize=WS_PIPELINE_DEPTH)
+
+    async def receive_frames():
+        try:
+            while True:
+                message = await websocket.receive()
+                if message["type"] == "websocket.disconnect":
+                    break
+                if message.get("bytes") is not None:
+                    await frames.put(message["bytes"])
+        except Exception as e:
+            logger.warning(f"Eye tracking stream receive failed for session {session_id}: {str(e)}")
+        # Not reached when the handler cancels us: nobody would drain a full queue to take the marker
+        await frames.put(None)
+
+    receiver = asyncio.create_task(receive_frames())
+    seq = 0
+    try:
+        while (frame_data := await frames.get()) is not None:
+            seq += 1
+            # Streamed frames pass the same admission queue as single-frame captures
+            try:
+                admitted = await frame_admission.admit(session_id)
+            except AdmissionRejected as e:
+                logger.warning(f"Rejected streamed frame for session {session_id}: {str(e)}")
+                await websocket.send_json({"seq": seq, "error": str(e), "dropped": True})
+                continue
+            if not admitted:
+                logger.info(f"Dropped stale streamed frame for session {session_id}")
+                await websocket.send_json({"seq": seq, "error": "Frame dropped: not processed before its deadline", "dropped": True})
+                continue
+            try:
+                eye_count, gaze_points = await run_analyze_frame(frame_data, session_id, profile_id)
+                result = {
+                    "session_id": session_id,
+                    "timestamp": datetime.utcnow().isoformat(),
+                    "eye_count": eye_count,
+                    "gaze_points": gaze_points,
+                }
+                await store_gaze_records(session_id, [result])
+                reply = {
+                    "seq": seq,
+                    "timestamp": result["timestamp"],
+                    "eye_count": eye_count,
+                    "gaze_points": [[p["x"], p["y"]] for p in gaze_points],
+                }
+            except Exception as e:
+                logger.error(f"Error processing streamed frame for session {session_id}: {str(e)}")
+                reply = {"seq": seq, "error": str(e)}
+            finally:
+                frame_admission.release()
+            await websocket.send_json(reply)
+    except WebSocketDisconnect:
+        pass
+    except Exception as e:
+        logger.error(f"Eye tracking stream failed for session {session_id}: {str(e)}")
+    finally:
+        receiver.cancel()
+        try:
+            await receiver
+        except asyncio.CancelledError:
+            pass
+        logger.info(f"Eye tracking stream closed for session {session_id} after {seq} frames")
+
 @app.post("/generate-gaze-report", response_model=GazeReportResponse)
 async def generate_gaze_report(request: GazeReportRequest):
     """
     Generate a summary report for a session's gaze tracking data with psychological interpretation.
+    The stored frames are only embedded when `include_data` is set; use /export-gaze-data to fetch them instead.
     """
     try:
         if not request.session_id:
@@ -239,19 +459,20 @@ async def generate_gaze_report(request: GazeReportRequest):
 
         logger.info(f"Generating gaze report for session {request.session_id}")
 
-        # Load gaze data
-        session_data = load_gaze_data(request.session_id)
-        
-        if not session_data:
-            available_sessions = [f.replace(".json", "") for f in os.listdir(DATA_DIR) if f.endswith(".json")]
-            error_msg = f"No gaze data available for session {request.session_id}. Available sessions: {available_sessions}"
+        # Include frames still waiting in the write buffer
+        await gaze_buffer.flush(request.session_id)
+
+        if not session_exists(request.session_id):
+            error_msg = f"No gaze data available for session {request.session_id} ({len(session_catalog)} sessions stored)"
             logger.warning(error_msg)
             raise HTTPException(status_code=404, detail=error_msg)
 
-        # Calculate summary statistics
-        total_frames = len(session_data)
-        valid_frames = sum(1 for entry in session_data if entry["eye_count"] > 0)
-        
+        # Report statistics come from the running accumulator, not a rescan of the session
+        accumulator = await get_session_stats(request.session_id)
+        stats = accumulator.snapshot()
+        session_data = await load_gaze_data(request.session_id) if request.include_data else None
+        valid_frames, total_frames = stats["valid_frames"], stats["total_frames"]
+
         if valid_frames == 0:
             logger.warning(f"No valid frames with eye detections for session {request.session_id}")
             return GazeReportResponse(
@@ -263,66 +484,16 @@ async def generate_gaze_report(request: GazeReportRequest):
                 error="No valid frames with eye detections"
             )
 
-        avg_eye_count = sum(entry["eye_count"] for entry in session_data) / total_frames
-        gaze_points = [p for entry in session_data for p in entry["gaze_points"]]
-        avg_gaze_x = sum(p["x"] for p in gaze_points) / len(gaze_points) if gaze_points else 0
-        avg_gaze_y = sum(p["y"] for p in gaze_points) / len(gaze_points) if gaze_points else 0
-        x_range = (min(p["x"] for p in gaze_points), max(p["x"] for p in gaze_points)) if gaze_points else (0, 0)
-        y_range = (min(p["y"] for p in gaze_points), max(p["y"] for p in gaze_points)) if gaze_points else (0, 0)
-
-        # Calculate gaze stability (standard deviation of gaze points)
-        x_std = np.std([p["x"] for p in gaze_points]) if gaze_points else 0
-        y_std = np.std([p["y"] for p in gaze_points]) if gaze_points else 0
-        gaze_stability = (x_std + y_std) / 2
-
-        # Detect fixation patterns (simple heuristic: count consecutive frames with small movement)
-        fixation_threshold = 0.05  # Max movement for fixation (normalized units)
-        fixation_count = 0
-        fixation_duration = 0
-        prev_point = None
-        for entry in session_data:
-            for point in entry["gaze_points"]:
-                if prev_point:
-                    dist = distance.euclidean((point["x"], point["y"]), (prev_point["x"], prev_point["y"]))
-                    if dist < fixation_threshold:
-                        fixation_duration += 1
-                    else:
-                        if fixation_duration >= 2:  # At least 2 frames for a fixation
-                            fixation_count += 1
-                        fixation_duration = 0
-                prev_point = point
-        if fixation_duration >= 2:
-            fixation_count += 1
-
-        # Generate report
-        summary = f"Eye tracking analysis completed: {valid_frames}/{total_frames} frames with eye detections"
-        stats = (
-            f"Average eyes detected per frame: {avg_eye_count:.2f}\n"
-            f"Average gaze position: X={avg_gaze_x:.2f}, Y={avg_gaze_y:.2f}\n"
-            f"Gaze range: X={x_range[0]:.2f}-{x_range[1]:.2f}, Y={y_range[0]:.2f}-{y_range[1]:.2f}\n"
-            f"Gaze stability (std dev): X={x_std:.3f}, Y={y_std:.3f}\n"
-            f"Fixation count: {fixation_count}"
-        )
-        interpretation = (
-            f"The gaze tracking data indicates that the user's eyes were detected in {valid_frames} out of {total_frames} frames, "
-            f"with an average of {avg_eye_count:.2f} eyes per frame, suggesting reliable tracking for most of the session. "
-            f"The average gaze position (X={avg_gaze_x:.2f}, Y={avg_gaze_y:.2f}) and range (X={x_range[0]:.2f}-{x_range[1]:.2f}, "
-            f"Y={y_range[0]:.2f}-{y_range[1]:.2f}) indicate that the user's attention was generally centered with moderate movement, "
-            f"reflecting engagement with the visual stimuli.\n\n"
-            f"The gaze stability (standard deviation: X={x_std:.3f}, Y={y_std:.3f}) suggests {'high' if gaze_stability < 0.05 else 'moderate' if gaze_stability < 0.1 else 'low'} "
-            f"consistency in gaze patterns. {'High stability may indicate focused attention or low cognitive load, potentially reflecting a calm state.' if gaze_stability < 0.05 else 'Moderate stability suggests typical engagement with some exploration, possibly indicating curiosity or moderate cognitive processing.' if gaze_stability < 0.1 else 'Low stability may suggest distractibility, high cognitive load, or emotional arousal.'}\n\n"
-            f"The detection of {fixation_count} fixation periods (sequences of stable gaze) suggests {'sustained attention on specific points, possibly indicating deep focus or processing of key information.' if fixation_count > 5 else 'intermittent focus with frequent shifts, potentially reflecting scanning behavior or divided attention.' if fixation_count > 2 else 'minimal sustained focus, which may indicate distraction or lack of engagement.'}\n\n"
-            f"Psychologically, these patterns may correlate with {'a calm and focused state, potentially conducive to effective cognitive processing.' if gaze_stability < 0.05 and fixation_count > 5 else 'a balanced state with active engagement, suitable for learning or interaction.' if gaze_stability < 0.1 and fixation_count > 2 else 'a state of potential stress, distraction, or high cognitive demand, warranting further exploration of emotional or environmental factors.'}"
-        )
+        report = format_gaze_report(stats)
 
         logger.info(f"Gaze report generated for session {request.session_id}: {valid_frames}/{total_frames} valid frames")
 
         return GazeReportResponse(
             session_id=request.session_id,
             data=session_data,
-            summary=summary,
-            stats=stats,
-            interpretation=interpretation
+            summary=report["summary"],
+            stats=report["stats"],
+            interpretation=report["interpretation"]
         )
 
     except HTTPException as e:
@@ -331,24 +502,180 @@ async def generate_gaze_report(request: GazeReportRequest):
         logger.error(f"Error generating gaze report for session {request.session_id}: {str(e)}")
         return GazeReportResponse(
             session_id=request.session_id,
-            data=[],
             summary="",
             stats="",
             interpretation="",
             error=str(e)
         )
 
+@app.post("/gaze-aoi-report", response_model=AOIReportResponse)
+async def generate_aoi_report(request: AOIReportRequest):
+    """
+    Map a session's gaze onto areas of interest: samples and dwell time per AOI, and transitions between AOIs.
+    Pass `layout` to use AOIs other than the configured ones (e.g. the elements of the assessment page).
+    """
+    try:
+        layout = AOILayout.from_config(request.layout) if request.layout is not None else aoi_layout
+    except (TypeError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid AOI layout: {str(e)}")
+
+    await gaze_buffer.flush(request.session_id)
+    if not session_exists(request.session_id):
+        error_msg = f"No gaze data available for session {request.session_id}"
+        logger.warning(error_msg)
+        raise HTTPException(status_code=404, detail=error_msg)
+
+    try:
+        timeline = await load_gaze_timeline(request.session_id)
+        report = await asyncio.to_thread(summarize_session, layout, timeline)
+        logger.info(f"AOI report for session {request.session_id}: {report['frames']} frames over {len(layout)} AOIs")
+        return AOIReportResponse(session_id=request.session_id, **report)
+    except Exception as e:
+        logger.error(f"Error generating AOI report for session {request.session_id}: {str(e)}")
+        return AOIReportResponse(session_id=request.session_id, error=str(e))
+
+@app.get("/gaze-heatmap/{session_id}")
+async def gaze_heatmap(session_id: str, format: str = "json"):
+    """
+    A session's gaze heatmap, kept up to date on every capture: histogram counts over the
+    normalized frame (rows top to bottom) as JSON, or a rendered PNG with `format=png`.
+    """
+    if format not in ("json", "png"):
+        raise HTTPException(status_code=400, detail=f"Unsupported heatmap format {format}; use json or png")
+    # Frames still in the write buffer are already in the running stats
+    if sanitize_session_id(session_id) not in session_stats and not session_exists(session_id):
+        error_msg = f"No gaze data available for session {session_id}"
+        logger.warning(error_msg)
+        raise HTTPException(status_code=404, detail=error_msg)
+
+    try:
+        heatmap = (await get_session_stats(session_id)).heatmap
+        if format == "png":
+            return Response(content=await heatmap.render_png(), media_type="image/png", headers={"Cache-Control": "no-cache"})
+        return {"session_id": session_id, "bins": heatmap.bins, "samples": heatmap.samples, "counts": heatmap.counts.tolist()}
+    except Exception as e:
+        logger.error(f"Error building gaze heatmap for session {session_id}: {str(e)}")
+        return {"session_id": session_id, "error": str(e)}
+
+@app.get("/export-gaze-data/{session_id}")
+async def export_gaze_data(
+    session_id: str,
+    format: str = "ndjson",
+    fields: str | None = None,
+    start: str | None = None,
+    end: str | None = None,
+):
+    """
+    Stream a session's raw gaze frames as NDJSON or CSV.
+    `fields` is a comma-separated column list (timestamp, eye_count and gaze_points by default);
+    `start`/`end` are ISO 8601 timestamps bounding the export to [start, end).
+    """
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unsupported export format {format}; use one of {list(EXPORT_FORMATS)}")
+    try:
+        selected_fields = parse_fields(fields)
+        start_time = parse_timestamp(start) if start else None
+        end_time = parse_timestamp(end) if end else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    await gaze_buffer.flush(session_id)
+    if not session_exists(session_id):
+        error_msg = f"No gaze data available for session {session_id}"
+        logger.warning(error_msg)
+        raise HTTPException(status_code=404, detail=error_msg)
+
+    logger.info(f"Exporting gaze data for session {session_id} as {format} with fields {selected_fields}")
+    filename = f"{sanitize_session_id(session_id)}.{format}"
+    return StreamingResponse(
+        export_chunks(iter_gaze_records(session_id), format, selected_fields, start_time, end_time),
+        media_type=EXPORT_FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+@app.get("/calibration-profiles/{profile_id}")
+async def get_calibration_profile(profile_id: str):
+    """Return a calibration profile, including its current eye-detection threshold."""
+    profile = calibration_profiles.get(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail=f"No calibration profile {profile_id}")
+    return {**asdict(profile), "eye_threshold": profile.eye_threshold, "blink_threshold": profile.blink_threshold}
+
+@app.put("/calibration-profiles/{profile_id}")
+async def put_calibration_profile(profile_id: str, request: CalibrationProfileRequest):
+    """Create or replace a calibration profile, e.g. one measured by eye_tracking.py."""
+    profile = CalibrationProfile(profile_id, request.ear_mean, request.pupil_base_size, samples=1, updated_at=time.time())
+    calibration_profiles.put(profile)
+    await calibration_profiles.save_dirty()
+    logger.info(f"Stored calibration profile {profile_id}: EAR {request.ear_mean:.3f}")
+    return {**asdict(profile), "eye_threshold": profile.eye_threshold, "blink_threshold": profile.blink_threshold}
+
 @app.get("/debug/sessions")
-async def list_sessions():
-    """Debug endpoint to list all stored session IDs."""
+async def list_sessions(after: str | None = None, limit: int = 100):
+    """
+    Debug endpoint listing stored sessions from the catalog, in session ID order.
+    Pass the returned `next_after` as `after` to fetch the next page.
+    """
     try:
-        sessions = [f.replace(".json", "") for f in os.listdir(DATA_DIR) if f.endswith(".json")]
-        logger.info(f"Listing sessions: {sessions}")
-        return {"sessions": sessions}
+        sessions, next_after = session_catalog.page(after, max(1, min(limit, 1000)))
+        logger.info(f"Listing {len(sessions)} of {len(session_catalog)} sessions")
+        return {
+            "sessions": [asdict(info) for info in sessions],
+            "next_after": next_after,
+            "total": len(session_catalog),
+            "total_bytes": session_catalog.total_bytes,
+        }
     except Exception as e:
         logger.error(f"Error listing sessions: {str(e)}")
         return {"error": str(e), "sessions": []}
 
+@app.get("/debug/admission")
+async def admission_stats():
+    """Debug endpoint exposing capture queue depth and drop counters."""
+    return frame_admission.stats()
+
+async def sweep_idle_trackers():
+    """Periodically close per-session trackers that workers have not used for a while."""
+    while True:
+        await asyncio.sleep(TRACKER_IDLE_SECONDS)
+        try:
+            open_trackers = await inference_pool.broadcast(close_idle_trackers)
+            logger.debug(f"Open FaceMesh trackers per worker: {open_trackers}")
+        except Exception as e:
+            logger.error(f"Failed to sweep idle trackers: {str(e)}")
+
+async def expire_sessions():
+    """
+    Periodically delete sessions past their TTL or over the disk quota,
+    archive idle ones, and save the catalog.
+    """
+    while True:
+        await asyncio.sleep(JANITOR_INTERVAL_SECONDS)
+        try:
+            for key in session_catalog.expired(SESSION_TTL_SECONDS, DISK_QUOTA_BYTES):
+                await delete_session(key)
+                evict_session_stats(key)
+                logger.info(f"Expired gaze session {key}")
+            if ARCHIVE_AFTER_SECONDS > 0:
+                for key in session_catalog.archive_candidates(ARCHIVE_AFTER_SECONDS):
+                    try:
+                        await archive_session(key, ARCHIVE_COMPRESSION)
+                        evict_session_stats(key)
+                        logger.info(f"Archived gaze session {key}")
+                    except Exception as e:
+                        logger.error(f"Failed to archive gaze session {key}: {str(e)}")
+            if STATS_IDLE_SECONDS > 0 and (evicted := evict_idle_session_stats()):
+                logger.info(f"Dropped running stats of {evicted} idle gaze session(s)")
+            if SESSION_TTL_SECONDS > 0:
+                calibration_profiles.expire_calibrations(SESSION_TTL_SECONDS)
+            await session_catalog.save()
+            await calibration_profiles.save_dirty()
+        except Exception as e:
+            logger.error(f"Failed to expire gaze sessions: {str(e)}")
+
+tracker_sweeper: asyncio.Task | None = None
+session_janitor: asyncio.Task | None = None
+
 @app.on_event("startup")
 async def startup_event():
     """Log startup and ensure data directory exists."""
@@ -360,19 +687,31 @@ async def startup_event():
     except Exception as e:
         logger.error(f"Failed to create data directory {DATA_DIR}: {str(e)}")
         raise
+    session_catalog.load()
+    calibration_profiles.load()
+    gaze_buffer.start()
+
+    # Start the inference workers and load their models before the first frame arrives
+    worker_pids = await inference_pool.broadcast(warm_up)
+    logger.info(f"Inference pool ready with {len(set(worker_pids))} FaceMesh worker(s)")
+    global tracker_sweeper, session_janitor
+    tracker_sweeper = asyncio.create_task(sweep_idle_trackers())
+    session_janitor = asyncio.create_task(expire_sessions())
 
 @app.on_event("shutdown")
 async def shutdown_event():
-    """Release MediaPipe resources and clean up."""
-    face_mesh.close()
+    """Flush buffered gaze data, save the session catalog and release MediaPipe resources."""
+    session_janitor.cancel()
+    await gaze_buffer.stop()
+    try:
+        await session_catalog.save()
+    except Exception as e:
+        logger.error(f"Failed to save session catalog: {str(e)}")
+    await calibration_profiles.save_dirty()
+    tracker_sweeper.cancel()
+    await inference_pool.broadcast(close_trackers)
+    inference_pool.shutdown()
     logger.info("MediaPipe resources released")
-    for file in os.listdir(DATA_DIR):
-        file_path = os.path.join(DATA_DIR, file)
-        try:
-            os.remove(file_path)
-            logger.info(f"Cleaned up session file {file_path}")
-        except Exception as e:
-            logger.error(f"Failed to clean up {file_path}: {str(e)}")
 
 if __name__ == "__main__":
     import uvicorn
@@ -5,6 +5,7 @@ from langchain_community.embeddings import CohereEmbeddings
 from groq import AsyncGroq
 from rich.console import Console
 from typing import List, Dict, Any
+from gaze_stats import session_to_columns
 
 # Load env variables
 load_dotenv()
@@ -38,15 +39,16 @@ def summarize_gaze_data(gaze_data: List[Dict[str, Any]]) -> str:
     if not gaze_data:
         return "No gaze data available."
     
-    eye_counts = [d.get("eye_count", 0) for d in gaze_data]
-    gaze_points = [p for d in gaze_data for p in d.get("gaze_points", [])]
+    columns = session_to_columns(gaze_data)
+    avg_eye_count = columns.eye_count.mean(dtype=float)
+    sample_points = [{"x": float(x), "y": float(y)} for x, y in zip(columns.x[:3], columns.y[:3])]
     
     summary = f"""
 Gaze Data Summary:
 - Total frames processed: {len(gaze_data)}
-- Average eyes detected per frame: {sum(eye_counts) / len(eye_counts):.2f} if eye_counts else 0
-- Total gaze points: {len(gaze_points)}
-- Sample gaze points: {gaze_points[:3] if gaze_points else 'None'}
+- Average eyes detected per frame: {avg_eye_count:.2f}
+- Total gaze points: {len(columns.x)}
+- Sample gaze points: {sample_points if sample_points else 'None'}
 """
     return summary.strip()
 
@@ -55,18 +57,15 @@ def analyze_gaze_data(gaze_data: List[Dict[str, Any]]) -> str:
     if not gaze_data:
         return "No analysis possible due to missing data."
     
-    eye_counts = [d.get("eye_count", 0) for d in gaze_data]
-    gaze_points = [p for d in gaze_data for p in d.get("gaze_points", [])]
+    columns = session_to_columns(gaze_data)
     
     analysis = []
-    avg_eye_count = sum(eye_counts) / len(eye_counts) if eye_counts else 0
+    avg_eye_count = columns.eye_count.mean(dtype=float)
     analysis.append(f"- Average eye count: {avg_eye_count:.2f}")
-    analysis.append(f"- Total gaze points: {len(gaze_points)}")
+    analysis.append(f"- Total gaze points: {len(columns.x)}")
     
-    if gaze_points:
-        x_coords = [p["x"] for p in gaze_points]
-        y_coords = [p["y"] for p in gaze_points]
-        analysis.append(f"- Gaze point range: X({min(x_coords)}-{max(x_coords)}), Y({min(y_coords)}-{max(y_coords)})")
+    if len(columns.x):
+        analysis.append(f"- Gaze point range: X({columns.x.min()}-{columns.x.max()}), Y({columns.y.min()}-{columns.y.max()})")
     
     return "\n".join(analysis)
 
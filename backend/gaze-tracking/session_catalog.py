@@ -0,0 +1,168 @@
+import bisect
+import json
+import logging
+import os
+import time
+from dataclasses import asdict, dataclass
+from typing import Any, Callable, Dict, List, Tuple
+
+import aiofiles
+
+logger = logging.getLogger(__name__)
+
+CATALOG_FILE = "catalog.idx"  # Kept in the data directory; its suffix never matches a session file
+
+@dataclass
+class SessionInfo:
+    session_id: str
+    created_at: float  # Unix time of the first stored frame
+    last_write_at: float
+    frame_count: int = 0
+    byte_size: int = 0
+    archived: bool = False  # All frames are in the columnar archive
+
+class SessionCatalog:
+    """
+    In-memory index of the sessions stored in a data directory.
+
+    Entries are keyed by sanitized session ID and updated on every storage
+    write, so existence checks and lookups are O(1) and listing never touches
+    the filesystem. IDs are also kept sorted for cursor-based pagination.
+    The catalog is saved to CATALOG_FILE and reconciled with the directory
+    once at startup; files whose size changed since the last save are recounted.
+    """
+
+    def __init__(self, data_dir: str, suffixes: Tuple[str, ...], count_frames: Callable[[str], int], archive_suffix: str | None = None):
+        self.data_dir = data_dir
+        self.suffixes = suffixes
+        self.count_frames = count_frames
+        self.archive_suffix = archive_suffix
+        self._entries: Dict[str, SessionInfo] = {}
+        self._sorted_ids: List[str] = []
+        self.total_bytes = 0
+
+    def __contains__(self, session_id: str) -> bool:
+        return session_id in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, session_id: str) -> SessionInfo | None:
+        return self._entries.get(session_id)
+
+    def record_write(self, session_id: str, frames: int, size: int):
+        """Account for `frames` records (`size` bytes) appended to a session."""
+        now = time.time()
+        info = self._entries.get(session_id)
+        if info is None:
+            info = SessionInfo(session_id, created_at=now, last_write_at=now)
+            self._add(info)
+        info.last_write_at = now
+        info.frame_count += frames
+        info.byte_size += size
+        info.archived = False
+        self.total_bytes += size
+
+    def mark_archived(self, session_id: str, byte_size: int):
+        """Record that a session was compacted into an archive of `byte_size` bytes."""
+        info = self._entries.get(session_id)
+        if info is not None:
+            self.total_bytes += byte_size - info.byte_size
+            info.byte_size = byte_size
+            info.archived = True
+
+    def remove(self, session_id: str) -> SessionInfo | None:
+        info = self._entries.pop(session_id, None)
+        if info is not None:
+            del self._sorted_ids[bisect.bisect_left(self._sorted_ids, session_id)]
+            self.total_bytes -= info.byte_size
+        return info
+
+    def page(self, after: str | None = None, limit: int = 100) -> Tuple[List[SessionInfo], str | None]:
+        """Up to `limit` sessions in ID order after the `after` cursor, plus the cursor of the next page."""
+        start = bisect.bisect_right(self._sorted_ids, after) if after else 0
+        ids = self._sorted_ids[start:start + limit]
+        next_after = ids[-1] if ids and start + limit < len(self._sorted_ids) else None
+        return [self._entries[session_id] for session_id in ids], next_after
+
+    def expired(self, ttl: float, quota_bytes: int, now: float | None = None) -> List[str]:
+        """
+        Sessions to delete: those not written for `ttl` seconds, then the least
+        recently written ones until the rest fit in `quota_bytes` (0 for no quota).
+        """
+        now = time.time() if now is None else now
+        by_age = sorted(self._entries.values(), key=lambda info: info.last_write_at)
+        doomed = []
+        remaining = self.total_bytes
+        for info in by_age:
+            stale = ttl > 0 and now - info.last_write_at >= ttl
+            over_quota = quota_bytes > 0 and remaining > quota_bytes
+            if not (stale or over_quota):
+                break
+            doomed.append(info.session_id)
+            remaining -= info.byte_size
+        return doomed
+
+    def archive_candidates(self, idle_seconds: float, now: float | None = None) -> List[str]:
+        """Sessions with frames outside the archive that have not been written for `idle_seconds`."""
+        now = time.time() if now is None else now
+        return [
+            info.session_id for info in self._entries.values()
+            if not info.archived and now - info.last_write_at >= idle_seconds
+        ]
+
+    def _add(self, info: SessionInfo):
+        self._entries[info.session_id] = info
+        bisect.insort(self._sorted_ids, info.session_id)
+
+    def _catalog_path(self) -> str:
+        return os.path.join(self.data_dir, CATALOG_FILE)
+
+    def load(self):
+        """Rebuild the catalog from the saved index and a single scan of the data directory."""
+        saved: Dict[str, Dict[str, Any]] = {}
+        try:
+            with open(self._catalog_path(), "r") as f:
+                saved = json.load(f)
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.error(f"Failed to read session catalog, rebuilding it from {self.data_dir}: {str(e)}")
+
+        files: Dict[str, List[os.DirEntry]] = {}
+        with os.scandir(self.data_dir) as entries:
+            for entry in entries:
+                for suffix in self.suffixes:
+                    if entry.name.endswith(suffix) and entry.is_file():
+                        files.setdefault(entry.name[:-len(suffix)], []).append(entry)
+                        break
+
+        self._entries.clear()
+        self._sorted_ids.clear()
+        self.total_bytes = 0
+        for session_id, session_files in files.items():
+            stats = [entry.stat() for entry in session_files]
+            byte_size = sum(stat.st_size for stat in stats)
+            last_write_at = max(stat.st_mtime for stat in stats)
+            previous = saved.get(session_id)
+            if previous and previous.get("byte_size") == byte_size:
+                info = SessionInfo(**previous)
+            else:
+                # Unknown or changed since the last save: count its frames once
+                frame_count = sum(self.count_frames(entry.path) for entry in session_files)
+                created_at = previous["created_at"] if previous else min(stat.st_mtime for stat in stats)
+                archived = self.archive_suffix is not None and all(
+                    entry.name.endswith(self.archive_suffix) for entry in session_files
+                )
+                info = SessionInfo(session_id, created_at, last_write_at, frame_count, byte_size, archived)
+            self._add(info)
+            self.total_bytes += info.byte_size
+        logger.info(f"Session catalog loaded: {len(self)} sessions, {self.total_bytes} bytes")
+
+    async def save(self):
+        """Write the catalog atomically so the next startup can skip recounting frames."""
+        payload = json.dumps({session_id: asdict(info) for session_id, info in self._entries.items()})
+        path = self._catalog_path()
+        async with aiofiles.open(path + ".tmp", "w") as f:
+            await f.write(payload)
+        os.replace(path + ".tmp", path)
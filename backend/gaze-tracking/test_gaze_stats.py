@@ -0,0 +1,109 @@
+"""The streaming accumulator, the columnar seed and the batch statistics must report the same numbers."""
+import numpy as np
+import pytest
+
+from gaze_stats import GazeAccumulator, compute_gaze_stats, session_to_columns
+
+FALLBACK_POINT = {"x": 0.5, "y": 0.5}  # What the API stores for a frame without eyes
+
+def make_records(steps, eye_counts=None, start=(0.3, 0.3)):
+    """Records whose gaze point moves by each (dx, dy) step; coordinates are float32-exact like stored columns."""
+    x, y = start
+    records = []
+    for i, (dx, dy) in enumerate(steps):
+        x, y = x + dx, y + dy
+        eye_count = 2 if eye_counts is None else eye_counts[i]
+        point = {"x": float(np.float32(x)), "y": float(np.float32(y))}
+        records.append({"eye_count": eye_count, "gaze_points": [point] if eye_count else [dict(FALLBACK_POINT)]})
+    return records
+
+def random_session(frames, seed=0):
+    """Alternating fixations (small steps) and saccades (large jumps), with some frames missing eyes."""
+    rng = np.random.default_rng(seed)
+    steps, eye_counts = [], []
+    for i in range(frames):
+        if i % 7 == 0:
+            steps.append(rng.choice([-1, 1], size=2) * rng.uniform(0.1, 0.2, size=2))
+        else:
+            steps.append(rng.uniform(-0.01, 0.01, size=2))
+        eye_counts.append(0 if i % 11 == 5 else int(rng.integers(1, 3)))
+    return make_records(steps, eye_counts)
+
+def assert_same_stats(actual, expected):
+    assert actual.keys() == expected.keys()
+    for key in ("total_frames", "valid_frames", "fixation_count"):
+        assert actual[key] == expected[key], key
+    for key in ("avg_eye_count", "avg_gaze_x", "avg_gaze_y", "x_std", "y_std", "gaze_stability"):
+        assert actual[key] == pytest.approx(expected[key], abs=1e-6), key
+    for key in ("x_range", "y_range"):
+        assert actual[key] == pytest.approx(expected[key], abs=1e-6), key
+
+def assert_all_agree(records):
+    batch = compute_gaze_stats(records)
+    streaming = GazeAccumulator.from_records(records)
+    seeded = GazeAccumulator.from_columns(session_to_columns(records))
+    assert_same_stats(streaming.snapshot(), batch)
+    assert_same_stats(seeded.snapshot(), batch)
+    np.testing.assert_array_equal(streaming.heatmap.counts, seeded.heatmap.counts)
+    return batch
+
+def test_empty_session():
+    stats = assert_all_agree([])
+    assert stats["total_frames"] == 0
+    assert stats["fixation_count"] == 0
+    assert stats["x_range"] == (0, 0)
+
+def test_random_session():
+    stats = assert_all_agree(random_session(500))
+    assert stats["fixation_count"] > 0
+    assert stats["valid_frames"] < stats["total_frames"]
+
+def test_fixation_open_at_last_frame():
+    # One closed fixation, a saccade, then a fixation still running when the session ends
+    steps = [(0.01, 0.0)] * 4 + [(0.3, 0.3)] + [(0.005, 0.0)] * 5
+    stats = assert_all_agree(make_records(steps))
+    assert stats["fixation_count"] == 2
+
+def test_frames_without_eyes():
+    steps = [(0.01, 0.01)] * 10
+    eye_counts = [0, 2, 0, 0, 1, 2, 0, 2, 2, 0]
+    records = make_records(steps, eye_counts)
+    records.append({"eye_count": 0, "gaze_points": []})  # A frame stored without any point
+    stats = assert_all_agree(records)
+    assert stats["total_frames"] == 11
+    assert stats["valid_frames"] == 5
+    # Only frames with eyes detected reach the heatmap
+    assert GazeAccumulator.from_records(records).heatmap.samples == 5
+
+def test_all_frames_without_eyes():
+    stats = assert_all_agree(make_records([(0.0, 0.0)] * 5, [0] * 5))
+    assert stats["valid_frames"] == 0
+    assert stats["avg_eye_count"] == 0
+
+@pytest.mark.parametrize("split", [1, 3, 250, 499])
+def test_resumed_accumulator(split):
+    # Seeded from the stored part of a session (e.g. after a restart), then updated live
+    records = random_session(500, seed=split)
+    resumed = GazeAccumulator.from_columns(session_to_columns(records[:split]))
+    for record in records[split:]:
+        resumed.update(record)
+    assert_same_stats(resumed.snapshot(), compute_gaze_stats(records))
+    np.testing.assert_array_equal(resumed.heatmap.counts, GazeAccumulator.from_records(records).heatmap.counts)
+
+def test_resumed_inside_open_fixation():
+    # The seed ends in the middle of a fixation that continues in the live frames
+    steps = [(0.3, 0.0)] + [(0.001, 0.001)] * 6 + [(0.3, 0.3)] + [(0.001, 0.0)] * 2
+    records = make_records(steps)
+    resumed = GazeAccumulator.from_columns(session_to_columns(records[:4]))
+    for record in records[4:]:
+        resumed.update(record)
+    stats = resumed.snapshot()
+    assert_same_stats(stats, compute_gaze_stats(records))
+    assert stats["fixation_count"] == 2
+
+def test_resumed_from_empty_seed():
+    records = random_session(50)
+    resumed = GazeAccumulator.from_columns(session_to_columns([]))
+    for record in records:
+        resumed.update(record)
+    assert_same_stats(resumed.snapshot(), compute_gaze_stats(records))